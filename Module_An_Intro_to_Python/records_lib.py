@@ -1,56 +1,420 @@
+import datetime
+import json
+import os
+import pandas as pd
+import sqlite3
+
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from hashlib import blake2b
 from pathlib import Path
+from time import perf_counter
+
+
+DATE_FORMAT = '%m/%d/%y'
+
+CATEGORICAL_FIELDS = ['Department', 'Favorite Color', 'Favorite Animal', 'Zodiac Sign']
 
 
 #############################################################################################
 def get_path_to_records( folder_path, pattern = '*.txt' ):
     """
     Return all roster filenames in directory
-    
+
     input:
-        folder_path - Path object to the directory that contains the roster 
+        folder_path - Path object to the directory that contains the roster
                       files
         pattern - str for filtering file names
-        
+
     output:
         my_paths - list of Paths to roster files in directory
     """
     my_paths = []
-    
-    # Statements here!
-    
+
+    # os.scandir gets the file type from the directory listing, so no
+    # extra system call is made for each file
+    #
+    with os.scandir( folder_path ) as entries:
+        for entry in entries:
+            if entry.is_file() and fnmatch( entry.name, pattern ):
+                my_paths.append( Path(entry.path) )
+
+    my_paths.sort()
+
     return my_paths
 
 
 #############################################################################################
 def parse_record( filename ):
     """
-    
+    Read the file located at filename, extract information and organize
+    it in a dictionary.
+
+    input:
+        filename -- Path object with location of data
+
+    output:
+        record -- dict with keys being types of information in file
+    """
+    with open( filename, 'r' ) as f_read:
+        record = parse_record_text( f_read.read() )
+
+    return record
+
+
+#############################################################################################
+def parse_record_text( text ):
+    """
+    Extract the 'Key:<tab>Value' lines of the contents of a record file,
+    skipping comments and blank lines
+
+    input:
+        text -- str with contents of file
+
+    output:
+        record -- dict with keys being types of information in file
     """
     record = {}
-    
-    # Statements here!
-    
+
+    for line in text.splitlines():
+        if line.startswith('#') or ':\t' not in line:
+            continue
+        key, value = line.split( ':\t', 1 )
+        record[key] = value.strip()
+
     return record
 
 
 #############################################################################################
 def extract_birthdate( date_string ):
     """
-    
+    Convert a date of birth string, e.g. '12/23/74', into a date
+
+    input:
+        date_string -- str with format month/day/two-digit year
+
+    output:
+        birthdate -- datetime.date object
     """
-    birthdate = datetime.date( 1970, 1, 1 )
-    # Statements here!
-    
+    birthdate = datetime.datetime.strptime( date_string, DATE_FORMAT ).date()
+
     return birthdate
 
 
 #############################################################################################
 def calculate_age( birthdate, relevant_date ):
     """
-    
+    Calculate age in whole years at relevant_date
+
+    input:
+        birthdate -- datetime.date object
+        relevant_date -- datetime.date object
+
+    output:
+        age -- int
+    """
+    age = relevant_date.year - birthdate.year
+
+    # Birthday has not happened yet in the year of relevant_date
+    #
+    if (relevant_date.month, relevant_date.day) < (birthdate.month, birthdate.day):
+        age -= 1
+
+    return age
+
+
+#############################################################################################
+def parse_records( my_paths, n_threads = None ):
+    """
+    Parse many record files with a pool of threads, which overlap the time
+    spent waiting for the files to be read
+
+    input:
+        my_paths -- list of Paths to record files
+        n_threads -- int number of threads (None lets the pool decide)
+
+    output:
+        records -- list of dicts (see parse_record), in the order of my_paths
+    """
+    with ThreadPoolExecutor( max_workers = n_threads ) as executor:
+        records = list( executor.map( parse_record, my_paths, chunksize = 64 ) )
+
+    return records
+
+
+#############################################################################################
+def extract_birthdates( date_strings ):
+    """
+    Vectorized extract_birthdate: convert a whole column of date of birth
+    strings at once.  Invalid or missing dates become NaT.
+
+    input:
+        date_strings -- pandas Series (or list) of str
+
+    output:
+        birthdates -- pandas Series of datetime64
+    """
+    return pd.to_datetime( pd.Series(date_strings), format = DATE_FORMAT, errors = 'coerce' )
+
+
+#############################################################################################
+def calculate_ages( birthdates, relevant_date ):
+    """
+    Vectorized calculate_age over a whole column of birthdates
+
+    input:
+        birthdates -- pandas Series of datetime64
+        relevant_date -- datetime.date object
+
+    output:
+        ages -- pandas Series of Int64 (missing where birthdate is NaT)
     """
-    age = 0
-    
-    # Statements here!
-    
-    return age
\ No newline at end of file
+    birthdates = pd.Series( birthdates )
+    ages = relevant_date.year - birthdates.dt.year
+
+    # Compare (month, day) as month * 100 + day
+    #
+    before_birthday = ( relevant_date.month * 100 + relevant_date.day <
+                        birthdates.dt.month * 100 + birthdates.dt.day )
+    ages = ages - before_birthday.astype(int)
+
+    return ages.astype('Int64')
+
+
+#############################################################################################
+def records_to_dataframe( records, relevant_date ):
+    """
+    Organize parsed records in a DataFrame with typed columns: heights in
+    inches and weights in pounds as integers, repeated text fields as
+    categories, and the birthdate and age of each person.
+
+    input:
+        records -- list of dicts (see parse_record)
+        relevant_date -- datetime.date object at which ages are calculated
+
+    output:
+        df -- pandas DataFrame
+    """
+    df = pd.DataFrame.from_records( records )
+
+    if 'Height' in df:
+        feet_inches = df['Height'].str.extract( r'(\d+)ft,\s*(\d+)in' ).astype(float)
+        df['Height'] = (12 * feet_inches[0] + feet_inches[1]).astype('Int64')
+    if 'Weight' in df:
+        df['Weight'] = pd.to_numeric( df['Weight'].str.extract(r'(\d+)')[0],
+                                      errors = 'coerce' ).astype('Int64')
+
+    for field in CATEGORICAL_FIELDS:
+        if field in df:
+            df[field] = df[field].astype('category')
+
+    if 'Date of Birth' in df:
+        df['Birthdate'] = extract_birthdates( df['Date of Birth'] )
+        df['Age'] = calculate_ages( df['Birthdate'], relevant_date )
+
+    return df
+
+
+#############################################################################################
+def ingest_records( folder_path, relevant_date, pattern = '*.txt', n_threads = None ):
+    """
+    Find, parse and organize all records in a folder, i.e., the whole
+    workflow get_path_to_records -> parse_record -> extract_birthdate ->
+    calculate_age, with files parsed in parallel and dates handled one
+    column at a time
+
+    input:
+        folder_path -- Path object to the directory that contains the roster
+                       files
+        relevant_date -- datetime.date object at which ages are calculated
+        pattern -- str for filtering file names
+        n_threads -- int number of threads used to parse files
+
+    output:
+        df -- pandas DataFrame (see records_to_dataframe), with a column
+              'File' with the name of each record file
+        metrics -- dict with number of files, time in seconds spent in each
+                   step and files_per_second
+    """
+    t_start = perf_counter()
+    my_paths = get_path_to_records( folder_path, pattern )
+
+    t_discovered = perf_counter()
+    records = parse_records( my_paths, n_threads )
+
+    t_parsed = perf_counter()
+    df = records_to_dataframe( records, relevant_date )
+    df.insert( 0, 'File', [path.name for path in my_paths] )
+
+    t_end = perf_counter()
+    metrics = { 'n_files': len(my_paths),
+                'discovery_time': t_discovered - t_start,
+                'parse_time': t_parsed - t_discovered,
+                'dataframe_time': t_end - t_parsed,
+                'total_time': t_end - t_start,
+                'files_per_second': len(my_paths) / max(t_end - t_start, 1e-9) }
+
+    return df, metrics
+
+
+#############################################################################################
+def scan_record_files( folder_path, pattern = '*.txt' ):
+    """
+    List the record files in a folder with their size and modification
+    time, taken from the same os.scandir pass that finds them
+
+    input:
+        folder_path -- Path object to the directory that contains the roster
+                       files
+        pattern -- str for filtering file names
+
+    output:
+        files -- dict with file name as key and tuple (size, mtime_ns) as value
+    """
+    files = {}
+
+    with os.scandir( folder_path ) as entries:
+        for entry in entries:
+            if entry.is_file() and fnmatch( entry.name, pattern ):
+                stat = entry.stat()
+                files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+    return files
+
+
+#############################################################################################
+def fingerprint_record( filename, known_hash = None ):
+    """
+    Read a record file once and hash its contents, then parse it unless
+    the hash is known_hash (the contents did not change)
+
+    input:
+        filename -- Path object with location of data
+        known_hash -- str with hex digest of the previous contents, or None
+
+    output:
+        content_hash -- str with hex digest of contents
+        record -- dict (see parse_record), or None if the hash is known_hash
+    """
+    with open( filename, 'rb' ) as f_read:
+        contents = f_read.read()
+
+    content_hash = blake2b( contents, digest_size = 16 ).hexdigest()
+    if content_hash == known_hash:
+        return content_hash, None
+
+    return content_hash, parse_record_text( contents.decode() )
+
+
+#############################################################################################
+def open_manifest( manifest_path ):
+    """
+    Open (creating it if needed) the SQLite manifest of ingested record
+    files, which keeps the fingerprint and parsed record of every file
+
+    input:
+        manifest_path -- Path object to SQLite file
+
+    output:
+        connection -- sqlite3.Connection
+    """
+    connection = sqlite3.connect( manifest_path )
+    connection.execute( '''CREATE TABLE IF NOT EXISTS manifest (
+                               name TEXT PRIMARY KEY,
+                               size INTEGER,
+                               mtime_ns INTEGER,
+                               hash TEXT,
+                               record TEXT )''' )
+
+    return connection
+
+
+#############################################################################################
+def ingest_records_incrementally( folder_path, relevant_date, pattern = '*.txt',
+                                  manifest_path = None, n_threads = None ):
+    """
+    Same as ingest_records, but only files that are new or changed since
+    the previous run are parsed.  The manifest stores, for every file,
+    its size, modification time, content hash and parsed record.  Files
+    whose size and modification time are unchanged are not even opened;
+    files that were touched but whose contents hash to the same value
+    are not parsed again; files matching pattern that disappeared are
+    dropped, so calls with different patterns can share a manifest.
+
+    input:
+        folder_path -- Path object to the directory that contains the roster
+                       files
+        relevant_date -- datetime.date object at which ages are calculated
+        pattern -- str for filtering file names
+        manifest_path -- Path object to SQLite manifest, defaults to
+                         <folder name>_manifest.sqlite next to the folder
+        n_threads -- int number of threads used to read files
+
+    output:
+        df -- pandas DataFrame (see ingest_records)
+        metrics -- dict with number of files, of new, changed, touched
+                   (same contents), unchanged and deleted files, and times
+                   in seconds
+    """
+    folder_path = Path(folder_path)
+    if manifest_path is None:
+        manifest_path = folder_path.parent / f"{folder_path.name}_manifest.sqlite"
+
+    t_start = perf_counter()
+    files = scan_record_files( folder_path, pattern )
+
+    connection = open_manifest( manifest_path )
+    manifest = { name: (size, mtime_ns, content_hash, record)
+                 for name, size, mtime_ns, content_hash, record
+                 in connection.execute( 'SELECT * FROM manifest' ) }
+
+    # Files of other patterns, kept by other calls, are left in the manifest
+    #
+    deleted = [name for name in manifest if name not in files and fnmatch(name, pattern)]
+    stale = [name for name, fingerprint in files.items()
+             if manifest.get(name, (None, None))[:2] != fingerprint]
+
+    t_scanned = perf_counter()
+    with ThreadPoolExecutor( max_workers = n_threads ) as executor:
+        results = list( executor.map( fingerprint_record,
+                                      [folder_path / name for name in stale],
+                                      [manifest.get(name, (None,) * 4)[2] for name in stale],
+                                      chunksize = 64 ) )
+
+    t_parsed = perf_counter()
+    n_new, n_changed = 0, 0
+    rows = []
+    for name, (content_hash, record) in zip(stale, results):
+        if name not in manifest:
+            n_new += 1
+        elif manifest[name][2] != content_hash:
+            n_changed += 1
+        record_json = manifest[name][3] if record is None else json.dumps(record)
+        rows.append( (name, *files[name], content_hash, record_json) )
+        manifest[name] = rows[-1][1:]
+
+    with connection:
+        connection.executemany( 'DELETE FROM manifest WHERE name = ?',
+                                [(name,) for name in deleted] )
+        connection.executemany( 'INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?)',
+                                rows )
+    connection.close()
+
+    names = sorted(files)
+    records = [json.loads(manifest[name][3]) for name in names]
+    df = records_to_dataframe( records, relevant_date )
+    df.insert( 0, 'File', names )
+
+    t_end = perf_counter()
+    metrics = { 'n_files': len(names),
+                'n_new': n_new,
+                'n_changed': n_changed,
+                'n_touched': len(stale) - n_new - n_changed,
+                'n_unchanged': len(names) - len(stale),
+                'n_deleted': len(deleted),
+                'scan_time': t_scanned - t_start,
+                'parse_time': t_parsed - t_scanned,
+                'dataframe_time': t_end - t_parsed,
+                'total_time': t_end - t_start }
+
+    return df, metrics
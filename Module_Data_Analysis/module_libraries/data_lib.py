@@ -2,14 +2,45 @@ import matplotlib.pyplot as plt
 import pandas as pd
 
 from collections import Counter
-from numpy import arange, exp, geomspace, linspace, mean, sqrt, std
+from numpy import ( arange, asarray, concatenate, diff, empty, exp, geomspace, histogram,
+                    linspace, mean, percentile, repeat, sqrt, std )
+from numpy.random import default_rng
 from pathlib import Path
 from random import sample
 from scipy import integrate
-from scipy.stats import norm, uniform
+from scipy.stats import norm
+
+from .poll_lib import get_surface_cell, histogram_moments
+from .power_law_lib import power_law_density, sample_power_law, tail_summary
+from .profiling_lib import profiled
+
+
+###################################################################################
+def get_figure( figsize, fig = None ):
+    """
+    Returns a figure of size figsize for the plotting functions below.  
+    When fig is given it is cleared and resized so that the same figure can 
+    be reused for many plots (see render_lib), otherwise a new pyplot 
+    figure is created.
+    
+    inputs:
+        figsize -- tuple with dimensions of figure canvas
+        fig -- matplotlib figure object or None
+        
+    returns:
+        fig -- matplotlib figure object
+    """
+    if fig is None:
+        return plt.figure( figsize = figsize )
+    
+    fig.clf()
+    fig.set_size_inches( figsize )
+    
+    return fig
 
 
 ###################################################################################
+@profiled
 def create_voters(n_voters, real_intentions):
     """
     Given a population size and voter intentions, this functions
@@ -38,6 +69,7 @@ def create_voters(n_voters, real_intentions):
 
 
 ###################################################################################
+@profiled( bytes_from = 'voters' )
 def simulate_poll(voters, poll_size):
     """
     Extracts a sample of size poll_size from the list voters. 
@@ -56,44 +88,70 @@ def simulate_poll(voters, poll_size):
     
 
 ###################################################################################
-def plot_results( results, x_label, poll_size, half_frame, my_fontsize ):
+def plot_results( results, x_label, poll_size, half_frame, my_fontsize, fig = None,
+                  surface = None, share = None, n_voters = None ):
     """
     Plot results from simulating a poll from a set of voters with the 
-    preferences revealed in the election.
+    preferences revealed in the election.  Instead of a list of results, 
+    the cell (poll_size, share, n_voters) of a surface computed by 
+    poll_lib.poll_surface can be plotted: only that cell is read from the 
+    file.
 
     Inputs:
-        results -- list of floats with results in each poll
+        results -- list of floats with results in each poll, or None when
+                   surface is given
         x_label -- str for graph
         poll_size -- int
         half_frame -- function for plotting
         my_fontize -- int for scaling fonts in plotting
+        fig -- matplotlib figure object to draw on, if None a new figure 
+               is created and shown
+        surface -- dict returned by poll_lib.open_poll_surface, or None
+        share -- float true share of the candidate, to select the cell
+        n_voters -- int population size, to select the cell
 
     Returns:
         None
     """
-    fig = plt.figure( figsize = (6, 4) )
+    show = fig is None
+    fig = get_figure( (6, 4), fig )
     ax = fig.add_subplot( 111 )
     half_frame(ax, x_label, 'Frequency', font_size = my_fontsize)
     
-    ax.hist( results, bins = arange(0, 40, 1), color = 'gray',
-             align = 'mid', rwidth = 0.9 )
+    if surface is None:
+        weights, bins = None, arange(0, 40, 1)
+        results_mean, results_std = mean(results), std(results)
+        x_min, x_max, y_max = 15, 35, 30
+    else:
+        weights, bins = get_surface_cell( surface, poll_size, share, n_voters ), arange(0, 101, 1)
+        results = surface['bin_values']
+        results_mean, results_std = histogram_moments( weights, results )
+        x_min = 5 * int( max(0, results_mean - 4 * results_std) // 5 )
+        x_max = min( 100, 5 * int( (results_mean + 4 * results_std) // 5 + 1 ) )
+
+    counts = ax.hist( results, bins = bins, weights = weights, color = 'gray',
+                      align = 'mid', rwidth = 0.9 )[0]
+    if surface is not None:
+        y_max = 1.1 * counts.max()
     
-    ax.set_ylim(0, 30)
-    ax.set_xlim(15, 35)
-    ax.set_xticks(list(arange(15, 35, 5)))
+    ax.set_ylim(0, y_max)
+    ax.set_xlim(x_min, x_max)
+    ax.set_xticks(list(arange(x_min, x_max, 5)))
     
-    ax.vlines(mean(results), 0, 30, color = 'k', lw = 2)
+    ax.vlines(results_mean, 0, y_max, color = 'k', lw = 2)
     
-    ax.text(16, 22, (f"Poll size: {poll_size}\n"
-                     f"Mean: {mean(results):>.1f}\n"
-                     f"Std. dev.: {std(results):>.1f}"), 
+    ax.text(x_min + 1, 22 / 30 * y_max, (f"Poll size: {poll_size}\n"
+                                         f"Mean: {results_mean:>.1f}\n"
+                                         f"Std. dev.: {results_std:>.1f}"), 
             fontsize = my_fontsize)
     
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
+    if show:
+        plt.show()
 
 
 ###################################################################################
+@profiled
 def calculate_prob_data(prior, data, p_heads):
     """
     Calculates the probability of observing the data given the prior. 
@@ -149,12 +207,195 @@ def noisy_regression_data(n, beta_0, beta_1, sigma_x, sigma_y):
 
     # Place data into dataframe
     #
-    return x, y, pd.DataFrame(list(zip(x, y)), columns=['X', 'Y'])
+    return x, y, pd.DataFrame({'X': x, 'Y': y})
+
+
+###################################################################################
+@profiled( bytes_from = 'result' )
+def noisy_regression_batch( n_replicates, n, beta_0, beta_1, sigma_x, sigma_y,
+                            seed = None, as_dataframe = False ):
+    """
+    Generates n_replicates noisy datasets like noisy_regression_data, all in
+    one call.
+
+    Inputs:
+        n_replicates -- int number of datasets
+        n -- int number of points (each dataset has n+1 points)
+        beta_0 -- float coefficient order zero
+        beta_1 -- float coefficient order one
+        sigma_x -- float magnitude of noise for variable x
+        sigma_y -- float magnitude of noise for variable y
+        seed -- int for random number generator, or None
+        as_dataframe -- bool, also return the data in a dataframe
+
+    Returns:
+        array with shape (n_replicates, n+1) of x values
+        array with shape (n_replicates, n+1) of y values
+        dataframe with columns Replicate, X, Y (only if as_dataframe)
+    """
+    # Generate noise terms for y and x variables
+    noise = norm.rvs(0, 1, size = (2, n_replicates, n+1), random_state = seed)
+
+    # Create noisy measurements
+    #
+    x = linspace(0, 1., n+1)
+    y = beta_0 + beta_1 * x + sigma_y * noise[1]
+    x = x + sigma_x * noise[0]
+
+    if not as_dataframe:
+        return x, y
+
+    return x, y, pd.DataFrame({'Replicate': repeat(arange(n_replicates), n+1),
+                               'X': x.ravel(), 'Y': y.ravel()})
 
 
 ###################################################################################
-def hist_plot( y_max, step, my_fontsize ):
-    fig = plt.figure( figsize = (12, 4) )
+@profiled( bytes_from = 'x' )
+def fit_regression_batch( x, y, variance_ratio = 1. ):
+    """
+    Fits a straight line to every row of x and y at once. Ordinary least
+    squares assumes x has no noise, and its slope is biased towards zero
+    when it does (errors-in-variables). Deming regression allows noise in
+    both variables, with variance_ratio = sigma_y**2 / sigma_x**2; it is
+    orthogonal regression when variance_ratio is 1.
+
+    Inputs:
+        x -- array with shape (n_replicates, n_points)
+        y -- array with shape (n_replicates, n_points)
+        variance_ratio -- float ratio of variances of noise in y and in x
+
+    Returns:
+        dict of arrays with one value per replicate, with keys
+        slope, intercept, slope_se, intercept_se (least squares) and
+        deming_slope, deming_intercept
+    """
+    n_points = x.shape[-1]
+    x_mean = x.mean(axis = -1)
+    y_mean = y.mean(axis = -1)
+    dx = x - x_mean[..., None]
+    dy = y - y_mean[..., None]
+
+    sxx = (dx * dx).sum(axis = -1)
+    syy = (dy * dy).sum(axis = -1)
+    sxy = (dx * dy).sum(axis = -1)
+
+    # Least squares and standard errors from the residual variance
+    #
+    slope = sxy / sxx
+    intercept = y_mean - slope * x_mean
+    residual_variance = (syy - slope * sxy) / (n_points - 2)
+    slope_se = sqrt(residual_variance / sxx)
+    intercept_se = sqrt(residual_variance * (1. / n_points + x_mean**2 / sxx))
+
+    # Deming regression
+    #
+    d = syy - variance_ratio * sxx
+    deming_slope = (d + sqrt(d**2 + 4 * variance_ratio * sxy**2)) / (2 * sxy)
+    deming_intercept = y_mean - deming_slope * x_mean
+
+    return {'slope': slope, 'intercept': intercept,
+            'slope_se': slope_se, 'intercept_se': intercept_se,
+            'deming_slope': deming_slope, 'deming_intercept': deming_intercept}
+
+
+###################################################################################
+@profiled
+def sampling_distribution_summaries( distribution, sizes, n_replicates, bins = range(101),
+                                     statistic = mean, max_values = 10**7, seed = None ):
+    """
+    Calculates the sampling distribution of a statistic (the mean by default)
+    for several sample sizes: for every size, n_replicates samples are drawn
+    from distribution, in chunks of at most max_values numbers, and the
+    statistic of every sample is kept.
+
+    Inputs:
+        distribution -- scipy.stats frozen distribution, e.g. randint(0, 101)
+        sizes -- list of int sample sizes
+        n_replicates -- int number of samples of each size
+        bins -- bin edges for the histograms of the statistic
+        statistic -- function applied along axis 1 of a (replicates, size) array
+        max_values -- int maximum number of random values drawn at once
+        seed -- int for random number generator, or None
+
+    Returns:
+        dict with keys
+            sizes -- array of sample sizes
+            bin_edges -- array
+            histograms -- array (n_sizes, n_bins) of counts
+            five_number -- array (n_sizes, 5) with minimum, first quartile,
+                           median, third quartile and maximum
+            whiskers -- array (n_sizes, 2) with the most extreme values
+                        within 1.5 IQR of the quartiles
+            mean -- array of mean of statistic
+            standard_error -- array of standard deviation of statistic
+    """
+    rng = default_rng(seed)
+    sizes = asarray(sizes)
+    bin_edges = asarray(bins, dtype = float)
+
+    histograms = empty((len(sizes), len(bin_edges) - 1))
+    five_number = empty((len(sizes), 5))
+    whiskers = empty((len(sizes), 2))
+    means = empty(len(sizes))
+    standard_errors = empty(len(sizes))
+
+    for i, size in enumerate(sizes):
+        chunk = max(1, max_values // size)
+        values = concatenate([ statistic(distribution.rvs(size = (min(chunk, n_replicates - j), size),
+                                                          random_state = rng), axis = 1)
+                               for j in range(0, n_replicates, chunk) ])
+
+        histograms[i] = histogram(values, bin_edges)[0]
+        five_number[i] = percentile(values, [0, 25, 50, 75, 100])
+        means[i] = values.mean()
+        standard_errors[i] = values.std(ddof = 1)
+
+        q1, q3 = five_number[i, 1], five_number[i, 3]
+        inside = values[(values >= q1 - 1.5 * (q3 - q1)) & (values <= q3 + 1.5 * (q3 - q1))]
+        whiskers[i] = inside.min(), inside.max()
+
+    return {'sizes': sizes, 'bin_edges': bin_edges, 'histograms': histograms,
+            'five_number': five_number, 'whiskers': whiskers,
+            'mean': means, 'standard_error': standard_errors}
+
+
+###################################################################################
+def box_stats( summaries ):
+    """
+    Converts the output of sampling_distribution_summaries to the list of
+    dicts expected by matplotlib's Axes.bxp.
+    """
+    return [ {'med': med, 'q1': q1, 'q3': q3, 'whislo': low, 'whishi': high,
+              'mean': mean_value, 'label': f"n = {size}"}
+             for size, (minimum, q1, med, q3, maximum), (low, high), mean_value
+             in zip(summaries['sizes'], summaries['five_number'],
+                    summaries['whiskers'], summaries['mean']) ]
+
+
+###################################################################################
+def plot_standard_error( summaries, sigma, half_frame, my_fontsize, fig = None ):
+    """
+    Plots the standard error of the statistic against sample size, next to
+    sigma / sqrt(n), the standard error of the mean.
+    """
+    show = fig is None
+    fig = get_figure( (6, 4), fig )
+    ax = fig.add_subplot(111)
+
+    sizes = summaries['sizes']
+    ax.loglog(sizes, summaries['standard_error'], 'o', label = 'Sampling distribution')
+    ax.loglog(sizes, sigma / sqrt(sizes), 'k--', label = r'$\sigma / \sqrt{n}$')
+    ax.legend(frameon = False, fontsize = my_fontsize)
+
+    half_frame(ax, 'Sample size', 'Standard error', font_size = my_fontsize)
+    fig.tight_layout()
+    if show:
+        plt.show()
+
+
+###################################################################################
+def hist_plot( y_max, step, my_fontsize, fig = None, summaries = None ):
+    fig = get_figure( (12, 4), fig )
     ax = fig.add_subplot(111)
 
     ax.set_xlim(0, 100)
@@ -168,16 +409,27 @@ def hist_plot( y_max, step, my_fontsize ):
 
     ax.set_yticks(range(0, y_max, step))
     ax.set_yticklabels(range(0, y_max, step), fontsize = my_fontsize)
+
+    # Histograms of the sampling distribution for every sample size
+    #
+    if summaries is not None:
+        for size, counts in zip(summaries['sizes'], summaries['histograms']):
+            ax.stairs(counts, summaries['bin_edges'], lw = 2, label = f"n = {size}")
+        ax.legend(frameon = False, fontsize = my_fontsize)
     
     return ax
 
 ###################################################################################
-def box_plot( sizes, my_fontsize ):
+def box_plot( sizes, my_fontsize, fig = None, summaries = None ):
+    if summaries is not None and asarray(sizes).tolist() != summaries['sizes'].tolist():
+        raise ValueError( f"sizes {asarray(sizes).tolist()} do not match the sizes of "
+                          f"the summaries {summaries['sizes'].tolist()}" )
+
     n = len(sizes)
     xticks = arange(0, 101, 10)
     labels = [f"n = {n}" for n in sizes]
     
-    fig = plt.figure( figsize = (12, 2*n+1) )
+    fig = get_figure( (12, 2*n+1), fig )
     ax = fig.add_subplot(111)
     
     for axis in ['top','right', 'left']:
@@ -194,16 +446,23 @@ def box_plot( sizes, my_fontsize ):
     ax.set_ylim(0.5, 0.5+n)
     ax.set_yticks(arange(1, 1+n))
     ax.set_yticklabels(labels, fontsize = my_fontsize)
+
+    # Boxes drawn from precomputed quartiles and whiskers
+    #
+    if summaries is not None:
+        ax.bxp(box_stats(summaries), positions = arange(1, 1+n), orientation = 'horizontal',
+               patch_artist = True, showfliers = False, manage_ticks = False)
         
     return ax
 
 
 ###################################################################################
-def plot_gaussian( mu, sigma,  half_frame, my_fontsize ):
+def plot_gaussian( mu, sigma,  half_frame, my_fontsize, fig = None ):
     x = linspace(norm.ppf(0.0001, mu, sigma), norm.ppf(0.9999, mu, sigma))
     f_x = norm(mu, sigma)
     
-    fig = plt.figure( figsize = (7, 4) )
+    show = fig is None
+    fig = get_figure( (7, 4), fig )
     ax = fig.add_subplot(1,1,1)
     half_frame(ax, "Height", "Probability density", font_size = my_fontsize)
     
@@ -212,43 +471,53 @@ def plot_gaussian( mu, sigma,  half_frame, my_fontsize ):
     
     ax.set_ylim(0, 1)
 
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
+    if show:
+        plt.show()
 
 
 ###################################################################################
-def plot_power_law( half_frame, my_fontsize ):
-    data = 1. / uniform.rvs(0, 1, size = 100000)
+def plot_power_law( half_frame, my_fontsize, fig = None, data = None, fit = None ):
+    """
+    Plots the log-binned probability density of data (by default 100,000
+    samples of 1/U, a power law with exponent 2) and its mean, with either
+    the fit returned by power_law_lib.fit_power_law or x**-2.  The figure
+    is drawn on fig, or on a new figure, but not shown.
+    """
+    if data is None:
+        data = sample_power_law( 2., 1., 100000 )
     x = geomspace(1, 1E6, num = 20)
+    summary = tail_summary( data, x )
 
-    fig = plt.figure( figsize = (6, 4.5) )
+    fig = get_figure( (6, 4.5), fig )
     ax = fig.add_subplot(1,1,1)
     
     half_frame(ax, "x", "Probability density", font_size = my_fontsize)
     
-    ax.hist( data, bins = x , color = 'gray', 
-             align = 'mid', rwidth = 0.8, density = True )
+    ax.bar( x[:-1] + 0.1 * diff(x), summary['density'], width = 0.8 * diff(x),
+            align = 'edge', color = 'gray' )
 
-    ax.loglog( x, x**(-2) )
+    if fit is None:
+        ax.loglog( x, x**(-2) )
+    else:
+        ax.loglog( x, power_law_density(x, fit) )
 
-    ax.vlines(mean(data), 0, 1, color = 'k', lw = 4, zorder = -10)
+    ax.vlines(summary['mean'], 0, 1, color = 'k', lw = 4, zorder = -10)
 
     ax.set_ylim(1E-10, 1)
     ax.set_xlim(1, 1E6)
     
-    plt.tight_layout()
+    fig.tight_layout()
 
 
 ###################################################################################
-def variability_power_law( half_frame, my_fontsize ):
-    means = []
-    st_devs = []
-    for i in range(100):
-        data = 1. / uniform.rvs(0, 1, size = 100)
-        means.append(mean(data))
-        st_devs.append(std(data))
+def variability_power_law( half_frame, my_fontsize, fig = None ):
+    data = sample_power_law( 2., 1., (100, 100) )
+    means = data.mean(axis = 1)
+    st_devs = data.std(axis = 1)
     
-    fig = plt.figure( figsize = (10, 3.5) )
+    show = fig is None
+    fig = get_figure( (10, 3.5), fig )
     ax1 = fig.add_subplot(1,2,1)
     ax2 = fig.add_subplot(1,2,2)
     
@@ -264,12 +533,13 @@ def variability_power_law( half_frame, my_fontsize ):
     ax2.set_xlim(0, 100)
     ax2.set_ylim(1, 4000)
     
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
+    if show:
+        plt.show()
     
     
 ###################################################################################
-def variability_gaussian( half_frame, my_fontsize ):
+def variability_gaussian( half_frame, my_fontsize, fig = None ):
     means = []
     st_devs = []
     for i in range(100):
@@ -277,7 +547,8 @@ def variability_gaussian( half_frame, my_fontsize ):
         means.append(mean(data))
         st_devs.append(std(data))
     
-    fig = plt.figure( figsize = (10, 3.5) )
+    show = fig is None
+    fig = get_figure( (10, 3.5), fig )
     ax1 = fig.add_subplot(1,2,1)
     ax2 = fig.add_subplot(1,2,2)
     
@@ -293,16 +564,18 @@ def variability_gaussian( half_frame, my_fontsize ):
     ax2.set_ylim(0, 100)
     ax2.set_xlim(0, 100)
     
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
+    if show:
+        plt.show()
 
 
 ###################################################################################
-def plot_function( half_frame, my_fontsize ):
+def plot_function( half_frame, my_fontsize, fig = None ):
     s = arange(0.1, 10., 0.1)
     c = arange(0.1, 100., 0.1)
     
-    fig = plt.figure( figsize = (10, 4) )
+    show = fig is None
+    fig = get_figure( (10, 4), fig )
     ax = []
     
     ax.append( fig.add_subplot(121))
@@ -319,5 +592,6 @@ def plot_function( half_frame, my_fontsize ):
     ax[-1].set_xlim(0, 100)
     ax[-1].set_ylim(0.00001, 1)
     
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
+    if show:
+        plt.show()
@@ -0,0 +1,232 @@
+import json
+
+from functools import partial
+from multiprocessing import Pool
+from numpy import ( arange, argmax, asarray, bincount, cumsum, flatnonzero, full, isclose,
+                    min_scalar_type, nan, sqrt, zeros )
+from numpy.lib.format import open_memmap
+from numpy.random import default_rng, SeedSequence
+from pathlib import Path
+
+from .profiling_lib import profiled
+
+
+###################################################################################
+def get_surface_paths( file_path ):
+    """
+    Returns the paths of the array file (.npy) and of the file describing
+    its axes (.json) of a poll surface.
+    """
+    file_path = Path( file_path )
+
+    return file_path.with_suffix('.npy'), file_path.with_suffix('.json')
+
+
+###################################################################################
+def poll_cell_counts( cell, n_replicates, bins_per_point = 10, chunk_size = 10**6 ):
+    """
+    Simulates n_replicates polls of poll_size voters drawn without
+    replacement (as simulate_poll does) from n_voters voters, of which
+    int(n_voters * share) support the candidate, and counts the results in
+    bins of 1 / bins_per_point percentage points.  Polls are drawn in chunks
+    of chunk_size, so memory does not grow with n_replicates.
+
+    inputs:
+        cell -- tuple (index, poll_size, share, n_voters, seed)
+        n_replicates -- int number of polls
+        bins_per_point -- int number of bins per percentage point
+        chunk_size -- int number of polls drawn at once
+
+    returns:
+        index -- as given in cell
+        counts -- array with 100 * bins_per_point + 1 counts of results
+    """
+    index, poll_size, share, n_voters, seed = cell
+    rng = default_rng(seed)
+    n_bins = 100 * bins_per_point + 1
+    supporters = int(n_voters * share)
+
+    counts = zeros( n_bins, dtype = int )
+    for start in range(0, n_replicates, chunk_size):
+        n_polls = min(chunk_size, n_replicates - start)
+        votes = rng.hypergeometric( supporters, n_voters - supporters, poll_size, n_polls )
+        counts += bincount( (100 * bins_per_point * votes) // poll_size, minlength = n_bins )
+
+    return index, counts
+
+
+###################################################################################
+@profiled
+def poll_surface( file_path, poll_sizes, shares, population_sizes, n_replicates = 10**4,
+                  bins_per_point = 10, n_processes = None, seed = 0, chunk_size = 10**6 ):
+    """
+    Sweeps a grid of poll size x true share x population size, simulating
+    n_replicates polls in every cell (see poll_cell_counts), and writes the
+    histogram of results of every cell to an array file, as they are
+    computed, so the surface never has to fit in memory.  The histograms
+    hold the whole sampling distribution at a resolution of 1 / bins_per_point
+    percentage points, from which quantiles and margins of error are read
+    (see surface_quantiles).  Cells are spread over a process pool and seeded
+    independently, so results do not depend on the number of processes.
+    Cells with poll_size larger than the population are left empty.
+
+    inputs:
+        file_path -- str or Path of the surface, written as .npy (counts)
+                     and .json (axes)
+        poll_sizes -- list of int
+        shares -- list of floats between 0 and 1
+        population_sizes -- list of int
+        n_replicates -- int number of polls in each cell
+        bins_per_point -- int number of bins per percentage point
+        n_processes -- int number of worker processes, 1 runs in the current
+                       process, None uses all cores
+        seed -- int
+        chunk_size -- int number of polls drawn at once
+
+    returns:
+        surface -- dict returned by open_poll_surface
+    """
+    array_path, axes_path = get_surface_paths( file_path )
+    axes = { 'poll_sizes': [int(n) for n in poll_sizes],
+             'shares': [float(s) for s in shares],
+             'population_sizes': [int(n) for n in population_sizes],
+             'n_replicates': int(n_replicates),
+             'bins_per_point': int(bins_per_point) }
+    shape = ( len(poll_sizes), len(shares), len(population_sizes) )
+
+    counts = open_memmap( array_path, mode = 'w+', dtype = min_scalar_type(n_replicates),
+                          shape = shape + (100 * bins_per_point + 1,) )
+
+    seeds = SeedSequence(seed).spawn( shape[0] * shape[1] * shape[2] )
+    cells = [ ((i, j, k), poll_size, share, n_voters, seeds[(i * shape[1] + j) * shape[2] + k])
+              for i, poll_size in enumerate(axes['poll_sizes'])
+              for j, share in enumerate(axes['shares'])
+              for k, n_voters in enumerate(axes['population_sizes'])
+              if poll_size <= n_voters ]
+    worker = partial( poll_cell_counts, n_replicates = n_replicates,
+                      bins_per_point = bins_per_point, chunk_size = chunk_size )
+
+    if n_processes == 1:
+        for index, cell_counts in map( worker, cells ):
+            counts[index] = cell_counts
+    else:
+        with Pool( n_processes ) as pool:
+            for index, cell_counts in pool.imap_unordered( worker, cells, chunksize = 4 ):
+                counts[index] = cell_counts
+
+    counts.flush()
+    del counts
+
+    # The axes are written last, so an interrupted sweep cannot be opened
+    #
+    with open( axes_path, 'w' ) as f_write:
+        json.dump( axes, f_write, indent = 1 )
+
+    return open_poll_surface( file_path )
+
+
+###################################################################################
+def open_poll_surface( file_path ):
+    """
+    Opens a surface written by poll_surface without reading it: the counts
+    are a read-only memmap, so slicing a cell only reads that cell.
+
+    inputs:
+        file_path -- str or Path of the surface
+
+    returns:
+        surface -- dict with keys
+            counts -- array (n_poll_sizes, n_shares, n_population_sizes, n_bins)
+            bin_values -- array with result (in percent) at the start of each bin
+            poll_sizes, shares, population_sizes -- arrays with the grid axes
+            n_replicates, bins_per_point -- int
+    """
+    array_path, axes_path = get_surface_paths( file_path )
+    with open( axes_path ) as f_read:
+        axes = json.load( f_read )
+
+    surface = { key: asarray(value) if isinstance(value, list) else value
+                for key, value in axes.items() }
+    surface['counts'] = open_memmap( array_path, mode = 'r' )
+    surface['bin_values'] = arange( surface['counts'].shape[-1] ) / surface['bins_per_point']
+
+    return surface
+
+
+###################################################################################
+def get_surface_cell( surface, poll_size, share, n_voters ):
+    """
+    Returns the counts of results of one cell of a surface.  Raises
+    ValueError if the cell is not on the grid.
+    """
+    index = []
+    for axis, value in ( ('poll_sizes', poll_size), ('shares', share),
+                         ('population_sizes', n_voters) ):
+        matches = flatnonzero( isclose(surface[axis], value) )
+        if not len(matches):
+            raise ValueError( f"{value} is not in the {axis} of the surface" )
+        index.append( matches[0] )
+
+    return asarray( surface['counts'][tuple(index)] )
+
+
+###################################################################################
+def histogram_moments( counts, bin_values ):
+    """
+    Returns the mean and standard deviation of results from their counts
+    along the last axis (nan for empty cells).
+    """
+    counts = asarray(counts, dtype = float)
+    n = counts.sum( axis = -1 )
+    with_data = n > 0
+
+    mean = full( n.shape, nan )
+    std = full( n.shape, nan )
+    mean[with_data] = (counts[with_data] @ bin_values) / n[with_data]
+    variance = (counts[with_data] @ bin_values**2) / n[with_data] - mean[with_data]**2
+    std[with_data] = sqrt( variance.clip(0) )
+
+    return mean, std
+
+
+###################################################################################
+def surface_quantiles( surface, quantiles = (0.025, 0.5, 0.975), chunk_size = 1024 ):
+    """
+    Reads quantiles of the results of every cell from the histograms of a
+    surface, chunk_size cells at a time.  Quantiles are rounded down to the
+    resolution of the surface, and are nan for empty cells.
+
+    inputs:
+        surface -- dict returned by open_poll_surface
+        quantiles -- list of floats between 0 and 1
+        chunk_size -- int number of cells read at once
+
+    returns:
+        array (n_poll_sizes, n_shares, n_population_sizes, n_quantiles) of
+        results in percent
+    """
+    quantiles = asarray(quantiles, dtype = float)
+    counts = surface['counts'].reshape( -1, surface['counts'].shape[-1] )
+
+    values = full( (len(counts), len(quantiles)), nan )
+    for start in range(0, len(counts), chunk_size):
+        cumulative = cumsum( counts[start: start + chunk_size], axis = 1, dtype = float )
+        n = cumulative[:, -1:]
+        reached = cumulative[:, None, :] >= quantiles[None, :, None] * n[:, :, None]
+        first = argmax( reached, axis = 2 )
+        values[start: start + chunk_size] = surface['bin_values'][first]
+        values[start: start + chunk_size][n[:, 0] == 0] = nan
+
+    return values.reshape( surface['counts'].shape[:-1] + (len(quantiles),) )
+
+
+###################################################################################
+def margin_of_error( surface, confidence = 0.95 ):
+    """
+    Returns the margin of error of every cell, in percentage points: half
+    the width of the central interval holding a fraction confidence of the
+    poll results.
+    """
+    low_high = surface_quantiles( surface, [(1 - confidence) / 2, (1 + confidence) / 2] )
+
+    return (low_high[..., 1] - low_high[..., 0]) / 2
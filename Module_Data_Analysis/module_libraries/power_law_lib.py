@@ -0,0 +1,277 @@
+from functools import partial
+from multiprocessing import Pool
+from numpy import ( abs, append, arange, argmin, asarray, bincount, concatenate, cumsum,
+                    diff, geomspace, log, log10, maximum, searchsorted, sort, sqrt, unique,
+                    zeros )
+from numpy.random import default_rng, SeedSequence
+
+from .profiling_lib import profiled
+
+
+# Data below xmin, resampled by every bootstrap replicate in a worker process
+#
+_bootstrap_data = None
+
+
+###################################################################################
+def get_chunks( data, chunk_size = 10**6 ):
+    """
+    Returns an iterator over consecutive slices of an array (e.g. a memmap),
+    or the iterable itself if data is already a sequence of chunks (e.g. a
+    generator reading a log file piece by piece).
+    """
+    if hasattr(data, 'shape'):
+        return ( data[i: i + chunk_size] for i in range(0, len(data), chunk_size) )
+
+    return data
+
+
+###################################################################################
+def log_bin_edges( x_min, x_max, bins_per_decade = 5 ):
+    """
+    Returns logarithmically spaced bin edges covering [x_min, x_max].
+    """
+    n_bins = max( 1, int(round( bins_per_decade * log10(x_max / x_min) )) )
+
+    return geomspace( x_min, x_max, n_bins + 1 )
+
+
+###################################################################################
+@profiled
+def tail_summary( data, bin_edges, chunk_size = 10**6 ):
+    """
+    Calculates, in one streaming pass over the data, the probability density
+    in logarithmic (or any) bins and the survival function at the bin edges.
+    Only the counts per bin are kept in memory.
+
+    inputs:
+        data -- array or iterable of arrays of chunks of observations
+        bin_edges -- array of increasing bin edges, e.g. from log_bin_edges
+        chunk_size -- int number of observations processed at once when data
+                      is an array
+
+    returns:
+        summary -- dict with keys
+            n -- int total number of observations
+            bin_edges -- array
+            counts -- array with number of observations in each bin
+            density -- array with probability density in each bin
+                       (fraction of all observations over bin width)
+            survival -- array with fraction of observations >= each bin edge
+            mean -- float mean of all observations
+    """
+    bin_edges = asarray(bin_edges, dtype = float)
+
+    # Index 0 is below the first edge, index len(bin_edges) at or above the last one
+    #
+    counts = zeros( len(bin_edges) + 1 )
+    n = 0
+    total = 0.
+    for chunk in get_chunks( data, chunk_size ):
+        chunk = asarray(chunk, dtype = float)
+        counts += bincount( searchsorted(bin_edges, chunk, side = 'right'),
+                            minlength = len(bin_edges) + 1 )
+        n += len(chunk)
+        total += chunk.sum()
+
+    at_or_above = cumsum( counts[::-1] )[::-1]
+
+    return { 'n': n,
+             'bin_edges': bin_edges,
+             'counts': counts[1:-1],
+             'density': counts[1:-1] / (max(n, 1) * diff(bin_edges)),
+             'survival': at_or_above[1:] / max(n, 1),
+             'mean': total / max(n, 1) }
+
+
+###################################################################################
+def sample_power_law( alpha, xmin, size, random_state = None ):
+    """
+    Draws samples of a continuous power law p(x) ~ x**-alpha for x >= xmin, by
+    inverting its cumulative distribution.  alpha = 2 and xmin = 1 is the
+    distribution of 1/U with U uniform in (0, 1).
+    """
+    u = default_rng(random_state).random(size)
+
+    return xmin * (1. - u) ** (-1. / (alpha - 1.))
+
+
+###################################################################################
+def get_ks_points( n_data, max_points ):
+    """
+    Returns the positions in the sorted data where the KS distance is
+    evaluated: all of them for up to max_points observations, otherwise
+    max_points positions evenly spaced in log of the rank from the largest
+    value, so that the tail is well represented.
+    """
+    if n_data <= max_points:
+        return arange( n_data )
+
+    from_top = unique( geomspace(1, n_data, max_points).astype(int) )
+
+    return sort( n_data - from_top )
+
+
+###################################################################################
+@profiled( bytes_from = 'data' )
+def fit_power_law( data, xmins = None, n_candidates = 100, max_points = 2000,
+                   min_tail = 50 ):
+    """
+    Fits a continuous power law to the tail of the data by maximum likelihood,
+    choosing xmin as the candidate that minimizes the Kolmogorov-Smirnov
+    distance between the tail above xmin and the fit (Clauset, Shalizi and
+    Newman, 2009).  All candidates are evaluated at once: the likelihood from
+    suffix sums of log(x) over the sorted data, the KS distance over a
+    (candidates x points) array.
+
+    inputs:
+        data -- array of positive observations
+        xmins -- array of candidate xmins, or None for n_candidates
+                 observations evenly spaced in log of the rank from the
+                 largest value, between min_tail and n (as in get_ks_points),
+                 so that candidates cover the tail
+        n_candidates -- int
+        max_points -- int maximum number of observations where the KS
+                      distance is evaluated (see get_ks_points)
+        min_tail -- int minimum number of observations above a candidate
+
+    returns:
+        fit -- dict with keys
+            xmin, alpha -- floats for best candidate
+            alpha_se -- float standard error of alpha
+            n_tail -- int number of observations >= xmin
+            n -- int total number of observations
+            ks -- float KS distance of best candidate
+            xmins, alphas, ks_values -- arrays for all candidates
+    """
+    x = sort( asarray(data, dtype = float) )
+    n = len(x)
+    if n < min_tail:
+        raise ValueError( f"at least {min_tail} observations are needed to fit a power law" )
+
+    if xmins is None:
+        from_top = unique( geomspace(min_tail, n, n_candidates).astype(int) )
+        xmins = unique( x[n - from_top] )
+    xmins = asarray(xmins, dtype = float)
+
+    # first[c] is the index of the first observation >= xmins[c]
+    #
+    first = searchsorted( x, xmins )
+    keep = n - first >= min_tail
+    xmins, first = xmins[keep], first[keep]
+    n_tail = n - first
+
+    log_suffix = append( cumsum( log(x)[::-1] )[::-1], 0. )
+    alphas = 1. + n_tail / ( log_suffix[first] - n_tail * log(xmins) )
+
+    # Empirical and fitted cumulative distributions of the tail above each
+    # candidate, at the order statistics in points
+    #
+    points = get_ks_points( n, max_points )
+    rank = points[None, :] - first[:, None]
+    above = rank >= 0
+    fitted = 1. - ( x[points][None, :] / xmins[:, None] ) ** (1. - alphas[:, None])
+    empirical_after = (rank + 1) / n_tail[:, None]
+    empirical_before = rank / n_tail[:, None]
+    distance = maximum( abs(empirical_after - fitted), abs(fitted - empirical_before) )
+    ks_values = (distance * above).max( axis = 1 )
+
+    best = argmin(ks_values)
+
+    return { 'xmin': xmins[best],
+             'alpha': alphas[best],
+             'alpha_se': (alphas[best] - 1.) / sqrt(n_tail[best]),
+             'n_tail': int(n_tail[best]),
+             'n': n,
+             'ks': ks_values[best],
+             'xmins': xmins,
+             'alphas': alphas,
+             'ks_values': ks_values }
+
+
+###################################################################################
+def init_bootstrap_worker( data_below ):
+    """
+    Stores the observations below xmin in a worker process, so they are sent
+    once to each process instead of once per replicate.
+    """
+    global _bootstrap_data
+
+    _bootstrap_data = data_below
+
+
+###################################################################################
+def bootstrap_ks( seed, fit, n_candidates = 100, max_points = 2000, min_tail = 50 ):
+    """
+    One semi-parametric bootstrap replicate: a synthetic data set of the same
+    size, with observations above xmin drawn from the fitted power law (with
+    binomial probability n_tail / n) and the rest resampled from the data
+    below xmin, is fitted as the original data was.
+
+    returns:
+        float KS distance of the fit to the synthetic data
+    """
+    rng = default_rng(seed)
+    n_above = rng.binomial( fit['n'], fit['n_tail'] / fit['n'] )
+
+    synthetic = sample_power_law( fit['alpha'], fit['xmin'], n_above, rng )
+    if len(_bootstrap_data):
+        synthetic = concatenate( [synthetic, rng.choice(_bootstrap_data, fit['n'] - n_above)] )
+
+    return fit_power_law( synthetic, None, n_candidates, max_points, min_tail )['ks']
+
+
+###################################################################################
+@profiled
+def power_law_p_value( data, fit, n_bootstrap = 1000, n_processes = None, seed = 0,
+                       n_candidates = 100, max_points = 2000, min_tail = 50 ):
+    """
+    Estimates the goodness-of-fit p-value of a power-law fit: the fraction of
+    bootstrap replicates (see bootstrap_ks) whose KS distance is at least the
+    one of the data.  Replicates are spread over a process pool and seeded
+    independently, so results do not depend on the number of processes.
+
+    inputs:
+        data -- array of observations
+        fit -- dict returned by fit_power_law(data)
+        n_bootstrap -- int number of replicates
+        n_processes -- int number of worker processes, 1 runs in the current
+                       process, None uses all cores
+        seed -- int
+        n_candidates, max_points, min_tail -- see fit_power_law
+
+    returns:
+        p_value -- float
+        ks_values -- array with KS distance of each replicate
+    """
+    data = asarray(data, dtype = float)
+    seeds = SeedSequence(seed).spawn(n_bootstrap)
+    worker = partial( bootstrap_ks, fit = fit, n_candidates = n_candidates,
+                      max_points = max_points, min_tail = min_tail )
+
+    data_below = data[data < fit['xmin']]
+    if n_processes == 1:
+        init_bootstrap_worker( data_below )
+        ks_values = [worker(s) for s in seeds]
+    else:
+        with Pool( n_processes, initializer = init_bootstrap_worker,
+                   initargs = (data_below,) ) as pool:
+            ks_values = pool.map( worker, seeds, chunksize = 8 )
+
+    ks_values = asarray(ks_values)
+
+    return (ks_values >= fit['ks']).mean(), ks_values
+
+
+###################################################################################
+def power_law_density( x, fit ):
+    """
+    Returns the density of the fitted power law at x, scaled by the fraction
+    of observations in the tail so it can be compared with
+    tail_summary(data)['density'].  It is zero below xmin.
+    """
+    x = asarray(x, dtype = float)
+    density = ( (fit['alpha'] - 1.) / fit['xmin'] * (x / fit['xmin']) ** (-fit['alpha']) *
+                fit['n_tail'] / fit['n'] )
+
+    return density * (x >= fit['xmin'])
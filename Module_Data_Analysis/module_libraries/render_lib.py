@@ -0,0 +1,144 @@
+import matplotlib
+
+from functools import partial
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from multiprocessing import Pool
+from pathlib import Path
+from time import perf_counter
+
+from .my_stats import frame_style, offset_spines
+
+
+# Each process draws every one of its figures on this single Agg figure,
+# which is cleared between jobs instead of being created and destroyed
+#
+_figure = None
+
+
+###################################################################################
+def styled_frame( sub, xaxis_label, yaxis_label = '', font_size = 15, padding = -0.02 ):
+    """
+    Replacement for half_frame, bottom_frame and left_frame to be passed to
+    the plotting functions of data_lib when the rcParams from
+    my_stats.frame_style are in effect.  Ticks and spines are already
+    formatted by the style, so only labels and spine offsets are set.
+
+    inputs:
+        sub -- matplotlib axis object
+        xaxis_label -- str
+        yaxis_label -- str
+        font_size -- int, ignored (font sizes are set by the style)
+        padding -- float offset of spines in axes coordinates
+
+    returns:
+        None
+    """
+    offset_spines( sub, padding )
+    sub.set_xlabel( xaxis_label )
+    sub.set_ylabel( yaxis_label )
+
+
+###################################################################################
+def get_reusable_figure():
+    """
+    Returns the Agg figure of the current process, creating it the first
+    time it is requested.  The figure is not registered with pyplot, so
+    it is never leaked by a missing plt.close().
+    """
+    global _figure
+
+    if _figure is None:
+        _figure = Figure()
+        FigureCanvasAgg( _figure )
+
+    return _figure
+
+
+###################################################################################
+def render_figure( job, folder, dpi = 100, file_format = 'png' ):
+    """
+    Draws one figure on the reusable Agg figure and writes it to a file.
+
+    inputs:
+        job -- tuple (name, plot_function, args, kwargs), plot_function
+               must accept a fig keyword argument (as the plotting
+               functions in data_lib do)
+        folder -- Path for folder where figure is saved as name.file_format
+        dpi -- int resolution of saved figure
+        file_format -- str
+
+    returns:
+        timing -- dict with name and path of figure, and the time in
+                  seconds spent plotting, saving, and in total
+    """
+    name, plot_function, args, kwargs = job
+    fig = get_reusable_figure()
+    file_path = Path(folder) / f"{name}.{file_format}"
+
+    t_start = perf_counter()
+    fig.clf()
+    plot_function( *args, fig = fig, **kwargs )
+
+    t_plot = perf_counter()
+    fig.savefig( file_path, dpi = dpi, format = file_format )
+
+    t_end = perf_counter()
+
+    return { 'name': name, 'path': file_path,
+             'plot_time': t_plot - t_start,
+             'save_time': t_end - t_plot,
+             'total_time': t_end - t_start }
+
+
+###################################################################################
+def init_render_worker( style ):
+    """
+    Sets up a process for headless rendering: Agg backend and the
+    rcParams of the frame style.
+    """
+    matplotlib.use( 'Agg' )
+    matplotlib.rcParams.update( style )
+
+
+###################################################################################
+def render_figures( jobs, folder, frame = 'half', font_size = 15, dpi = 100,
+                    file_format = 'png', n_processes = None, chunksize = 16 ):
+    """
+    Renders many figures without a display and writes them to folder.
+    Figures are styled through the rcParams of my_stats.frame_style, each
+    process reuses a single figure, and jobs are spread over a process
+    pool.
+
+    inputs:
+        jobs -- list of tuples (name, plot_function, args, kwargs), see
+                render_figure.  Pass styled_frame where the plotting
+                function expects half_frame.
+        folder -- Path for folder where figures are saved
+        frame -- str, one of 'half', 'bottom' or 'left'
+        font_size -- int
+        dpi -- int resolution of saved figures
+        file_format -- str
+        n_processes -- int number of worker processes, 1 renders in the
+                       current process, None uses all cores
+        chunksize -- int number of jobs sent to a worker at once
+
+    returns:
+        timings -- list of dicts (see render_figure), in the order of jobs
+    """
+    folder = Path(folder)
+    folder.mkdir( parents = True, exist_ok = True )
+
+    style = frame_style( frame, font_size )
+    worker = partial( render_figure, folder = folder, dpi = dpi,
+                      file_format = file_format )
+
+    if n_processes == 1:
+        with matplotlib.rc_context( style ):
+            return [worker(job) for job in jobs]
+
+    with Pool( n_processes, initializer = init_render_worker,
+               initargs = (style,) ) as pool:
+        timings = list( pool.imap( worker, jobs, chunksize = chunksize ) )
+
+    return timings
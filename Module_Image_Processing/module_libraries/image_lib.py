@@ -1,12 +1,22 @@
 from copy import copy
-from numpy import array, mean, uint8
+from numpy import ( abs, add, arange, argmax, argmin, array, asarray, bincount, clip,
+                    concatenate, cumsum, diff, errstate, flatnonzero, full, mean, median,
+                    moveaxis, nan_to_num, ones, uint8, where, zeros )
+from numpy.lib.stride_tricks import sliding_window_view
 from pylab import imread, imshow
-from scipy.stats import linregress, mode, pearsonr
+from scipy import ndimage
+from scipy.stats import linregress, mode
 from skimage import transform, img_as_ubyte
 
 import matplotlib.cm as cm
 import matplotlib.pyplot as plt
 
+from .cache_lib import memoized
+from .profiling_lib import get_logger, profiled
+
+
+logger = get_logger(__name__)
+
 
 ##############################################################################
 def display_all_channels( my_image, my_figsize = (15, 6) ):
@@ -76,6 +86,122 @@ def get_viewing_coordinates( z, viewing_width, l ):
     return int(z0), int(z1)
 
 
+##############################################################################
+def get_viewing_windows( x, y, viewing_width, viewing_height, w, h ):
+    """
+    Array version of get_viewing_coordinates for many viewing centers on 
+    both axes at once: windows are centered on (x, y) and shifted with 
+    np.clip to stay inside the image, so they all have the same size.
+    
+    inputs:
+        x -- array of int center x coordinates
+        y -- array of int center y coordinates
+        viewing_width -- int view width
+        viewing_height -- int view height
+        w -- int image width
+        h -- int image height
+        
+    returns
+        x0, x1 -- arrays of int leftmost and rightmost (excluded) x 
+        y0, y1 -- arrays of int top and bottom (excluded) y
+    """
+    if viewing_width > w or viewing_height > h:
+        raise ValueError( "viewing window is larger than the image" )
+
+    x0 = clip( asarray(x) - 0.5 * viewing_width, 0, w - viewing_width ).astype( int )
+    y0 = clip( asarray(y) - 0.5 * viewing_height, 0, h - viewing_height ).astype( int )
+
+    return x0, x0 + viewing_width, y0, y0 + viewing_height
+
+
+##############################################################################
+@profiled( bytes_from = 'result' )
+def extract_patches( my_image, x, y, viewing_width, viewing_height = None ):
+    """
+    Returns the viewing windows around many centers (see 
+    get_viewing_windows) as one array, taken from a strided view of the
+    image with all windows of that size, so no patch is cut out in a loop.
+
+    inputs:
+        my_image -- array with shape (h, w) or (h, w, channels)
+        x -- array of int center x coordinates
+        y -- array of int center y coordinates
+        viewing_width -- int
+        viewing_height -- int, defaults to viewing_width
+
+    returns:
+        patches -- array with shape (n, viewing_height, viewing_width) or
+                   (n, viewing_height, viewing_width, channels)
+        x0 -- array of int left corner x coordinates
+        y0 -- array of int top corner y coordinates
+    """
+    if viewing_height is None:
+        viewing_height = viewing_width
+    h, w = my_image.shape[:2]
+
+    x0, _, y0, _ = get_viewing_windows( x, y, viewing_width, viewing_height, w, h )
+    windows = sliding_window_view( my_image, (viewing_height, viewing_width), 
+                                   axis = (0, 1) )
+
+    # Windows of a color image have the channels before the window axes
+    #
+    patches = windows[y0, x0]
+    if my_image.ndim == 3:
+        patches = moveaxis( patches, 1, -1 )
+
+    return patches, x0, y0
+
+
+##############################################################################
+def zoom_patches( patches, zoom_factor ):
+    """
+    Magnifies a stack of patches from extract_patches in one call, as 
+    grayscale_zoom does for a single patch.
+
+    inputs:
+        patches -- array with shape (n, h, w)
+        zoom_factor -- int
+
+    returns:
+        zoomed_patches -- array of uint8 with shape 
+                          (n, zoom_factor * h, zoom_factor * w)
+    """
+    if patches.dtype == bool:
+        patches = patches.astype( float )
+
+    return img_as_ubyte( transform.rescale( patches, zoom_factor, channel_axis = 0 ) )
+
+
+##############################################################################
+def patch_montage( patches, n_columns, padding = 2, fill = 0 ):
+    """
+    Lays out a stack of patches as a contact sheet with n_columns patches
+    per row, separated by padding pixels of value fill, ready for imshow.
+
+    inputs:
+        patches -- array with shape (n, h, w) or (n, h, w, channels)
+        n_columns -- int
+        padding -- int
+        fill -- value of padding and empty slots
+
+    returns:
+        montage -- array with shape (n_rows * (h + padding) - padding, 
+                   n_columns * (w + padding) - padding, ...)
+    """
+    n, h, w = patches.shape[:3]
+    n_rows = -(-n // n_columns)
+
+    sheet = full( (n_rows * n_columns, h + padding, w + padding) + patches.shape[3:], 
+                  fill, dtype = patches.dtype )
+    sheet[:n, :h, :w] = patches
+
+    sheet = sheet.reshape( (n_rows, n_columns) + sheet.shape[1:] ).swapaxes( 1, 2 )
+    sheet = sheet.reshape( (n_rows * (h + padding), n_columns * (w + padding)) 
+                           + patches.shape[3:] )
+
+    return sheet[: n_rows * (h + padding) - padding, : n_columns * (w + padding) - padding]
+
+
 #############################################################################
 def grayscale_zoom( ax, my_image, x, y, zoom_factor ):
     """
@@ -147,6 +273,7 @@ def visualize_tesseract_results( image, results, fig ):
             
             
 #############################################################################    
+@profiled
 def rescaling_from_OCR_results( x, y, x_values, y_values, results ):
     """
     Calculate data values corresponding to coordinates x (or y) using
@@ -199,6 +326,7 @@ def rescaling_from_OCR_results( x, y, x_values, y_values, results ):
 
 
 #############################################################################
+@profiled( bytes_from = 'plate' )
 def threshold_for_data_extraction( plate, ax1, ax2, threshold_for_white, 
                                    coordinates, zoom_factor = 4.,  ):
     """
@@ -233,6 +361,21 @@ def threshold_for_data_extraction( plate, ax1, ax2, threshold_for_white,
 
 
 #############################################################################
+def white_run_lengths( plate, axis ):
+    """
+    Returns the number of consecutive True pixels from the start of every
+    column (axis 0) or row (axis 1) of a boolean array, in one reduction.
+    Flip the array to count from the other end.
+    """
+    if plate.shape[axis] == 0:
+        return zeros( plate.shape[1 - axis], dtype = int )
+
+    return where( plate.all(axis = axis), plate.shape[axis], plate.argmin(axis = axis) )
+
+
+#############################################################################
+@profiled( bytes_from = 'plate' )
+@memoized
 def infer_grid_lines( axis, z_min, z_max, w_max, line_threshold, plate ):
     """
     This function takes a selected axis (0 for y and 1 for x), the limits 
@@ -252,43 +395,32 @@ def infer_grid_lines( axis, z_min, z_max, w_max, line_threshold, plate ):
         
     returns:
         level_lines -- list of int with coordinates of grid lines
+        levels -- list of int with extension of white run at each coordinate
     
     """
-    level_lines = []
-    levels = []
     level_line_threshold = 10
 
-    print(z_min, z_max)
+    logger.debug(f"Scanning from {z_min} to {z_max}")
     if axis == 0:
-        for i in range(z_min, z_max):
-            j = 0
-            while plate[i,j] and j < w_max-1:
-                j += 1
-
-            # Check if this is grid line
-            #
-            if j > level_line_threshold:
-                level_lines.append(i)
-
-            levels.append(j)
+        # Run of white pixels from the left of each row, up to w_max - 1
+        #
+        levels = white_run_lengths( plate[z_min:z_max, :w_max-1], 1 )
+        is_line = levels > level_line_threshold
 
     if axis == 1:
-        for i in range(z_min, z_max):
-            j = w_max
-            while plate[j-1, i] and j > 0:
-                j -= 1
+        # Run of white pixels from row w_max - 1 up each column
+        #
+        levels = white_run_lengths( plate[:w_max][::-1, z_min:z_max], 0 )
+        is_line = levels > line_threshold
 
-            # Check if this is grid line
-            #
-            if w_max - j > line_threshold:
-                level_lines.append(i)
+    level_lines = (z_min + flatnonzero(is_line)).tolist()
+    levels = levels.tolist()
 
-            levels.append(w_max - j)
-            
     return level_lines, levels
 
 
 #############################################################################
+@profiled
 def cluster_infered_lines( level_lines ):
     """
     Takes list of integers with extracted coordinates of grid lines and  
@@ -321,7 +453,7 @@ def cluster_infered_lines( level_lines ):
 
     mapping.append( mean(cluster) )
 
-    print(f"There are {len(mapping)} level lines:\n   {mapping}")
+    logger.info(f"There are {len(mapping)} level lines:\n   {mapping}")
 
     # Get distances between peaks in order to do perform scaling
     #
@@ -335,6 +467,7 @@ def cluster_infered_lines( level_lines ):
 
 
 ############################################################################# 
+@profiled( bytes_from = 'heights' )
 def correct_column_heights(heights, block_delta, mapping, x_min ):
     """
     This function takes a list of heights of bars, a typical interval 
@@ -394,6 +527,7 @@ def correct_column_heights(heights, block_delta, mapping, x_min ):
 
 
 ############################################################################# 
+@profiled
 def rescaling_from_scan_results( axis, z, scale, mapping, z_max = 0 ):
     """
     This function rescales a list or array of values with coordinates 
@@ -426,7 +560,419 @@ def rescaling_from_scan_results( axis, z, scale, mapping, z_max = 0 ):
     data = result.slope * z + result.intercept
     
     return data
-    
 
 
-    
+#############################################################################
+def to_gray_levels( image ):
+    """
+    Returns an image as an array of uint8 gray levels.  Float images are
+    taken to be in [0, 1], RGB(A) images are averaged over their color
+    channels (pass a single channel to use only that one).
+    """
+    image = asarray( image )
+    if image.ndim == 3:
+        image = image[:, :, :3].mean( axis = 2 )
+    if image.dtype == uint8:
+        return image
+    if image.dtype.kind == 'f':
+        return ( 255 * clip(image, 0., 1.) + 0.5 ).astype( uint8 )
+
+    return clip( image, 0, 255 ).astype( uint8 )
+
+
+#############################################################################
+@profiled( bytes_from = 'gray' )
+def otsu_threshold( gray ):
+    """
+    Chooses the threshold between dark and light pixels that maximizes the
+    variance between the two classes (Otsu's method), from a single
+    histogram of the gray levels.
+
+    inputs:
+        gray -- array of uint8 gray levels (see to_gray_levels)
+
+    returns:
+        threshold -- int, pixels > threshold are light
+        class_means -- tuple of floats with mean gray level of dark and
+                       light pixels
+    """
+    counts = bincount( gray.ravel(), minlength = 256 ).astype( float )
+    omega = cumsum( counts ) / counts.sum()
+    mu = cumsum( arange(len(counts)) * counts ) / counts.sum()
+
+    with errstate( divide = 'ignore', invalid = 'ignore' ):
+        between = (mu[-1] * omega - mu) ** 2 / (omega * (1. - omega))
+    threshold = int( argmax( nan_to_num(between[:-1]) ) )
+
+    dark = mu[threshold] / max( omega[threshold], 1e-12 )
+    light = (mu[-1] - mu[threshold]) / max( 1. - omega[threshold], 1e-12 )
+
+    return threshold, (dark, light)
+
+
+#############################################################################
+def group_consecutive( indices, max_gap = 5 ):
+    """
+    Groups sorted pixel indices closer than max_gap into lines, as 
+    cluster_infered_lines does, and returns arrays with the center, first 
+    and last index of every line.
+    """
+    indices = asarray( indices )
+    if len(indices) == 0:
+        return zeros(0), zeros(0, dtype = int), zeros(0, dtype = int)
+
+    starts = concatenate( [[0], flatnonzero(diff(indices) > max_gap) + 1] )
+    ends = concatenate( [starts[1:], [len(indices)]] )
+    centers = add.reduceat( indices, starts ) / (ends - starts)
+
+    return centers, indices[starts], indices[ends - 1]
+
+
+#############################################################################
+@profiled( bytes_from = 'plate' )
+def find_plot_area( plate, window = 15, min_contrast = 0.05 ):
+    """
+    Locates the grid lines and the plot area of a chart from its projection 
+    profiles: the mean foreground in every row and in every column.  A grid 
+    line (solid or dashed) is a narrow peak of a profile, so it is found 
+    where the profile exceeds its running median by min_contrast.  Bars are 
+    wider than the window and do not show up.
+
+    inputs:
+        plate -- boolean array, True for foreground, or float array with 
+                 foreground fraction of pixels (so light grid lines count)
+        window -- int width of running median, should be larger than twice
+                  the width of lines and smaller than twice that of bars
+        min_contrast -- float
+
+    returns:
+        lines -- dict with keys
+            rows -- array with centers of horizontal lines, top to bottom
+            columns -- array with centers of vertical lines, left to right
+            baseline -- int first row of the bottom line (the x axis)
+            area -- tuple (top, bottom, left, right) of plot area in pixels
+    """
+    row_profile = plate.mean( axis = 1 )
+    column_profile = plate.mean( axis = 0 )
+
+    rows, row_firsts, _ = group_consecutive( flatnonzero(
+        row_profile - ndimage.median_filter(row_profile, window, mode = 'nearest') 
+        > min_contrast ) )
+    columns, _, column_lasts = group_consecutive( flatnonzero(
+        column_profile - ndimage.median_filter(column_profile, window, mode = 'nearest')
+        > min_contrast ) )
+
+    if len(rows) < 2:
+        raise ValueError( "could not find at least two horizontal grid lines" )
+
+    top, bottom = int(row_firsts[0]), int(row_firsts[-1])
+
+    # Without vertical lines on both sides, the plot extends as far as the 
+    # foreground between the top and bottom lines
+    #
+    in_band = flatnonzero( (plate[top:bottom] > 0.5).any(axis = 0) )
+    left = int(column_lasts[0]) + 1 if len(columns) else int(in_band[0])
+    right = int(columns[-1]) if len(columns) > 1 else int(in_band[-1]) + 1
+
+    logger.info(f"There are {len(rows)} horizontal and {len(columns)} vertical lines")
+
+    return { 'rows': rows, 'columns': columns, 'baseline': bottom,
+             'area': (top, bottom, left, right) }
+
+
+#############################################################################
+@profiled( bytes_from = 'plate' )
+def measure_column_heights( plate, baseline, gray = None, class_means = None ):
+    """
+    Measures the height of the foreground above a baseline row in every 
+    column at once.  With the gray levels, the partially covered pixel on 
+    top of each column counts by its covered fraction, for sub-pixel 
+    heights, whichever side of the threshold it fell on.
+
+    inputs:
+        plate -- boolean array, True for foreground
+        baseline -- int row on which columns stand (not counted)
+        gray -- array of uint8 gray levels of the same image, or None
+        class_means -- tuple of background and foreground gray levels, 
+                       needed with gray
+
+    returns:
+        heights -- array of floats, one per column of plate
+    """
+    runs = white_run_lengths( plate[:baseline][::-1], 0 )
+    heights = runs.astype( float )
+
+    if gray is not None:
+        background, foreground = class_means
+
+        # Covered fraction of the last pixel of the run (one less than a full
+        # pixel) and of the pixel above it
+        #
+        for row, offset in ( (baseline - runs, -1.), (baseline - 1 - runs, 0.) ):
+            inside = (row >= 0) & (row < baseline)
+            columns = flatnonzero( inside )
+            covered = ( gray[row[inside], columns] - background ) / (foreground - background)
+            heights[inside] += clip( covered, 0., 1. ) + offset
+
+    return heights
+
+
+#############################################################################
+def match_tick_labels( results, lines, axis, area, tolerance = 0.25 ):
+    """
+    Pairs the numeric labels found by Tesseract with grid lines: a label 
+    left of the plot area (axis 0) or below it (axis 1) belongs to the line 
+    its center is closest to, within tolerance times the line spacing.
+
+    inputs:
+        results -- Tesseract image_to_data output results
+        lines -- array with centers of grid lines
+        axis -- int (0 for y and 1 for x)
+        area -- tuple (top, bottom, left, right) from find_plot_area
+        tolerance -- float
+
+    returns:
+        scale -- list of floats with values of matched labels
+        mapping -- list of floats with coordinates of their grid lines
+    """
+    top, bottom, left, right = area
+    spacing = median( diff(lines) ) if len(lines) > 1 else 1.
+
+    scale, mapping = [], []
+    for i in range(len(results['text'])):
+        try:
+            value = float( results['text'][i].replace(',', '') )
+        except ValueError:
+            continue
+        if int(results['conf'][i]) <= 0:
+            continue
+
+        if axis == 0:
+            outside = results['left'][i] + results['width'][i] <= left + 2
+            z = results['top'][i] + 0.5 * results['height'][i]
+        else:
+            outside = results['top'][i] >= bottom - 2
+            z = results['left'][i] + 0.5 * results['width'][i]
+
+        k = argmin( abs(lines - z) ) if len(lines) else None
+        if outside and k is not None and abs(lines[k] - z) <= tolerance * spacing:
+            scale.append( value )
+            mapping.append( lines[k] )
+
+    return scale, mapping
+
+
+#############################################################################
+@profiled( bytes_from = 'image' )
+def read_bar_chart( image, y_scale = None, results = None, window = 15, 
+                    min_contrast = 0.05, min_height = 2, max_gap = 4 ):
+    """
+    Reads the values of a bar chart without manual steps: the threshold is 
+    chosen by otsu_threshold, grid lines and plot area by find_plot_area, 
+    column heights by measure_column_heights, and bars are runs of columns 
+    taller than min_height.  Heights are calibrated with 
+    rescaling_from_scan_results, from the values of the horizontal lines 
+    given in y_scale (top to bottom, as in the notebook) or read by 
+    Tesseract.  The foreground is whichever of dark or light pixels is 
+    the minority.
+
+    inputs:
+        image -- array with gray levels, or RGB
+        y_scale -- list of values of horizontal grid lines, top to bottom
+        results -- Tesseract image_to_data output results, used when y_scale
+                   is None
+        window, min_contrast -- see find_plot_area
+        min_height -- float minimum height in pixels of a bar
+        max_gap -- int width of vertical lines crossing a bar, which are 
+                   filled in
+
+    returns:
+        chart -- dict with keys
+            threshold -- int
+            lines -- dict returned by find_plot_area
+            bar_left, bar_right -- arrays with first and last column of bars
+            bar_centers -- array of floats with center column of bars
+            bar_heights -- array of floats with median height of bars in pixels
+            values -- array of floats with values of bars, or None without a
+                      scale
+            x_values -- array of values at bar centers when Tesseract found
+                        at least two x labels, or None
+    """
+    gray = to_gray_levels( image )
+    threshold, (dark, light) = otsu_threshold( gray )
+
+    plate = gray > threshold
+    background, foreground = dark, light
+    if plate.mean() > 0.5:
+        plate = ~plate
+        background, foreground = light, dark
+    class_means = (background, foreground)
+
+    # Grid lines are often lighter than bars and text, so they are found 
+    # from the fraction of foreground of every pixel, not from the plate
+    #
+    ink = clip( (gray - background) / (foreground - background), 0., 1. )
+    lines = find_plot_area( ink, window, min_contrast )
+    top, baseline, left, right = lines['area']
+
+    heights = measure_column_heights( plate[:, left:right], baseline, 
+                                      gray[:, left:right], class_means )
+
+    # Vertical grid lines are as tall as the plot: they are removed, and 
+    # filled back in where they cross a bar
+    #
+    is_bar = heights > min_height
+    for column in lines['columns']:
+        is_bar[ max(int(column) - left - 1, 0): max(int(column) - left + 2, 0) ] = False
+    is_bar = ndimage.binary_closing( is_bar, ones(max_gap + 1, dtype = bool) ) | is_bar
+    labels, n_bars = ndimage.label( is_bar )
+    index = arange( 1, n_bars + 1 )
+
+    bar_columns = ndimage.find_objects( labels )
+    bar_left = array( [left + s[0].start for s in bar_columns], dtype = int )
+    bar_right = array( [left + s[0].stop - 1 for s in bar_columns], dtype = int )
+    bar_heights = asarray( ndimage.median(heights, labels, index), dtype = float ).reshape(-1)
+
+    y_mapping = list( lines['rows'] )
+    if y_scale is None and results is not None:
+        y_scale, y_mapping = match_tick_labels( results, lines['rows'], 0, lines['area'] )
+
+    # Heights are measured from the top of the baseline row, and a line at
+    # row r is centered half a pixel below the top of that row
+    #
+    values = None
+    if y_scale is not None and len(y_scale) >= 2:
+        values = rescaling_from_scan_results( 0, bar_heights, y_scale, y_mapping, 
+                                              baseline - 0.5 )
+
+    x_values = None
+    if results is not None:
+        x_scale, x_mapping = match_tick_labels( results, lines['columns'], 1, lines['area'] )
+        if len(x_scale) >= 2:
+            x_values = rescaling_from_scan_results( 1, 0.5 * (bar_left + bar_right), 
+                                                    x_scale, x_mapping )
+
+    return { 'threshold': threshold,
+             'lines': lines,
+             'bar_left': bar_left,
+             'bar_right': bar_right,
+             'bar_centers': 0.5 * (bar_left + bar_right),
+             'bar_heights': bar_heights,
+             'values': values,
+             'x_values': x_values }
+
+
+#############################################################################
+@profiled( bytes_from = 'plate' )
+def label_components( plate, foreground = True, min_size = 1, max_size = None,
+                      connectivity = 2 ):
+    """
+    Labels the connected components of a plate (e.g. the markers of a 
+    scatter plot, or the curves of a line plot) and measures them all at 
+    once with ndimage reductions.  Components outside [min_size, max_size] 
+    pixels are dropped and the rest are numbered from 1.
+
+    inputs:
+        plate -- boolean array, from threshold_for_data_extraction
+        foreground -- bool value of the pixels that make up components
+        min_size -- int minimum number of pixels of a component
+        max_size -- int maximum number of pixels of a component, or None
+        connectivity -- int 1 for 4-connected, 2 for 8-connected pixels
+
+    returns:
+        components -- dict with keys
+            labels -- array of int with component of each pixel, 0 for none
+            n -- int number of components
+            sizes -- array of int with number of pixels of each component
+            centroids -- array (n, 2) of floats with y and x of centroids
+            bboxes -- array (n, 4) of int with top, bottom, left and right
+                      of each component (bottom and right excluded)
+    """
+    mask = plate if foreground else ~plate
+    structure = ndimage.generate_binary_structure( 2, connectivity )
+    labels, n = ndimage.label( mask, structure )
+
+    # Relabel the components that are kept as 1, 2, ..., in a single lookup
+    #
+    sizes = bincount( labels.ravel(), minlength = n + 1 )
+    keep = sizes >= min_size
+    if max_size is not None:
+        keep &= sizes <= max_size
+    keep[0] = False
+    new_label = zeros( n + 1, dtype = labels.dtype )
+    new_label[keep] = arange( 1, keep.sum() + 1 )
+    labels = new_label[labels]
+    n = int( keep.sum() )
+
+    index = arange( 1, n + 1 )
+    centroids = array( ndimage.center_of_mass(mask, labels, index) ).reshape(-1, 2)
+    bboxes = array( [ [s[0].start, s[0].stop, s[1].start, s[1].stop] 
+                      for s in ndimage.find_objects(labels, n) ], dtype = int ).reshape(-1, 4)
+
+    logger.info(f"Found {n} components")
+
+    return { 'labels': labels,
+             'n': n,
+             'sizes': sizes[keep],
+             'centroids': centroids,
+             'bboxes': bboxes }
+
+
+#############################################################################
+@profiled( bytes_from = 'plate' )
+def trace_curve( plate, foreground = True, area = None ):
+    """
+    Traces a curve as the median row of its pixels in every column, from a
+    single pass over the foreground pixels sorted by column.  Restrict the 
+    plate to one curve first (e.g. labels == k from label_components) or 
+    pass the plot area, so grid lines and text are left out.
+
+    inputs:
+        plate -- boolean array
+        foreground -- bool value of the pixels of the curve
+        area -- tuple (top, bottom, left, right) to trace in, or None for 
+                the whole plate
+
+    returns:
+        x -- array of int with columns containing the curve
+        y -- array of floats with median row of the curve in each column
+    """
+    top, bottom, left, right = area if area is not None else (0, plate.shape[0], 
+                                                              0, plate.shape[1])
+    mask = plate[top:bottom, left:right]
+    if not foreground:
+        mask = ~mask
+
+    # Pixels of the transposed mask come column by column, rows increasing
+    #
+    columns, rows = mask.T.nonzero()
+    counts = bincount( columns, minlength = mask.shape[1] )
+    x = flatnonzero( counts )
+    starts = concatenate( [[0], cumsum(counts)[:-1]] )[x]
+    counts = counts[x]
+
+    y = 0.5 * ( rows[starts + (counts - 1) // 2] + rows[starts + counts // 2] )
+
+    return left + x, top + y
+
+
+#############################################################################
+def rescale_points( x, y, x_scale, x_mapping, y_scale, y_mapping, y_max ):
+    """
+    Converts image coordinates of points (centroids or a traced curve) to
+    data coordinates with rescaling_from_scan_results on both axes.
+
+    inputs:
+        x, y -- arrays of column and row coordinates of points
+        x_scale, y_scale -- lists of values of grid lines on each axis
+        x_mapping, y_mapping -- lists of coordinates of those grid lines
+        y_max -- int number of rows of the image
+
+    returns:
+        x_data -- array of floats
+        y_data -- array of floats
+    """
+    x_data = rescaling_from_scan_results( 1, x, x_scale, x_mapping )
+    y_data = rescaling_from_scan_results( 0, y_max - asarray(y), y_scale, y_mapping, y_max )
+
+    return x_data, y_data
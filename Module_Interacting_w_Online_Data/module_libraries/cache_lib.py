@@ -0,0 +1 @@
+../../cache_lib.py
\ No newline at end of file
@@ -0,0 +1,482 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from pathlib import Path
+from numpy import ( add, arange, array, asarray, concatenate, cumsum, diff, floor,
+                    flatnonzero, full, inf, interp, isnan, maximum, searchsorted, stack,
+                    where, zeros )
+from scipy.ndimage import maximum_filter1d
+
+from .profiling_lib import get_logger, profiled
+
+
+logger = get_logger(__name__)
+
+
+# EPA breakpoints for PM2.5 (24-hour, revised 2024): concentration in ug/m3
+# truncated to 0.1, and the corresponding range of the AQI.  Concentrations
+# above the last breakpoint are extrapolated from the last segment.
+#
+AQI_BREAKPOINTS = [ (0.0, 9.0, 0, 50),
+                    (9.1, 35.4, 51, 100),
+                    (35.5, 55.4, 101, 150),
+                    (55.5, 125.4, 151, 200),
+                    (125.5, 225.4, 201, 300),
+                    (225.5, 325.4, 301, 500) ]
+
+# Layout of the local store of station histories: one directory per station,
+# year and month, e.g. station=4395/year=2023/month=2/part-0.parquet
+#
+STORE_PARTITIONING = ds.partitioning( pa.schema( [ ('station', pa.string()),
+                                                   ('year', pa.int16()),
+                                                   ('month', pa.int8()) ] ),
+                                      flavor = 'hive' )
+
+
+##########################################################################################
+def pm25_to_aqi( pm25 ):
+    """
+    Converts PM2.5 concentrations to the Air Quality Index by linear
+    interpolation within the EPA breakpoints, for a whole array at once.
+
+    input:
+        pm25 -- float or array of concentrations in ug/m3
+
+    output:
+        array of AQI values (NaN where the concentration is NaN)
+    """
+    c_low, c_high, i_low, i_high = ( array(column, dtype = float)
+                                     for column in zip(*AQI_BREAKPOINTS) )
+
+    # Truncated concentrations never fall between two segments, so the
+    # breakpoints can be interpolated as a single polyline
+    #
+    c = floor( 10 * maximum(asarray(pm25, dtype = float), 0.) + 1e-6 ) / 10
+    aqi = interp( c, stack([c_low, c_high], axis = 1).ravel(),
+                  stack([i_low, i_high], axis = 1).ravel() )
+
+    slope = (i_high[-1] - i_low[-1]) / (c_high[-1] - c_low[-1])
+    aqi = where( c > c_high[-1], i_high[-1] + slope * (c - c_high[-1]), aqi )
+
+    return floor( aqi + 0.5 )
+
+
+##########################################################################################
+def stations_to_long_format( frames ):
+    """
+    Stacks the dataframes of several stations (e.g. from clean_station_data)
+    into one long-format dataframe with a 'station' column, the table all
+    functions below work on.
+
+    input:
+        frames -- dictionary with station ID as key and dataframe as value
+
+    output:
+        dataframe
+    """
+    long_df = pd.concat( frames, names = ['station', None] ).reset_index( level = 0 )
+    long_df['station'] = long_df['station'].astype( str )
+
+    return long_df.reset_index( drop = True )
+
+
+##########################################################################################
+def new_window_aggregates( window = 3600, value_column = 'pm2.5_atm' ):
+    """
+    Returns an empty state for update_window_aggregates.  Readings are
+    assigned to tumbling windows of window seconds, aligned on the Unix
+    epoch, and each station keeps the sum, count and maximum of the values
+    in each window, in arrays with a row per station and a column per window.
+
+    input:
+        window -- int length of windows in seconds (3600 for hourly)
+        value_column -- str column aggregated
+
+    output:
+        state -- dictionary
+    """
+    return { 'window': window,
+             'value_column': value_column,
+             'stations': pd.Index( [], dtype = object ),
+             'first': 0,             # window number (time_stamp // window) of column 0
+             'n_windows': 0,         # columns in use
+             'sum': zeros( (0, 0) ),
+             'count': zeros( (0, 0), dtype = int ),
+             'max': zeros( (0, 0) ) }
+
+
+##########################################################################################
+def grow_window_aggregates( state, n_stations, first, last ):
+    """
+    Makes room in the arrays of state for n_stations rows and for windows
+    first to last, doubling the capacity when windows are added at the end
+    so that appending is cheap.
+    """
+    rows, columns = state['sum'].shape
+    if state['n_windows'] == 0:
+        state['first'] = first
+
+    new_first = min( state['first'], first )
+    needed = max( state['first'] + state['n_windows'], last + 1 ) - new_first
+    shift = state['first'] - new_first
+
+    if n_stations <= rows and shift == 0 and needed <= columns:
+        state['n_windows'] = needed
+        return
+
+    new_rows = max( n_stations, 2 * rows if n_stations > rows else rows )
+    new_columns = max( needed, 2 * columns if needed > columns else columns )
+    for key, fill in ( ('sum', 0.), ('count', 0), ('max', -inf) ):
+        grown = full( (new_rows, new_columns), fill, dtype = state[key].dtype )
+        grown[:rows, shift: shift + state['n_windows']] = state[key][:, :state['n_windows']]
+        state[key] = grown
+
+    state['first'] = new_first
+    state['n_windows'] = needed
+
+
+##########################################################################################
+@profiled( bytes_from = 'chunk' )
+def update_window_aggregates( state, chunk ):
+    """
+    Adds a chunk of readings of any number of stations to the window
+    aggregates, with one grouped reduction over the (station, window) pairs
+    in the chunk.  Only windows touched by the chunk are updated, so chunks
+    can arrive in any order and nothing is recomputed.
+
+    input:
+        state -- dictionary from new_window_aggregates
+        chunk -- long-format dataframe with columns 'station', 'time_stamp'
+                 (Unix seconds) and the value column
+
+    output:
+        state -- the same dictionary, updated
+    """
+    values = chunk[state['value_column']].to_numpy( dtype = float )
+    keep = ~isnan( values )
+    values = values[keep]
+    codes, stations = pd.factorize( chunk['station'].to_numpy()[keep] )
+    windows = ( chunk['time_stamp'].to_numpy()[keep] // state['window'] ).astype( int )
+    if len(values) == 0:
+        return state
+
+    # Only the distinct stations of the chunk are looked up
+    #
+    stations = stations.astype( str )
+    is_new = state['stations'].get_indexer( stations ) < 0
+    if is_new.any():
+        state['stations'] = state['stations'].append( pd.Index(stations[is_new], dtype = object) )
+    rows = state['stations'].get_indexer( stations )[codes]
+
+    grow_window_aggregates( state, len(state['stations']), windows.min(), windows.max() )
+
+    # Readings sorted by the cell of the arrays they fall in, and the first
+    # reading of every cell touched by the chunk
+    #
+    cells = rows * state['sum'].shape[1] + (windows - state['first'])
+    order = cells.argsort( kind = 'stable' )
+    cells, values = cells[order], values[order]
+    starts = flatnonzero( concatenate([[True], diff(cells) != 0]) )
+    cells = cells[starts]
+
+    state['sum'].ravel()[cells] += add.reduceat( values, starts )
+    state['count'].ravel()[cells] += diff( concatenate([starts, [len(values)]]) )
+    state['max'].ravel()[cells] = maximum( state['max'].ravel()[cells],
+                                           maximum.reduceat(values, starts) )
+
+    logger.debug( f"Added {len(values)} readings to {len(cells)} windows" )
+
+    return state
+
+
+##########################################################################################
+def select_windows( state, stations = None, start = None, end = None, margin = 0 ):
+    """
+    Returns the rows of stations and the range of columns of the windows
+    between start and end (Unix seconds, end excluded), with margin more
+    columns before start if available.
+    """
+    if stations is None:
+        rows = arange( len(state['stations']) )
+    else:
+        rows = state['stations'].get_indexer( [str(s) for s in stations] )
+        if (rows < 0).any():
+            raise KeyError( "no readings for some of the stations" )
+
+    first = 0 if start is None else max( int(start // state['window']) - state['first'], 0 )
+    last = state['n_windows'] if end is None else min(
+        -int(-end // state['window']) - state['first'], state['n_windows'] )
+    last = max( first, last )
+
+    return rows, max( first - margin, 0 ), first, last
+
+
+##########################################################################################
+def windows_to_long_format( state, rows, first, mean, maximum_values, count ):
+    """
+    Returns a long-format dataframe with a row per station and window with
+    readings, from (stations x windows) arrays starting at column first.
+    """
+    cells = flatnonzero( count > 0 )
+    row_index, column_index = divmod( cells, count.shape[1] )
+    window_start = (state['first'] + first + column_index) * state['window']
+    mean = mean.ravel()[cells]
+
+    return pd.DataFrame( { 'station': pd.Categorical.from_codes( rows[row_index],
+                                                                 state['stations'] ),
+                           'Date & Time': pd.to_datetime( window_start, unit = 's' ),
+                           'time_stamp': window_start,
+                           'mean': mean,
+                           'max': maximum_values.ravel()[cells],
+                           'count': count.ravel()[cells],
+                           'aqi': pm25_to_aqi( mean ) } )
+
+
+##########################################################################################
+@profiled( bytes_from = 'result' )
+def get_tumbling_aggregates( state, stations = None, start = None, end = None ):
+    """
+    Returns mean, maximum, count and AQI (of the mean) of every window with
+    readings, for some stations and time range, from the arrays kept by
+    update_window_aggregates.
+
+    input:
+        state -- dictionary from new_window_aggregates
+        stations -- list of station IDs, or None for all
+        start, end -- int Unix seconds (end excluded), or None for all
+
+    output:
+        long-format dataframe with columns station, Date & Time (start of
+        the window), time_stamp, mean, max, count and aqi
+    """
+    rows, _, first, last = select_windows( state, stations, start, end )
+    count = state['count'][rows, first:last]
+    with_readings = maximum( count, 1 )
+
+    return windows_to_long_format( state, rows, first,
+                                   state['sum'][rows, first:last] / with_readings,
+                                   state['max'][rows, first:last], count )
+
+
+##########################################################################################
+@profiled( bytes_from = 'result' )
+def get_rolling_aggregates( state, n_windows, stations = None, start = None, end = None,
+                            min_count = 1 ):
+    """
+    Returns rolling aggregates over the last n_windows tumbling windows
+    (e.g. 24 hourly windows for the daily AQI), ending at every window.
+    Sums and counts come from cumulative sums along time, for all stations
+    at once.
+
+    input:
+        state -- dictionary from new_window_aggregates
+        n_windows -- int number of tumbling windows in the rolling window
+        stations, start, end -- see get_tumbling_aggregates
+        min_count -- int minimum number of readings in a rolling window
+
+    output:
+        long-format dataframe as in get_tumbling_aggregates, with the
+        window start of the last tumbling window in the rolling window
+    """
+    rows, margin_first, first, last = select_windows( state, stations, start, end,
+                                                      n_windows - 1 )
+    n_stations = len(rows)
+
+    # Pad with empty windows before the data, so every rolling window is complete
+    #
+    pad = n_windows - 1 - (first - margin_first)
+    sums = zeros( (n_stations, pad + last - margin_first + 1) )
+    counts = zeros( sums.shape, dtype = int )
+    maxima = full( sums.shape, -inf )
+    sums[:, pad + 1:] = cumsum( state['sum'][rows, margin_first:last], axis = 1 )
+    counts[:, pad + 1:] = cumsum( state['count'][rows, margin_first:last], axis = 1 )
+    maxima[:, pad + 1:] = state['max'][rows, margin_first:last]
+
+    rolling_sum = sums[:, n_windows:] - sums[:, :-n_windows]
+    rolling_count = counts[:, n_windows:] - counts[:, :-n_windows]
+
+    # Trailing maximum: the filter is shifted so it ends at each window
+    #
+    rolling_max = maximum_filter1d( maxima, n_windows, axis = 1,
+                                    origin = (n_windows - 1) // 2 )[:, n_windows:]
+
+    rolling_count = where( rolling_count >= min_count, rolling_count, 0 )
+
+    return windows_to_long_format( state, rows, first,
+                                   rolling_sum / maximum( rolling_count, 1 ),
+                                   rolling_max, rolling_count )
+
+
+##########################################################################################
+@profiled( bytes_from = 'result' )
+def get_group_aggregates( state, groups, start = None, end = None ):
+    """
+    Combines the windows of many stations into groups (e.g. neighborhoods or
+    sensor types) with one grouped reduction over the station axis: sums
+    and counts are added, maxima are the largest in the group.
+
+    input:
+        state -- dictionary from new_window_aggregates
+        groups -- dictionary with station ID as key and group name as value
+                  (stations not in groups are left out)
+        start, end -- see get_tumbling_aggregates
+
+    output:
+        long-format dataframe as in get_tumbling_aggregates, with a 'group'
+        column instead of 'station'
+    """
+    stations = [s for s in groups if str(s) in state['stations']]
+    if len(stations) == 0:
+        raise KeyError( "none of the stations in groups has readings" )
+    rows, _, first, last = select_windows( state, stations, start, end )
+
+    labels = pd.Index( [groups[s] for s in stations] )
+    codes, names = pd.factorize( labels, sort = True )
+    order = codes.argsort( kind = 'stable' )
+    starts = searchsorted( codes[order], arange(len(names)) )
+
+    sums = add.reduceat( state['sum'][rows[order], first:last], starts, axis = 0 )
+    counts = add.reduceat( state['count'][rows[order], first:last], starts, axis = 0 )
+    maxima = maximum.reduceat( state['max'][rows[order], first:last], starts, axis = 0 )
+
+    group_state = dict( state, stations = pd.Index(names, dtype = object) )
+    long_df = windows_to_long_format( group_state, arange(len(names)), first,
+                                      sums / maximum(counts, 1), maxima, counts )
+
+    return long_df.rename( columns = {'station': 'group'} )
+
+
+##########################################################################################
+def month_range_filter( start = None, end = None ):
+    """
+    Returns a dataset filter on the year and month partitions that keeps the
+    months overlapping [start, end) (Unix seconds), so that other partitions
+    are never opened, or None if both are None.
+    """
+    condition = None
+    for bound, keep_later in ( (start, True), (end, False) ):
+        if bound is None:
+            continue
+        date = pd.to_datetime( bound, unit = 's' )
+        if not keep_later and date == date.to_period('M').start_time:
+            date -= pd.Timedelta( seconds = 1 )
+
+        year, month = ds.field('year'), ds.field('month')
+        if keep_later:
+            in_range = (year > date.year) | ( (year == date.year) & (month >= date.month) )
+        else:
+            in_range = (year < date.year) | ( (year == date.year) & (month <= date.month) )
+        condition = in_range if condition is None else condition & in_range
+
+    return condition
+
+
+##########################################################################################
+@profiled( bytes_from = 'result' )
+def query_station_history( store_path, stations = None, start = None, end = None,
+                           columns = None ):
+    """
+    Reads station histories from the local store, opening only the partitions
+    of the stations and months requested, and only the row groups whose time
+    stamps overlap [start, end).  Only the requested columns are read.
+
+    input:
+        store_path -- str or Path of the store
+        stations -- list of station IDs, or None for all
+        start, end -- int Unix seconds (end excluded), or None
+        columns -- list of column names, or None for all (the partition
+                   columns station, year and month are columns too)
+
+    output:
+        dataframe sorted by station and time stamp, or None if the store
+        does not exist
+    """
+    if not Path(store_path).exists():
+        return None
+
+    dataset = ds.dataset( store_path, format = 'parquet', partitioning = STORE_PARTITIONING )
+
+    conditions = [ month_range_filter(start, end) ]
+    if stations is not None:
+        conditions.append( ds.field('station').isin( [str(s) for s in stations] ) )
+    if start is not None:
+        conditions.append( ds.field('time_stamp') >= start )
+    if end is not None:
+        conditions.append( ds.field('time_stamp') < end )
+
+    condition = None
+    for c in conditions:
+        if c is not None:
+            condition = c if condition is None else condition & c
+
+    df = dataset.to_table( columns = columns, filter = condition ).to_pandas()
+
+    sort_by = [c for c in ('station', 'time_stamp') if c in df.columns]
+    if sort_by:
+        df = df.sort_values( sort_by, ignore_index = True )
+
+    return df
+
+
+##########################################################################################
+@profiled( bytes_from = 'df' )
+def write_station_history( df, store_path, station_id, row_group_size = 10000 ):
+    """
+    Adds the data of a station (as returned by get_station_data or
+    clean_station_data) to the local store, a Parquet dataset partitioned
+    by station, year and month.  Months already in the store are merged
+    with the new data, keeping the latest reading of each time stamp, and
+    rewritten sorted by time, so repeated downloads do not duplicate rows
+    and the row groups cover narrow ranges of time.  Use one kind of
+    dataframe (raw or cleaned) per store.
+
+    input:
+        df -- dataframe with a time_stamp column (Unix seconds)
+        store_path -- str or Path of the store, created if needed
+        station_id -- str
+        row_group_size -- int maximum number of rows in a row group
+
+    output:
+        int number of rows of the station in the months written
+    """
+    if df is None or len(df) == 0:
+        return 0
+
+    dates = pd.to_datetime( df['time_stamp'], unit = 's' )
+    new = df.assign( station = str(station_id), year = dates.dt.year.astype('int16'),
+                     month = dates.dt.month.astype('int8') )
+
+    # Rows already stored for the months in df
+    #
+    months = new[['year', 'month']].drop_duplicates()
+    stored = None
+    if Path(store_path).exists():
+        dataset = ds.dataset( store_path, format = 'parquet', partitioning = STORE_PARTITIONING )
+        in_months = None
+        for year, month in months.itertuples( index = False ):
+            in_month = (ds.field('year') == year) & (ds.field('month') == month)
+            in_months = in_month if in_months is None else in_months | in_month
+        stored = dataset.to_table( filter = (ds.field('station') == str(station_id)) &
+                                            in_months ).to_pandas()
+
+    if stored is not None and len(stored):
+        new = pd.concat( [stored.astype({'year': 'int16', 'month': 'int8'}), new],
+                         ignore_index = True )
+    new = new.drop_duplicates( 'time_stamp', keep = 'last' ).sort_values( 'time_stamp' )
+    new['station'] = new['station'].astype( str )
+
+    table = pa.Table.from_pandas( new, preserve_index = False )
+    table = table.set_column( table.schema.get_field_index('station'), 'station',
+                              table['station'].cast(pa.string()) )
+
+    ds.write_dataset( table, store_path, format = 'parquet',
+                      partitioning = STORE_PARTITIONING,
+                      existing_data_behavior = 'delete_matching',
+                      max_rows_per_group = row_group_size,
+                      min_rows_per_group = min( row_group_size, 1024 ),
+                      basename_template = 'part-{i}.parquet' )
+
+    logger.info( f"Stored {len(new)} rows of station {station_id} in {len(months)} months" )
+
+    return len(new)
@@ -5,11 +5,17 @@ import pandas as pd
 
 from datetime import datetime
 from io import StringIO
+
+from .profiling_lib import get_logger, profiled
 # from pytz import timezone
 
 
+logger = get_logger(__name__)
+
+
 
 ##########################################################################################
+@profiled
 def get_stations( api_url, my_keys, longitude, latitude, delta ):
     """
     This functions produces a dictionary where the keys are station
@@ -33,7 +39,8 @@ def get_stations( api_url, my_keys, longitude, latitude, delta ):
                       'selng': longitude+delta, 'selat': latitude-delta }
     
     response = requests.get(api_url, my_parameters)
-    print( f"Request was completed with code {response.status_code}.\n" )
+    log = logger.info if response.status_code == 200 else logger.warning
+    log( f"Request was completed with code {response.status_code}.\n" )
 
     data = json.loads(response.text)
     
@@ -45,6 +52,7 @@ def get_stations( api_url, my_keys, longitude, latitude, delta ):
 
 
 ##########################################################################################
+@profiled
 def get_info_for_station( api_url, my_station_id = '4395', my_parameters = {} ):
     """ 
     This function returns a dictionary with the info for a given PurpleAir station. 
@@ -61,12 +69,12 @@ def get_info_for_station( api_url, my_station_id = '4395', my_parameters = {} ):
     """
     built_url = f"{api_url}{my_station_id}/"
     response = requests.get(built_url, my_parameters)
-#     print(response.url)
-    print( f"Request was completed with code {response.status_code}.\n" )
+    logger.debug(response.url)
+    log = logger.info if response.status_code == 200 else logger.warning
+    log( f"Request was completed with code {response.status_code}.\n" )
     
     data = json.loads(response.text)
-    print(data.keys())
-    print()
+    logger.info( f"{data.keys()}\n" )
     if len(data) > 0:
         return data
     else:        
@@ -74,8 +82,9 @@ def get_info_for_station( api_url, my_station_id = '4395', my_parameters = {} ):
 
 
 ##########################################################################################
+@profiled( bytes_from = 'result' )
 def get_station_data( api_url, my_station_id = '4395', my_parameters = {}, 
-                      verbose = False ):
+                      verbose = False, store_path = None ):
     """ 
     This function returns a dataframe with the data obtained using the API.
     You can retrieve historical data by providing a start time_stamp.  
@@ -83,6 +92,10 @@ def get_station_data( api_url, my_station_id = '4395', my_parameters = {},
     
     If the response code is 429 you have been making too many request and 
     have to wait a bit.
+
+    If store_path is given, the data is also added to the local store of 
+    station histories (see station_lib.write_station_history), where it 
+    can be read back with station_lib.query_station_history.
     
     input:
         api_url -- a string with a web address
@@ -90,6 +103,7 @@ def get_station_data( api_url, my_station_id = '4395', my_parameters = {},
         my_parameters -- a dictionary with READ KEY, start and end 
                          time stamps, and strings of fields
         verbose -- a Boolean for determining whether to write extra stuff
+        store_path -- a string with the folder of the local store, or None
     
     output:
         a Pandas dataframe if data is retrieved or None
@@ -100,27 +114,45 @@ def get_station_data( api_url, my_station_id = '4395', my_parameters = {},
         print( f"Request was completed with code {response.status_code}.\n" )
 
     if response.status_code == 200:
-        return pd.read_csv( StringIO(response.text) )
+        df = pd.read_csv( StringIO(response.text) )
+        if store_path is not None:
+            # Imported here, so that pyarrow is only needed by the store
+            #
+            from .station_lib import write_station_history
+
+            write_station_history( df, store_path, my_station_id )
+
+        return df
     
     else:
-        print( f"Request was completed with code {response.status_code}.\n" )
-        print(response.text)
+        logger.warning( f"Request was completed with code {response.status_code}.\n" )
+        logger.warning(response.text)
         return None
 
 
 ##########################################################################################
-def clean_station_data( df ):
+@profiled( bytes_from = 'df' )
+def clean_station_data( df, store_path = None, station_id = None ):
     """ 
     This function returns a dataframe with the data provided by the 
     station and a human readable date and time of measurements.  
     Notice that data was also time ordered.
 
+    If store_path is given, the cleaned data is also added to the local 
+    store of station histories (see get_station_data).
+
     input:
         df -- dataframe with data returned by API
+        store_path -- a string with the folder of the local store, or None
+        station_id -- a string with the number of the station, needed 
+                      with store_path
     
     output:
         dataframe        
     """ 
+    if store_path is not None and station_id is None:
+        raise ValueError( "station_id is needed to write to the store" )
+
     if len(df) == 0:
         return None
     
@@ -130,5 +162,11 @@ def clean_station_data( df ):
         local_date_n_times.append( date_n_time )
 
     df['Date & Time'] = local_date_n_times
+    df = df.sort_values('time_stamp')
+
+    if store_path is not None:
+        from .station_lib import write_station_history
+
+        write_station_history( df, store_path, station_id )
 
-    return df.sort_values('time_stamp')
+    return df
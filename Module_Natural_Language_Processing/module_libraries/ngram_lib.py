@@ -0,0 +1,337 @@
+from collections import Counter
+from numpy import ( append, arange, asarray, bincount, diff, flatnonzero, fromiter, 
+                    iinfo, int32, int64, lexsort, log2, repeat, uint64, unique, zeros )
+from numpy.lib.stride_tricks import sliding_window_view
+from numpy.random import default_rng
+from scipy.special import xlogy
+
+from .nlp_lib import extract_words_from_lines, get_character_lines
+
+
+##############################################################################
+def encode_words( words, vocabulary = None ):
+    """
+    This function interns a list of words, e.g. the output of
+    extract_words_from_lines, as int32 token IDs.
+
+    inputs:
+        words -- iterable of str
+        vocabulary -- dict with word as key and ID as value, updated with
+                      new words, or None to start a new one
+
+    returns:
+        token_ids -- array of int32
+        vocabulary -- dict
+    """
+    if vocabulary is None:
+        vocabulary = {}
+
+    token_ids = fromiter( (vocabulary.setdefault(word, len(vocabulary)) for word in words),
+                          dtype = int32 )
+
+    return token_ids, vocabulary
+
+
+##############################################################################
+def get_ngram_windows( token_ids, n, offsets = None ):
+    """
+    This function returns a (n_ngrams, n) view of the n-grams in an array of
+    token IDs, without copying it.  When offsets are given, token_ids is the
+    concatenation of several documents, e.g. the characters in
+    vocab_lib.encode_corpus, and n-grams crossing a document boundary
+    are left out.
+
+    inputs:
+        token_ids -- array of int
+        n -- int
+        offsets -- array of int, tokens of the i-th document are
+                   token_ids[offsets[i]: offsets[i+1]], or None
+
+    returns:
+        windows -- array of int with shape (n_ngrams, n)
+        starts -- array of int with position of first token of each n-gram
+    """
+    token_ids = asarray(token_ids)
+    if len(token_ids) < n:
+        return zeros( (0, n), dtype = token_ids.dtype ), zeros( 0, dtype = int64 )
+
+    windows = sliding_window_view( token_ids, n )
+    starts = arange( len(windows) )
+
+    if offsets is not None:
+        offsets = asarray(offsets)
+        document_ends = repeat( offsets[1:], diff(offsets) )[:len(windows)]
+        starts = flatnonzero( starts + n - 1 < document_ends )
+        windows = windows[starts]
+
+    return windows, starts
+
+
+##############################################################################
+def encode_windows( windows, n_terms, hashed = False ):
+    """
+    This function encodes every row of a (n_ngrams, n) array of token IDs
+    as one 64 bit key.  Keys are exact, sum of token_id * n_terms**position, 
+    when n_terms**n fits in an int64, so they can be decoded with 
+    decode_ngram_keys.  Otherwise hashed must be True and keys are 64 bit 
+    hashes, good for counting with a count-min sketch but not decodable.
+
+    inputs:
+        windows -- array of int with shape (n_ngrams, n)
+        n_terms -- int size of vocabulary
+        hashed -- bool
+
+    returns:
+        keys -- array of int64 (uint64 if hashed)
+    """
+    n = windows.shape[1]
+
+    if hashed:
+        keys = zeros( len(windows), dtype = uint64 ) + uint64(0xCBF29CE484222325)
+        for j in range(n):
+            keys = (keys ^ windows[:, j].astype(uint64)) * uint64(0x100000001B3)
+        return keys
+
+    if n_terms ** n > iinfo(int64).max:
+        raise ValueError( f"{n}-grams over {n_terms} terms do not fit in int64 keys, "
+                          "use hashed = True" )
+
+    keys = zeros( len(windows), dtype = int64 )
+    for j in range(n):
+        keys = keys * n_terms + windows[:, j]
+
+    return keys
+
+
+##############################################################################
+def get_ngram_keys( token_ids, n, n_terms, offsets = None, hashed = False ):
+    """
+    This function returns the keys (see encode_windows) of all n-grams in 
+    an array of token IDs, leaving out n-grams that cross document 
+    boundaries when offsets are given (see get_ngram_windows).
+    """
+    windows, starts = get_ngram_windows( token_ids, n, offsets )
+
+    return encode_windows( windows, n_terms, hashed )
+
+
+##############################################################################
+def decode_ngram_keys( keys, n, n_terms ):
+    """
+    Returns the (n_keys, n) array of token IDs of exact n-gram keys.
+    """
+    keys = asarray( keys, dtype = int64 )
+    token_ids = zeros( (len(keys), n), dtype = int64 )
+
+    for j in range(n-1, -1, -1):
+        token_ids[:, j] = keys % n_terms
+        keys = keys // n_terms
+
+    return token_ids
+
+
+##############################################################################
+def count_ngrams( token_ids, n, n_terms, offsets = None ):
+    """
+    This function counts the n-grams of an array of token IDs.
+
+    inputs:
+        token_ids -- array of int
+        n -- int
+        n_terms -- int size of vocabulary
+        offsets -- array of int with document boundaries (see get_ngram_windows)
+
+    returns:
+        keys -- array of int64 with distinct n-gram keys (see get_ngram_keys)
+        counts -- array of int
+    """
+    return unique( get_ngram_keys(token_ids, n, n_terms, offsets), return_counts = True )
+
+
+##############################################################################
+def count_ngrams_by_document( token_ids, offsets, n, n_terms ):
+    """
+    This function counts the n-grams of every document, e.g. every
+    character or every play, in a single sort.
+
+    inputs:
+        token_ids -- array of int
+        offsets -- array of int with document boundaries (see get_ngram_windows)
+        n -- int
+        n_terms -- int size of vocabulary
+
+    returns:
+        documents -- array of int with index of document
+        keys -- array of int64 with n-gram keys
+        counts -- array of int with number of times n-gram appears in document
+    """
+    offsets = asarray(offsets)
+    windows, starts = get_ngram_windows( token_ids, n, offsets )
+    keys = encode_windows( windows, n_terms )
+    documents = repeat( arange(len(offsets) - 1), diff(offsets) )[starts]
+
+    order = lexsort( (keys, documents) )
+    keys = keys[order]
+    documents = documents[order]
+
+    is_first = zeros( len(keys), dtype = bool )
+    is_first[:1] = True
+    is_first[1:] = (keys[1:] != keys[:-1]) | (documents[1:] != documents[:-1])
+    first = flatnonzero(is_first)
+
+    return documents[first], keys[first], diff( append(first, len(keys)) )
+
+
+##############################################################################
+def create_count_min_sketch( width = 2**20, depth = 4, seed = 0 ):
+    """
+    This function creates an empty count-min sketch, which counts keys in
+    bounded memory (depth x width counters).  Estimated counts are never
+    lower than the true count, and are higher by at most
+    e / width * (total count) with probability 1 - exp(-depth).
+
+    inputs:
+        width -- int, power of 2
+        depth -- int number of hash functions
+        seed -- int for random hash functions
+
+    returns:
+        sketch -- dict with keys {table, multipliers, shift}
+    """
+    if width & (width - 1):
+        raise ValueError( "width of count-min sketch must be a power of 2" )
+
+    # Random odd multipliers for multiply-shift hashing
+    #
+    multipliers = default_rng(seed).integers( 0, 2**63, size = depth, dtype = uint64 )
+    multipliers = multipliers * uint64(2) + uint64(1)
+
+    return { 'table': zeros( (depth, width), dtype = int64 ),
+             'multipliers': multipliers,
+             'shift': uint64( 64 - int(log2(width)) ) }
+
+
+##############################################################################
+def get_sketch_columns( sketch, keys ):
+    """
+    Returns the (depth, n_keys) array with the counter of each key in each
+    row of the sketch (multiply-shift hashing).
+    """
+    keys = asarray(keys).astype(uint64)
+
+    return (sketch['multipliers'][:, None] * keys[None, :]) >> sketch['shift']
+
+
+##############################################################################
+def update_count_min_sketch( sketch, keys, counts = None ):
+    """
+    This function adds keys (each counted once, or counts times) to a
+    count-min sketch in place.  Keys can be added in chunks, e.g. one
+    character or one play at a time, and sketches created with the same 
+    parameters can be merged by adding their tables.
+
+    inputs:
+        sketch -- dict returned by create_count_min_sketch
+        keys -- array of int64 or uint64 n-gram keys
+        counts -- array of int or None
+
+    returns:
+        sketch -- dict
+    """
+    width = sketch['table'].shape[1]
+    for row, columns in enumerate( get_sketch_columns(sketch, keys) ):
+        sketch['table'][row] += bincount( columns.astype(int64), weights = counts, 
+                                          minlength = width ).astype(int64)
+
+    return sketch
+
+
+##############################################################################
+def query_count_min_sketch( sketch, keys ):
+    """
+    Returns the estimated counts of keys in a count-min sketch.
+    """
+    columns = get_sketch_columns( sketch, keys ).astype(int64)
+    rows = arange( len(columns) )[:, None]
+
+    return sketch['table'][rows, columns].min( axis = 0 )
+
+
+##############################################################################
+def collocation_table( token_ids, n_terms, offsets = None, min_count = 5, terms = None ):
+    """
+    This function scores every bigram that appears at least min_count
+    times as a collocation, using pointwise mutual information and
+    Dunning's log-likelihood ratio (G2) of the 2 x 2 contingency table of
+    first and second word.
+
+    inputs:
+        token_ids -- array of int
+        n_terms -- int size of vocabulary
+        offsets -- array of int with document boundaries (see get_ngram_windows)
+        min_count -- int
+        terms -- list of str with word of each token ID, or None
+
+    returns:
+        table -- dict of arrays sorted by decreasing log-likelihood, with
+                 keys {first, second, count, pmi, log_likelihood}, and
+                 {first_word, second_word} when terms are given
+    """
+    keys, counts = count_ngrams( token_ids, 2, n_terms, offsets )
+    first, second = decode_ngram_keys( keys, 2, n_terms ).T
+
+    # Marginal counts of words as first and as second element of bigrams
+    #
+    n_bigrams = counts.sum()
+    first_counts = bincount( first, weights = counts, minlength = n_terms )
+    second_counts = bincount( second, weights = counts, minlength = n_terms )
+
+    keep = counts >= min_count
+    first, second, o11 = first[keep], second[keep], counts[keep].astype(float)
+    row1 = first_counts[first]
+    column1 = second_counts[second]
+
+    observed = [ o11, row1 - o11, column1 - o11, n_bigrams - row1 - column1 + o11 ]
+    expected = [ row1 * column1, row1 * (n_bigrams - column1),
+                 (n_bigrams - row1) * column1, (n_bigrams - row1) * (n_bigrams - column1) ]
+    log_likelihood = 2 * sum( xlogy(o, o) - xlogy(o, e / n_bigrams)
+                              for o, e in zip(observed, expected) )
+
+    pmi = log2( o11 * n_bigrams / (row1 * column1) )
+
+    order = log_likelihood.argsort()[::-1]
+    table = { 'first': first[order], 'second': second[order],
+              'count': o11[order].astype(int64),
+              'pmi': pmi[order], 'log_likelihood': log_likelihood[order] }
+    if terms is not None:
+        table['first_word'] = [terms[i] for i in table['first']]
+        table['second_word'] = [terms[i] for i in table['second']]
+
+    return table
+
+
+##############################################################################
+def count_character_ngrams( character, the_play, n = 2, speeches = None ):
+    """
+    This function counts the n-grams in the lines of a character, as
+    returned by get_character_lines and extract_words_from_lines.
+
+    inputs:
+        character -- str
+        the_play -- list of str
+        n -- int
+        speeches -- dict returned by nlp_lib.segment_speakers(the_play) or None
+
+    returns:
+        collections.Counter object with tuples of n words as keys
+    """
+    character_lines = get_character_lines( character, the_play, speeches )
+    words = extract_words_from_lines( character, character_lines, verbose = False )
+    token_ids, vocabulary = encode_words(words)
+    terms = list(vocabulary)
+
+    keys, counts = count_ngrams( token_ids, n, max(len(terms), 1) )
+    ngrams = decode_ngram_keys( keys, n, max(len(terms), 1) )
+
+    return Counter( { tuple(terms[i] for i in ngram): int(count)
+                      for ngram, count in zip(ngrams, counts) } )
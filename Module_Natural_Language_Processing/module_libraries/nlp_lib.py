@@ -6,15 +6,44 @@ __maintainer__ = "Amaral LAN"
 __email__ = "amaral@northwestern.edu"
 __status__ = "alpha"
 
+import json
+import re
+
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 
 from collections import Counter
+from functools import partial
+from itertools import islice, repeat
+from multiprocessing import Pool
+from numpy import ( append, arange, argsort, array, asarray, bincount, concatenate, 
+                    cumsum, exp, flatnonzero, frombuffer, fromiter, int32, int64, 
+                    load, log, memmap, polyfit, save, sort, uint8, unique, zeros )
 from pathlib import Path
-from random import random
 from string import punctuation, whitespace
 
+from .cache_lib import memoized
+from .profiling_lib import profiled
+
+
+# A speech starts with a line '  SPEAKER. text' and continues on the lines
+# indented by four spaces
+#
+SPEAKER_PATTERN = re.compile( r'^  ([A-Z][^.a-z\n]*)\.' )
+
+# Dramatis Personae are listed between these two patterns
+#
+PERSONAE_PATTERN = 'Dramatis Personae'
+ELECT_PATTERN = '<<THIS ELECTRONIC VERSION OF THE COMPLETE WORKS OF WILLIAM'
+
+# Arrays saved by build_corpus_index, they are memory-mapped by load_corpus
+#
+INDEX_ARRAYS = [ 'line_offsets', 'speaker_spans', 'speaker_offsets', 
+                 'postings', 'postings_offsets' ]
 
+
+@profiled
+@memoized( depends_on = lambda folder: [Path(folder) / 'Shakespeare.txt'] )
 def read_complete_works( folder = Path.cwd() / 'Data' ):
     """
     This function reads the file with Complete Works of William Shakespeare
@@ -32,10 +61,28 @@ def read_complete_works( folder = Path.cwd() / 'Data' ):
     file_path = folder / 'Shakespeare.txt'
     with open( file_path, 'r', encoding = 'UTF-8' ) as file_in:
         complete_works = file_in.readlines()
+
+    return complete_works, find_plays(complete_works)
+
+
+@profiled( bytes_from = 'complete_works' )
+def find_plays( complete_works ):
+    """
+    This function takes the list of lines in the file with the Complete Works
+    of William Shakespeare and returns a dictionary with information about
+    each of the works included.
     
-    elect_pattern = '<<THIS ELECTRONIC VERSION OF THE COMPLETE WORKS OF WILLIAM'
+    inputs:
+        complete_works -- list of str
+        
+    returns:
+        plays -- dict with play title as key and a dictionary with keys {year, first_line, last_line} as value,
+                 plays with Dramatis Personae also have keys {personae_first_line, personae_last_line}
+    """
+    elect_pattern = ELECT_PATTERN
     is_inside_speech = False
     found_play = False
+    found_personae = False
 
     plays = {}
     for i, line in enumerate(complete_works):
@@ -67,59 +114,429 @@ def read_complete_works( folder = Path.cwd() / 'Data' ):
                 else:    
                     title_play = complete_works[i+2].strip()
                     plays[title_play] = {'year': year_play, 'first_line': i+2}
+                found_personae = False
                 continue
+        
+        # Dramatis Personae go from the line after the pattern to the next 
+        # electronic version notice, as in get_characters
+        #
+        if found_play and not found_personae:
+            if PERSONAE_PATTERN in line:
+                plays[title_play]['personae_first_line'] = i + 1
+                continue
+            
+            if elect_pattern in line:
+                found_personae = True
+                if 'personae_first_line' in plays[title_play]:
+                    plays[title_play]['personae_last_line'] = i
             
         if found_play and line.strip() == 'THE END':
             plays[title_play]['last_line'] = i
             found_play = False
             is_inside_speech = False
 
-    return complete_works, plays
+    return plays
 
 
-def get_characters(the_play):
+def split_lines( text ):
     """
-    This function takes as input a list of lines from
-    a play in Shakespeare's Complete Works text file 
-    from Project Gutenberg and returns a dictionary with 
-    names of the characgters in the play and their
-    description.
+    This function splits a text into a list of lines, each ending with a 
+    newline character, exactly as file.readlines() does.
     
     inputs:
-        play_name -- str
+        text -- str
         
     returns:
-        personae -- dict with character name as key
-                    and character description as value
+        lines -- list of str
+    """
+    lines = text.replace('\r\n', '\n').split('\n')
+    last_line = lines.pop()
+    
+    lines = [line + '\n' for line in lines]
+    if last_line:
+        lines.append( last_line )
+        
+    return lines
+
+
+def segment_speakers( the_play ):
+    """
+    This function walks once through the lines of a play and attributes 
+    every speech to its speaker.
+    
+    inputs:
+        the_play -- list of str
+        
+    returns:
+        speeches -- dict with speaker name as key and a list of tuples 
+                    (first_line, last_line) as value, last_line is not
+                    part of the speech
+    """
+    speeches = {}
+    speaker = None
+    
+    for i, line in enumerate(the_play):
+        match = SPEAKER_PATTERN.match(line)
+        if match:
+            if speaker is not None:
+                speeches.setdefault(speaker, []).append( (start_line, i) )
+            speaker = match.group(1)
+            start_line = i
+            continue
+        
+        if speaker is not None and not line.startswith(' '*4):
+            speeches.setdefault(speaker, []).append( (start_line, i) )
+            speaker = None
+            
+    if speaker is not None:
+        speeches.setdefault(speaker, []).append( (start_line, len(the_play)) )
+        
+    return speeches
+
+
+def flatten_speeches( speeches, first_line = 0 ):
+    """
+    This function converts the dictionary returned by segment_speakers
+    into flat arrays: the spans of all speeches, grouped by speaker, and 
+    an offsets table so that the spans of the i-th speaker are
+    spans[offsets[i]: offsets[i+1]].
+    
+    inputs:
+        speeches -- dict returned by segment_speakers
+        first_line -- int added to all spans, e.g. first line of play in
+                      the complete works
+        
+    returns:
+        speakers -- list of str
+        spans -- array of int with shape (n_speeches, 2)
+        offsets -- array of int with length len(speakers) + 1
+    """
+    speakers = list(speeches)
+    
+    offsets = zeros( len(speakers) + 1, dtype = int64 )
+    offsets[1:] = cumsum( [len(speeches[speaker]) for speaker in speakers] )
+    
+    spans = array( [span for speaker in speakers for span in speeches[speaker]], 
+                   dtype = int32 ).reshape(-1, 2)
+    
+    return speakers, spans + first_line, offsets
+
+
+def get_speech_text( character, speech ):
+    """
+    This function takes the name of a character and the lines of one of
+    their speeches and returns the stripped lines without the name of 
+    the speaker.
+    
+    inputs:
+        character -- str
+        speech -- list of str
+        
+    returns:
+        list of str
+    """
+    start_string = ' '*2 + character.upper() + '.'
+    
+    return ( [speech[0].replace(start_string, '').strip()] + 
+             [line.strip() for line in speech[1:]] )
+
+
+@profiled
+def build_corpus_index( folder = Path.cwd() / 'Data', index_folder = None ):
+    """
+    This function parses the file with the Complete Works of William 
+    Shakespeare once and saves an index to disk with the byte offset of 
+    every line, the line spans of the speeches of every speaker in every 
+    play, the cast of every play (see get_cast), and the lines in which 
+    every token appears.
+    
+    inputs:
+        folder -- pathlib Path for folder where 'Shakespeare.txt' can be found
+        index_folder -- pathlib Path for folder where index is saved,
+                        defaults to folder / 'Shakespeare_index'
+        
+    returns:
+        index_folder -- pathlib Path
     """
-    # Get relevant lines
+    file_path = folder / 'Shakespeare.txt'
+    if index_folder is None:
+        index_folder = folder / 'Shakespeare_index'
+    index_folder.mkdir( parents = True, exist_ok = True )
+
+    raw_text = file_path.read_bytes()
+    complete_works = split_lines( raw_text.decode('UTF-8') )
+    plays = find_plays(complete_works)
+    
+    # Byte offset of the start of every line, plus the end of the file
     #
-    start_pattern = 'Dramatis Personae'
-    end_pattern = '<<THIS ELECTRONIC VERSION OF THE COMPLETE WORKS OF WILLIAM'
+    line_offsets = flatnonzero( frombuffer(raw_text, dtype = uint8) == ord('\n') ) + 1
+    line_offsets = append( 0, line_offsets ).astype(int64)
+    if line_offsets[-1] != len(raw_text):
+        line_offsets = append( line_offsets, len(raw_text) )
 
-    found_personae = False
+    # Speaker -> line spans, speakers are identified by (title, name)
+    #
+    speakers = []
+    speaker_spans = [ zeros( (0, 2), dtype = int32 ) ]
+    speaker_offsets = [ zeros( 1, dtype = int64 ) ]
+    casts = {}
+    for title, play in plays.items():
+        if 'last_line' not in play:
+            continue
+        the_play = complete_works[play['first_line']: play['last_line'] + 1]
+        speeches = segment_speakers(the_play)
+        
+        play_speakers, spans, offsets = flatten_speeches( speeches, play['first_line'] )
+        speakers.extend( [title, speaker] for speaker in play_speakers )
+        speaker_offsets.append( offsets[1:] + speaker_offsets[-1][-1] )
+        speaker_spans.append( spans )
+        
+        personae_text = complete_works[play.get('personae_first_line', 0): 
+                                       play.get('personae_last_line', 0)]
+        casts[title] = get_cast( personae_text, speeches, play['first_line'] )
+
+    # Token -> lines in which it appears
+    #
+    vocabulary = {}
+    token_ids = []
+    line_ids = []
+    for i, line in enumerate(complete_works):
+        line_tokens = set( word.rstrip(punctuation).lower() for word in line.split() )
+        line_tokens.discard('')
+        
+        for token in line_tokens:
+            token_ids.append( vocabulary.setdefault(token, len(vocabulary)) )
+            line_ids.append( i )
+
+    token_ids = array( token_ids, dtype = int32 )
+    postings = array( line_ids, dtype = int32 )[argsort(token_ids, kind = 'stable')]
+    postings_offsets = zeros( len(vocabulary) + 1, dtype = int64 )
+    postings_offsets[1:] = cumsum( bincount(token_ids, minlength = len(vocabulary)) )
+
+    arrays = { 'line_offsets': line_offsets,
+               'speaker_spans': concatenate(speaker_spans),
+               'speaker_offsets': concatenate(speaker_offsets),
+               'postings': postings,
+               'postings_offsets': postings_offsets }
+    for name in INDEX_ARRAYS:
+        save( index_folder / f"{name}.npy", arrays[name] )
+    
+    stat = file_path.stat()
+    meta = { 'source': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns},
+             'plays': plays,
+             'casts': casts,
+             'speakers': speakers,
+             'vocabulary': list(vocabulary) }
+    with open( index_folder / 'meta.json', 'w', encoding = 'UTF-8' ) as file_out:
+        json.dump( meta, file_out )
+        
+    return index_folder
+
+
+@profiled
+def load_corpus( folder = Path.cwd() / 'Data', index_folder = None, rebuild = False ):
+    """
+    This function returns the Complete Works of William Shakespeare as a
+    corpus dictionary.  The text and the index arrays are memory-mapped, 
+    so nothing is parsed unless the index is missing, out of date with 
+    'Shakespeare.txt', or rebuild is True.
+    
+    inputs:
+        folder -- pathlib Path for folder where 'Shakespeare.txt' can be found
+        index_folder -- pathlib Path for folder with index,
+                        defaults to folder / 'Shakespeare_index'
+        rebuild -- bool for forcing the index to be built again
+        
+    returns:
+        corpus -- dict with keys {text, plays, casts, speakers, vocabulary} 
+                  and the index arrays (see build_corpus_index)
+    """
+    file_path = folder / 'Shakespeare.txt'
+    if index_folder is None:
+        index_folder = folder / 'Shakespeare_index'
+
+    meta = None
+    if not rebuild and (index_folder / 'meta.json').exists():
+        with open( index_folder / 'meta.json', 'r', encoding = 'UTF-8' ) as file_in:
+            meta = json.load(file_in)
+        stat = file_path.stat()
+        if ( meta['source'] != {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns} or
+             'casts' not in meta ):
+            meta = None
+
+    if meta is None:
+        build_corpus_index( folder, index_folder )
+        with open( index_folder / 'meta.json', 'r', encoding = 'UTF-8' ) as file_in:
+            meta = json.load(file_in)
+
+    corpus = { 'text': memmap( file_path, dtype = uint8, mode = 'r' ),
+               'plays': meta['plays'],
+               'casts': meta['casts'],
+               'speakers': { (title, speaker): i 
+                             for i, (title, speaker) in enumerate(meta['speakers']) },
+               'vocabulary': { token: i for i, token in enumerate(meta['vocabulary']) } }
+    for name in INDEX_ARRAYS:
+        corpus[name] = load( index_folder / f"{name}.npy", mmap_mode = 'r' )
+
+    return corpus
+
+
+def get_corpus_lines( corpus, first_line, last_line ):
+    """
+    This function returns the lines first_line to last_line (included) 
+    of the corpus, as they would appear in the list returned by 
+    read_complete_works.
+    
+    inputs:
+        corpus -- dict returned by load_corpus
+        first_line -- int
+        last_line -- int
+        
+    returns:
+        list of str
+    """
+    line_offsets = corpus['line_offsets']
+    last_line = min( last_line, len(line_offsets) - 2 )
+    if last_line < first_line:
+        return []
+    
+    raw_text = bytes( corpus['text'][line_offsets[first_line]: line_offsets[last_line + 1]] )
+    
+    return split_lines( raw_text.decode('UTF-8') )
+
+
+def get_play_lines( corpus, title ):
+    """
+    This function returns the lines of a play in the corpus.
+    
+    inputs:
+        corpus -- dict returned by load_corpus
+        title -- str with title of play, as in corpus['plays']
+        
+    returns:
+        the_play -- list of str
+    """
+    play = corpus['plays'][title]
+    
+    return get_corpus_lines( corpus, play['first_line'], play['last_line'] )
+
+
+def get_speaker_spans( corpus, title, character ):
+    """
+    This function returns the spans of lines in the corpus with the 
+    speeches of a character in a play.
+    
+    inputs:
+        corpus -- dict returned by load_corpus
+        title -- str with title of play
+        character -- str
+        
+    returns:
+        array of int with shape (n_speeches, 2) with first line and the line 
+        after the last line of each speech
+    """
+    i = corpus['speakers'].get( (title, character.upper()) )
+    if i is None:
+        return zeros( (0, 2), dtype = int32 )
+    
+    offsets = corpus['speaker_offsets']
+    
+    return corpus['speaker_spans'][offsets[i]: offsets[i+1]]
+
+
+def get_speaker_lines( corpus, title, character ):
+    """
+    This function returns the same list of lines as 
+    get_character_lines(character, the_play), reading from the corpus only 
+    the lines spoken by the character.
+    
+    inputs:
+        corpus -- dict returned by load_corpus
+        title -- str with title of play
+        character -- str
+        
+    returns:
+        character_lines -- list of str
+    """
+    character_lines = []
+    for first_line, last_line in get_speaker_spans( corpus, title, character ):
+        speech = get_corpus_lines( corpus, first_line, last_line - 1 )
+        character_lines.extend( get_speech_text(character, speech) )
+        
+    return character_lines
+
+
+@profiled
+def find_token_lines( corpus, token ):
+    """
+    This function returns the numbers of the lines of the corpus in which
+    a token appears.
+    
+    inputs:
+        corpus -- dict returned by load_corpus
+        token -- str
+        
+    returns:
+        array of int
+    """
+    i = corpus['vocabulary'].get( token.rstrip(punctuation).lower() )
+    if i is None:
+        return zeros( 0, dtype = int32 )
+    
+    offsets = corpus['postings_offsets']
+    
+    return corpus['postings'][offsets[i]: offsets[i+1]]
+
+
+def find_personae(the_play):
+    """
+    This function takes as input a list of lines from a play and returns
+    the span of lines with the Dramatis Personae: from the line after 
+    'Dramatis Personae' to the next electronic version notice.
+    
+    inputs:
+        the_play -- list of str
+        
+    returns:
+        first_line -- int
+        last_line -- int, not part of the Dramatis Personae
+                     (first_line == last_line == 0 when play has none)
+    """
+    first_line = None
     for i, line in enumerate(the_play):
-        if start_pattern in line:
-            start_line = i + 1
+        if PERSONAE_PATTERN in line:
+            first_line = i + 1
             continue 
 
-        if end_pattern in line:
-            end_line = i
-            break
-
-    personae_text = the_play[start_line: end_line]
-    print( personae_text )
-    print()
+        if ELECT_PATTERN in line:
+            if first_line is None:
+                break
+            return first_line, i
+        
+    if first_line is None:
+        return 0, 0
     
+    return first_line, len(the_play)
+
+
+def parse_personae(personae_text):
+    """
+    This function takes the lines of a Dramatis Personae and returns a 
+    dictionary with the names of the characters and their description.
     
+    inputs:
+        personae_text -- list of str
+        
+    returns:
+        personae -- dict with character name as key
+                    and character description as value
+    """
     personae = {}  
 
     for i, line in enumerate(personae_text):
         if line == '\n':
             continue
 
-#         print(f"{i:>3} -- {line.strip()}")
-
         # Split by comma, take first item if is all caps, 
         # join the rest
         #
@@ -130,48 +547,263 @@ def get_characters(the_play):
             description = ','.join(items[1:]).strip()
             personae[name] = description
 
-    print( personae )
+    return personae
+
+
+def get_cast(personae_text, speeches, first_line = 0):
+    """
+    This function builds the cast table of a play from its Dramatis 
+    Personae and its segmentation by speaker.
+    
+    inputs:
+        personae_text -- list of str
+        speeches -- dict returned by segment_speakers
+        first_line -- int added to line numbers, e.g. first line of play in
+                      the complete works
+        
+    returns:
+        cast -- list of dicts with keys {name, description, first_line, 
+                last_line}, the span of lines (last_line excluded) of the 
+                first speech of the character or None if the character 
+                never speaks under that name
+    """
+    cast = []
+    for name, description in parse_personae(personae_text).items():
+        if not name:
+            continue
+        
+        first_speech = speeches.get(name, [(None, None)])[0]
+        if first_speech[0] is not None:
+            first_speech = [first_line + line for line in first_speech]
+            
+        cast.append( { 'name': name, 'description': description,
+                       'first_line': first_speech[0], 'last_line': first_speech[1] } )
+        
+    return cast
+
+
+@profiled( bytes_from = 'the_play' )
+def get_characters(the_play, verbose = False):
+    """
+    This function takes as input a list of lines from
+    a play in Shakespeare's Complete Works text file 
+    from Project Gutenberg and returns a dictionary with 
+    names of the characgters in the play and their
+    description.
+    
+    inputs:
+        the_play -- list of str
+        verbose -- bool for printing Dramatis Personae and dictionary
+        
+    returns:
+        personae -- dict with character name as key
+                    and character description as value, empty if 
+                    the play has no Dramatis Personae
+    """
+    first_line, last_line = find_personae(the_play)
+    personae_text = the_play[first_line: last_line]
+    personae = parse_personae(personae_text)
+    
+    if verbose:
+        print( personae_text )
+        print()
+        print( personae )
 
     return personae
 
 
-def get_character_lines(character, the_play):
+@profiled
+def get_character_lines(character, the_play, speeches = None):
     """
     This function takes the name of a character and the lines from the play
     extracted from GP's Complete Works of William Shakespeare and returns
-    a list with all the lines from that character in the play
+    a list with all the lines from that character in the play.
+    
+    The play is segmented by speaker in one pass.  When asking for several 
+    characters of the same play, pass speeches = segment_speakers(the_play) 
+    so the play is walked through only once.
     
     inputs:
         character -- str
         the_play -- list of str
+        speeches -- dict returned by segment_speakers(the_play) or None
         
     returns:
         character_lines -- list of str
     """
+    if speeches is None:
+        speeches = segment_speakers(the_play)
+    
     character_lines = []
-    character = character.upper()
+    for first_line, last_line in speeches.get(character.upper(), []):
+        character_lines.extend( get_speech_text(character, the_play[first_line: last_line]) )
     
-    start_string = ' '*2 + character
-    continuation_string = ' '*4
+    return character_lines
+
+
+def get_all_character_lines(the_play):
+    """
+    This function takes the lines from a play and returns the lines of
+    every character, walking through the play only once.
     
-    found_lines = False
-    for i, line in enumerate(the_play):
-        if line.split('.')[0] == start_string:
-            found_lines = True
-            character_lines.append(line.replace(start_string+ '.', '').strip())
-            continue
+    inputs:
+        the_play -- list of str
+        
+    returns:
+        dict with character name as key and list of str, as returned by 
+        get_character_lines, as value
+    """
+    speeches = segment_speakers(the_play)
+    
+    return { character: get_character_lines(character, the_play, speeches)
+             for character in speeches }
 
-        if found_lines:
-            if line[:len(continuation_string)] == continuation_string:
-                character_lines.append(line.strip())
-            else:
-                found_lines = False
-                continue 
+
+def tokenize_lines(lines, punct = punctuation, character = None, chunk_size = 10000):
+    """
+    This generator takes an iterable of lines and yields their words, 
+    lower-cased and with trailing punctuation stripped, i.e., the same words 
+    as word.rstrip(punct).lower() for word in line.split().
     
-    return character_lines
+    Lines are processed in chunks of chunk_size lines, so that splitting and 
+    stripping run over a whole chunk at once while lines and words never 
+    need to be all in memory.
+    
+    inputs:
+        lines -- iterable of str, e.g. a list or an open file
+        punct -- str with punctuation characters to be stripped
+        character -- str with name of speaker to be removed from lines or None
+        chunk_size -- int number of lines processed at once
+        
+    yields:
+        word -- str
+    """
+    character_string = character.upper() + '.' if character else None
+    lines = iter(lines)
+    
+    while True:
+        chunk = list( islice(lines, chunk_size) )
+        if not chunk:
+            return
+        
+        chunk = '\n'.join(chunk)
+        if character_string:
+            chunk = chunk.replace(character_string, ' ')
+        
+        yield from map( str.rstrip, chunk.lower().split(), repeat(punct) )
+
+
+@profiled( bytes_from = 'lines' )
+def count_words(lines, punct = punctuation, character = None, counter = None):
+    """
+    This function counts the words in an iterable of lines as they are
+    tokenized, so memory grows with the size of the vocabulary and not 
+    with the length of the text.
+    
+    inputs:
+        lines -- iterable of str
+        punct -- str with punctuation characters to be stripped
+        character -- str with name of speaker to be removed from lines or None
+        counter -- collections.Counter object to be updated or None
+        
+    returns:
+        counter -- collections.Counter object
+    """
+    if counter is None:
+        counter = Counter()
+    counter.update( tokenize_lines(lines, punct, character) )
+    
+    return counter
+
+
+@profiled( bytes_from = 'file_path' )
+def count_file_words(file_path, punct = punctuation):
+    """
+    This function counts the words in a text file reading one line at a time.
+    
+    inputs:
+        file_path -- pathlib Path
+        punct -- str with punctuation characters to be stripped
+        
+    returns:
+        counter -- collections.Counter object
+    """
+    with open( file_path, 'r', encoding = 'UTF-8' ) as file_in:
+        return count_words(file_in, punct)
+
+
+@profiled
+def count_play_words(title, folder = Path.cwd() / 'Data', punct = punctuation):
+    """
+    This function counts the words in a play of the Complete Works, reading
+    only the lines of that play from the memory-mapped corpus.
+    
+    inputs:
+        title -- str with title of play
+        folder -- pathlib Path for folder where 'Shakespeare.txt' can be found
+        punct -- str with punctuation characters to be stripped
+        
+    returns:
+        counter -- collections.Counter object
+    """
+    return count_words( get_play_lines(load_corpus(folder), title), punct )
 
 
-def extract_words_from_lines(character, character_lines, punct = punctuation):
+@profiled
+def count_words_in_parallel(count_function, shards, n_processes = None, merge = True):
+    """
+    This function runs count_function on every shard in a pool of processes
+    and merges the counts.
+    
+    inputs:
+        count_function -- function taking a shard and returning a Counter
+        shards -- list of shards, e.g. file paths or play titles
+        n_processes -- int number of processes, None uses all cores
+        merge -- bool, if False the counts of each shard are returned
+        
+    returns:
+        counter -- collections.Counter object with merged counts, or dict 
+                   with shard as key and Counter as value if merge is False
+    """
+    with Pool( n_processes ) as pool:
+        counters = pool.map( count_function, shards, chunksize = 1 )
+        
+    if not merge:
+        return dict( zip(shards, counters) )
+    
+    counter = Counter()
+    for shard_counter in counters:
+        counter.update( shard_counter )
+        
+    return counter
+
+
+def count_words_by_file(file_paths, punct = punctuation, n_processes = None, merge = True):
+    """
+    This function counts the words in many text files, one file per task
+    in a pool of processes.  See count_words_in_parallel.
+    """
+    return count_words_in_parallel( partial(count_file_words, punct = punct), 
+                                    list(file_paths), n_processes, merge )
+
+
+def count_words_by_play(folder = Path.cwd() / 'Data', titles = None, punct = punctuation, 
+                        n_processes = None, merge = True):
+    """
+    This function counts the words in the plays of the Complete Works, one 
+    play per task in a pool of processes.  All plays are counted if titles 
+    is None.  See count_words_in_parallel.
+    """
+    corpus = load_corpus(folder)
+    if titles is None:
+        titles = [title for title, play in corpus['plays'].items() if 'last_line' in play]
+        
+    return count_words_in_parallel( partial(count_play_words, folder = folder, punct = punct), 
+                                    list(titles), n_processes, merge )
+
+
+@profiled( bytes_from = 'character_lines' )
+def extract_words_from_lines(character, character_lines, punct = punctuation, verbose = False):
     """
     This function takes the name of a character and a list 
     with all the lines from a character in the play and returns 
@@ -181,63 +813,92 @@ def extract_words_from_lines(character, character_lines, punct = punctuation):
         character -- str
         character_lines -- list of str
         punct -- str with punctuation characters to be stripped
+        verbose -- bool for printing number of words and unique words
         
     returns:
         character_words -- list of str
     """
-    character_words = []
-    character = character.upper()
-    character_string = character + '.'
-    
-    for i, line in enumerate(character_lines):
-        if character_string in line:
-            line = line.replace(character_string, ' ')
+    character_words = list( tokenize_lines(character_lines, punct, character) )
 
-        line_words = line.strip().split()
+    if verbose:
+        character = character.upper()
+        print(f"{character.capitalize()}'s lines comprise {len(character_words)} words.\n")
+        print(f"{character.capitalize()}'s lines comprise {len(set(character_words))} unique words.\n")
+    
+    return character_words
 
-        for word in line_words:
-            character_words.append(word.rstrip(punct).lower())
 
-    print(f"{character.capitalize()}'s lines comprise {len(character_words)} words.\n")
-    print(f"{character.capitalize()}'s lines comprise {len(set(character_words))} unique words.\n")
+@profiled
+def word_frequency_statistics(counts, rank_min = 1, rank_max = None):
+    """
+    This function takes the number of occurrences of every word and 
+    calculates the survival function of the number of occurrences, the 
+    rank-frequency curve, and the exponent of Zipf's law, frequency ~ 
+    rank**(-zipf_exponent), fitted by least squares in log-log scale 
+    between ranks rank_min and rank_max.
     
-    return character_words
+    inputs:
+        counts -- collection.Counter object or array of int
+        rank_min -- int lowest rank used in fit
+        rank_max -- int highest rank used in fit, None uses all ranks
+        
+    returns:
+        statistics -- dict with keys 
+                      k_values -- array of distinct numbers of occurrences
+                      survival_function -- array with number of words 
+                                           occurring k_values or more times
+                      ranks -- array of int starting at 1
+                      frequencies -- array with number of occurrences of word 
+                                     at each rank
+                      zipf_exponent -- float
+                      zipf_prefactor -- float
+    """
+    if isinstance(counts, dict):
+        counts = fromiter( counts.values(), dtype = int64, count = len(counts) )
+    counts = asarray(counts)
+    
+    k_values, n_words = unique( counts, return_counts = True )
+    survival_function = cumsum( n_words[::-1] )[::-1]
+    
+    frequencies = sort(counts)[::-1]
+    ranks = arange( 1, len(frequencies) + 1 )
+    
+    zipf_exponent = zipf_prefactor = float('nan')
+    fit = slice( rank_min - 1, rank_max )
+    if len(ranks[fit]) > 1:
+        slope, intercept = polyfit( log(ranks[fit]), log(frequencies[fit]), 1 )
+        zipf_exponent = -slope
+        zipf_prefactor = exp(intercept)
+    
+    return { 'k_values': k_values, 
+             'survival_function': survival_function,
+             'ranks': ranks, 
+             'frequencies': frequencies,
+             'zipf_exponent': zipf_exponent,
+             'zipf_prefactor': zipf_prefactor }
 
 
-def plot_survival_function_word_frequency(corpus_name, counter, ax):
+def plot_survival_function_word_frequency(corpus_name, counter, ax, font_size = 15):
     """
     This function takes a courpus name, a collection.Counter object
     and a matplotlib ax object and calculates the survival function
     from the counter data and modifies the ax object.
     
     inputs:
-        corpus_name -- str
-        counter -- collection.Counter object
+        corpus_name -- str used as label of curve
+        counter -- collection.Counter object or array of int with counts
         ax -- matplotlib ax object
+        font_size -- int for legend
     """
-    # calculate survival function
-    #
-    counts = list( dict(counter).values() )
-    k_values = []
-    survival_function = []
-
-    n = len(counts)
-    for k in sorted(counts):
-        if k not in k_values:
-            k_values.append(k)
-            survival_function.append(n)
-            n -= 1
-        else:
-            n -= 1
+    statistics = word_frequency_statistics(counter)
 
     # plot data
     #
     ax.loglog()
-    ax.plot( k_values, survival_function, 'r-', lw = 2, label = 'Othello' )
-    ax.legend(loc = 'best', frameon = False, fontsize = my_fontsize)
+    ax.plot( statistics['k_values'], statistics['survival_function'], 'r-', 
+             lw = 2, label = corpus_name )
+    ax.legend(loc = 'best', frameon = False, fontsize = font_size)
 
-    plt.tight_layout()  
+    ax.figure.tight_layout()  
     
     return
-
-
@@ -0,0 +1,217 @@
+from numpy import ( append, arange, asarray, bincount, cumsum, diff, empty, flatnonzero,
+                    float64, int64, lexsort, quantile, repeat, searchsorted, tile, unique,
+                    zeros )
+from numpy.random import default_rng
+
+from .ngram_lib import count_ngrams
+
+
+##############################################################################
+def shuffled_corpora( token_ids, n_replicates, sample_size = None, seed = 0 ):
+    """
+    This function generates n_replicates random permutations of a text,
+    and keeps the first sample_size tokens of each, i.e., samples of the
+    text without replacement.  Shuffling the whole text keeps every word
+    frequency, so the frequencies of samples of the size of, e.g., a
+    character's lines are the relevant null model for word frequencies.
+    When sample_size is given, only sample_size positions are drawn for
+    each replicate, so memory and time do not grow with the whole text.
+
+    inputs:
+        token_ids -- array of int
+        n_replicates -- int
+        sample_size -- int, None keeps all tokens
+        seed -- int for random number generator
+
+    returns:
+        array of int with shape (n_replicates, sample_size)
+    """
+    token_ids = asarray(token_ids)
+    rng = default_rng(seed)
+
+    if sample_size is None:
+        return rng.permuted( tile(token_ids, (n_replicates, 1)), axis = 1 )
+
+    corpora = empty( (n_replicates, sample_size), dtype = token_ids.dtype )
+    for i in range(n_replicates):
+        corpora[i] = token_ids[ rng.choice(len(token_ids), sample_size, replace = False) ]
+
+    return corpora
+
+
+##############################################################################
+def markov_chain_corpora( token_ids, n_replicates, length, order = 1, seed = 0 ):
+    """
+    This function generates n_replicates texts of a given length from a
+    Markov chain of the given order, with transition probabilities
+    estimated from a text.  All texts are generated at once: every step
+    samples the next token of every replicate with a single searchsorted.
+    Chains that reach a context never followed by a token restart from a
+    random context of the text.
+
+    inputs:
+        token_ids -- array of int
+        n_replicates -- int
+        length -- int number of tokens in each text
+        order -- int, 0 samples tokens independently with their frequency
+        seed -- int for random number generator
+
+    returns:
+        array of int with shape (n_replicates, length)
+    """
+    token_ids = asarray(token_ids, dtype = int64)
+    rng = default_rng(seed)
+    n_terms = int( token_ids.max() ) + 1
+
+    if order == 0:
+        return rng.choice( token_ids, size = (n_replicates, length) )
+
+    # Transitions: (order + 1)-grams sorted by context, with the cumulative
+    # probability of the next token shifted by the row of the context, so
+    # that row + uniform random number falls in the right interval
+    #
+    keys, counts = count_ngrams( token_ids, order + 1, n_terms )
+    context_keys, first_transition, n_transitions = unique( keys // n_terms,
+                                                            return_index = True,
+                                                            return_counts = True )
+    rows = repeat( arange(len(context_keys)), n_transitions )
+    cumulative = cumsum(counts)
+    cumulative -= repeat( cumulative[first_transition] - counts[first_transition],
+                          n_transitions )
+    shifted_cumulative = rows + cumulative / repeat( cumulative[first_transition +
+                                                                n_transitions - 1],
+                                                     n_transitions )
+    next_tokens = keys % n_terms
+
+    corpora = zeros( (n_replicates, length), dtype = int64 )
+    context = context_keys[ rng.integers(0, len(context_keys), n_replicates) ]
+    for j in range(length):
+        rows = searchsorted( context_keys, context )
+        found = rows < len(context_keys)
+        found[found] = context_keys[rows[found]] == context[found]
+        if not found.all():
+            restart = rng.integers( 0, len(context_keys), (~found).sum() )
+            context[~found] = context_keys[restart]
+            rows[~found] = restart
+
+        transition = searchsorted( shifted_cumulative, rows + rng.random(n_replicates),
+                                   side = 'right' )
+        corpora[:, j] = next_tokens[transition]
+        context = (context * n_terms + corpora[:, j]) % n_terms ** order
+
+    return corpora
+
+
+##############################################################################
+def monkey_corpora( n_replicates, n_words, n_letters = 26, p_space = 0.18, seed = 0 ):
+    """
+    This function generates n_replicates texts typed by Miller's monkey:
+    every keystroke is a space with probability p_space or one of
+    n_letters equally likely letters, and words are the non-empty strings
+    between spaces.  Word lengths are therefore geometric, and a word of
+    length l is a uniform choice among n_letters**l strings, so words are
+    sampled directly as integer IDs (very long words, all distinct in
+    practice, get random 62 bit IDs).
+
+    inputs:
+        n_replicates -- int
+        n_words -- int number of words in each text
+        n_letters -- int
+        p_space -- float
+        seed -- int for random number generator
+
+    returns:
+        array of int64 word IDs with shape (n_replicates, n_words)
+    """
+    rng = default_rng(seed)
+    lengths = rng.geometric( p_space, size = (n_replicates, n_words) )
+
+    # Words of length l get IDs from first_id[l] to first_id[l] + n_letters**l - 1,
+    # while that fits in 62 bits
+    #
+    first_id = [0, 0]
+    while first_id[-1] + n_letters ** (len(first_id) - 1) < 2**62:
+        first_id.append( first_id[-1] + n_letters ** (len(first_id) - 1) )
+    max_length = len(first_id) - 2
+    first_id = asarray(first_id, dtype = int64)
+
+    exact = lengths <= max_length
+    words = zeros( (n_replicates, n_words), dtype = int64 )
+    words[exact] = ( first_id[lengths[exact]] +
+                     rng.integers(0, asarray(n_letters, dtype = int64) ** lengths[exact]) )
+    words[~exact] = first_id[-1] + rng.integers( 0, 2**62, (~exact).sum() )
+
+    return words
+
+
+##############################################################################
+def survival_functions( corpora, k_values = None ):
+    """
+    This function calculates the survival function of word frequencies,
+    number of words that appear k or more times, of every row of a
+    (n_replicates, n_tokens) array in one pass.
+
+    inputs:
+        corpora -- array of int with shape (n_replicates, n_tokens)
+        k_values -- sorted array of int where survival functions are
+                    evaluated, None uses every frequency found
+
+    returns:
+        k_values -- array of int
+        survival -- array of int with shape (n_replicates, len(k_values))
+    """
+    corpora = asarray(corpora)
+    n_replicates = corpora.shape[0]
+
+    # Count (replicate, word) pairs with one sort
+    #
+    words = corpora.ravel()
+    replicates = repeat( arange(n_replicates), corpora.shape[1] )
+    order = lexsort( (words, replicates) )
+    words, replicates = words[order], replicates[order]
+
+    is_first = zeros( len(words), dtype = bool )
+    is_first[:1] = True
+    is_first[1:] = (words[1:] != words[:-1]) | (replicates[1:] != replicates[:-1])
+    first = flatnonzero(is_first)
+    counts = diff( append(first, len(words)) )
+    replicates = replicates[first]
+
+    if k_values is None:
+        k_values = unique(counts)
+    k_values = asarray(k_values)
+
+    # Number of words of each replicate in each interval [k_i, k_i+1), then
+    # cumulative sum from the largest k
+    #
+    bins = searchsorted( k_values, counts, side = 'right' ) - 1
+    keep = bins >= 0
+    histogram = bincount( replicates[keep] * len(k_values) + bins[keep],
+                          minlength = n_replicates * len(k_values) )
+    histogram = histogram.reshape( n_replicates, len(k_values) )
+
+    return k_values, cumsum( histogram[:, ::-1], axis = 1 )[:, ::-1]
+
+
+##############################################################################
+def survival_envelope( survival, quantiles = (0.025, 0.5, 0.975) ):
+    """
+    Returns the quantiles over replicates of survival functions, an array
+    with shape (len(quantiles), len(k_values)), e.g. a 95% confidence
+    envelope and the median.
+    """
+    return quantile( asarray(survival, dtype = float64), quantiles, axis = 0 )
+
+
+##############################################################################
+def plot_survival_envelope( ax, k_values, envelope, label, color = 'gray' ):
+    """
+    Plots the band between the first and last rows of envelope and its
+    middle row, in log-log scale, e.g. under the survival function drawn
+    by nlp_lib.plot_survival_function_word_frequency.
+    """
+    ax.loglog()
+    ax.fill_between( k_values, envelope[0], envelope[-1], color = color, alpha = 0.3,
+                     lw = 0 )
+    ax.plot( k_values, envelope[len(envelope) // 2], '-', color = color, lw = 1,
+             label = label )
@@ -0,0 +1 @@
+../../profiling_lib.py
\ No newline at end of file
@@ -0,0 +1,376 @@
+from numpy import ( arange, argsort, asarray, bincount, concatenate, cumsum, diff, errstate,
+                    fill_diagonal, flatnonzero, fromiter, int32, int64, log, nan, ones,
+                    repeat, sqrt, triu_indices, unique, where, zeros )
+from scipy.sparse import csr_matrix, diags
+from scipy.special import xlogy
+from string import punctuation
+
+from .nlp_lib import get_speaker_lines, tokenize_lines
+
+
+##############################################################################
+def encode_corpus( corpus, punct = punctuation ):
+    """
+    This function goes once through the speeches of every character in the
+    corpus, interns their words as int32 IDs, and builds the
+    character x term and play x term count matrices.
+
+    The tokens of each character are stored contiguously in token_ids,
+    and the characters of each play are contiguous too, so the tokens of
+    a character or of a play are slices of a single array.  Empty tokens
+    (words made only of punctuation) are dropped.
+
+    inputs:
+        corpus -- dict returned by nlp_lib.load_corpus
+        punct -- str with punctuation characters to be stripped
+
+    returns:
+        encoded -- dict with keys
+                   vocabulary -- dict with token as key and ID as value
+                   terms -- list of str with token of each ID
+                   token_ids -- array of int32 with tokens of all characters
+                   characters -- list of tuples (title, character)
+                   character_offsets -- array of int, tokens of the i-th
+                                        character are token_ids[offsets[i]: offsets[i+1]]
+                   plays -- list of str with titles
+                   play_offsets -- array of int, same as character_offsets
+                                   for plays
+                   character_play -- array of int with index of play of
+                                     each character
+                   character_term -- scipy.sparse csr_matrix of counts
+                   play_term -- scipy.sparse csr_matrix of counts
+    """
+    vocabulary = {}
+    characters = list( corpus['speakers'] )
+    encoded_characters = []
+    plays = []
+    character_play = zeros( len(characters), dtype = int64 )
+
+    for i, (title, character) in enumerate(characters):
+        if not plays or plays[-1] != title:
+            plays.append(title)
+        character_play[i] = len(plays) - 1
+
+        words = tokenize_lines( get_speaker_lines(corpus, title, character),
+                                punct, character )
+        encoded_characters.append( fromiter( (vocabulary.setdefault(word, len(vocabulary)) 
+                                              for word in words if word), dtype = int32 ) )
+
+    token_ids = concatenate( [zeros(0, dtype = int32)] + encoded_characters )
+    character_offsets = zeros( len(characters) + 1, dtype = int64 )
+    character_offsets[1:] = cumsum( [len(ids) for ids in encoded_characters] )
+
+    first_characters = zeros( len(plays) + 1, dtype = int64 )
+    first_characters[1:] = cumsum( bincount(character_play, minlength = len(plays)) )
+    play_offsets = character_offsets[first_characters]
+
+    # Duplicated (row, column) entries are summed when building the matrix,
+    # and play counts are the sum of the counts of their characters
+    #
+    n_terms = len(vocabulary)
+    rows = repeat( arange(len(characters)), diff(character_offsets) )
+    character_term = csr_matrix( (ones(len(token_ids), dtype = int64), (rows, token_ids)),
+                                 shape = (len(characters), n_terms) )
+    character_to_play = csr_matrix( (ones(len(characters), dtype = int64),
+                                     (character_play, arange(len(characters)))),
+                                    shape = (len(plays), len(characters)) )
+
+    return { 'vocabulary': vocabulary,
+             'terms': list(vocabulary),
+             'token_ids': token_ids,
+             'characters': characters,
+             'character_offsets': character_offsets,
+             'plays': plays,
+             'play_offsets': play_offsets,
+             'character_play': character_play,
+             'character_term': character_term,
+             'play_term': character_to_play @ character_term }
+
+
+##############################################################################
+def get_character_tokens( encoded, title, character ):
+    """
+    Returns the array of token IDs of a character in a play.  Raises 
+    ValueError if the character does not speak in the play.
+    """
+    i = encoded['characters'].index( (title, character.upper()) )
+    offsets = encoded['character_offsets']
+
+    return encoded['token_ids'][offsets[i]: offsets[i+1]]
+
+
+##############################################################################
+def get_play_tokens( encoded, title ):
+    """
+    Returns the array of token IDs spoken in a play, grouped by character.
+    """
+    i = encoded['plays'].index(title)
+    offsets = encoded['play_offsets']
+
+    return encoded['token_ids'][offsets[i]: offsets[i+1]]
+
+
+##############################################################################
+def decode_tokens( encoded, token_ids ):
+    """
+    Returns the list of words with the given token IDs.
+    """
+    terms = encoded['terms']
+
+    return [terms[i] for i in token_ids]
+
+
+##############################################################################
+def normalize_rows( term_matrix ):
+    """
+    Returns a copy of a sparse matrix with every non-empty row scaled to
+    unit euclidean norm.
+    """
+    term_matrix = csr_matrix( term_matrix, dtype = float )
+    norms = asarray( term_matrix.multiply(term_matrix).sum(axis = 1) ).ravel() ** 0.5
+    norms[norms == 0] = 1.
+
+    return diags( 1. / norms ) @ term_matrix
+
+
+##############################################################################
+def tf_idf( term_matrix, smooth = True ):
+    """
+    Calculates the TF-IDF weights of a document x term count matrix,
+    with idf = log((1 + n_documents) / (1 + document_frequency)) + 1 when
+    smooth is True and log(n_documents / document_frequency) + 1 otherwise.
+    Rows are normalized to unit euclidean norm.
+
+    inputs:
+        term_matrix -- scipy.sparse matrix of counts (e.g. encoded['play_term'])
+        smooth -- bool
+
+    returns:
+        scipy.sparse csr_matrix
+    """
+    term_matrix = csr_matrix( term_matrix, dtype = float )
+    n_documents = term_matrix.shape[0]
+    document_frequency = diff( term_matrix.tocsc().indptr )
+
+    if smooth:
+        idf = log( (1 + n_documents) / (1 + document_frequency) ) + 1
+    else:
+        idf = log( n_documents / document_frequency.clip(1) ) + 1
+
+    return normalize_rows( term_matrix @ diags(idf) )
+
+
+##############################################################################
+def cosine_similarity( term_matrix ):
+    """
+    Returns the dense matrix of cosine similarities between all pairs of
+    rows of a document x term matrix (counts or TF-IDF weights).
+    """
+    normalized = normalize_rows( term_matrix )
+
+    return (normalized @ normalized.T).toarray()
+
+
+##############################################################################
+def vocabulary_overlap( term_matrix ):
+    """
+    Calculates, for all pairs of rows of a document x term matrix, the
+    number of distinct words they share and the Jaccard index of their
+    vocabularies.
+
+    inputs:
+        term_matrix -- scipy.sparse matrix of counts
+
+    returns:
+        shared -- array of int with shape (n_documents, n_documents)
+        jaccard -- array of float with shape (n_documents, n_documents)
+    """
+    present = csr_matrix( term_matrix > 0, dtype = int64 )
+    shared = (present @ present.T).toarray()
+
+    sizes = shared.diagonal()
+    union = sizes[:, None] + sizes[None, :] - shared
+    jaccard = shared / union.clip(1)
+
+    return shared, jaccard
+
+
+##############################################################################
+def get_pair_counts( term_matrix, pairs = None ):
+    """
+    Returns dense count arrays for the two sides of every comparison: rows
+    a and b of each pair, or, when pairs is None, every row and the sum of
+    all other rows (the rest of the corpus).
+
+    inputs:
+        term_matrix -- scipy.sparse matrix of counts
+        pairs -- array of int with shape (n_pairs, 2), or None
+
+    returns:
+        focus -- array (n_comparisons, n_terms) of counts
+        other -- array (n_comparisons, n_terms) of counts
+    """
+    term_matrix = csr_matrix( term_matrix, dtype = float )
+
+    if pairs is None:
+        focus = term_matrix.toarray()
+        other = asarray( term_matrix.sum(axis = 0) ) - focus
+    else:
+        pairs = asarray(pairs).reshape(-1, 2)
+        focus = term_matrix[pairs[:, 0]].toarray()
+        other = term_matrix[pairs[:, 1]].toarray()
+
+    return focus, other
+
+
+##############################################################################
+def log_odds_dirichlet( term_matrix, pairs = None, background = None, prior_size = None ):
+    """
+    Calculates, for every comparison and every word, the log-odds ratio of
+    the word in the two sides with an informative Dirichlet prior (Monroe,
+    Colaresi & Quinn, 2008): each side gets prior counts alpha proportional
+    to the background frequency of the word, which shrinks the ratios of
+    rare words towards zero.  The z-scores divide the ratios by their
+    approximate standard deviation sqrt(1/(y_a + alpha) + 1/(y_b + alpha)).
+
+    inputs:
+        term_matrix -- scipy.sparse matrix of counts, e.g. encoded['play_term']
+        pairs -- array of int with shape (n_pairs, 2) of rows compared, or
+                 None to compare every row with the rest of the corpus
+        background -- array of counts of each term defining the prior,
+                      defaults to the counts of the whole matrix
+        prior_size -- float total number of prior counts, defaults to the
+                      sum of background; smaller values shrink less
+
+    returns:
+        log_odds -- array (n_comparisons, n_terms), positive for words used
+                    more by the first side
+        z_scores -- array (n_comparisons, n_terms)
+    """
+    focus, other = get_pair_counts( term_matrix, pairs )
+
+    if background is None:
+        background = csr_matrix( term_matrix ).sum( axis = 0 )
+    alpha = asarray(background, dtype = float).ravel()
+    if prior_size is not None:
+        alpha = alpha * prior_size / alpha.sum()
+    alpha_0 = alpha.sum()
+
+    n_focus = focus.sum( axis = 1, keepdims = True )
+    n_other = other.sum( axis = 1, keepdims = True )
+
+    # Words with no counts and no prior have neither odds nor variance
+    #
+    with errstate( divide = 'ignore', invalid = 'ignore' ):
+        log_odds = ( log( (focus + alpha) / (n_focus + alpha_0 - focus - alpha) ) -
+                     log( (other + alpha) / (n_other + alpha_0 - other - alpha) ) )
+        z_scores = log_odds / sqrt( 1. / (focus + alpha) + 1. / (other + alpha) )
+
+    seen = (focus + other + alpha) > 0
+
+    return where(seen, log_odds, 0.), where(seen, z_scores, 0.)
+
+
+##############################################################################
+def keyness( term_matrix, pairs = None ):
+    """
+    Calculates, for every comparison and every word, the log-likelihood
+    keyness G2 = 2 sum(observed * log(observed / expected)) of the counts
+    in the two sides (Dunning, 1993; Rayson & Garside, 2000), signed
+    positive for words used more often by the first side.  Values above
+    3.84 (6.63) are significant at the 5% (1%) level for a single word.
+
+    inputs:
+        term_matrix -- scipy.sparse matrix of counts
+        pairs -- array of int with shape (n_pairs, 2) of rows compared, or
+                 None to compare every row with the rest of the corpus
+
+    returns:
+        array (n_comparisons, n_terms) of signed G2
+    """
+    focus, other = get_pair_counts( term_matrix, pairs )
+
+    n_focus = focus.sum( axis = 1, keepdims = True )
+    n_other = other.sum( axis = 1, keepdims = True )
+    share_focus = n_focus / (n_focus + n_other).clip(1)
+
+    expected_focus = (focus + other) * share_focus
+    expected_other = (focus + other) - expected_focus
+
+    g2 = 2 * ( xlogy( focus, focus / where(expected_focus > 0, expected_focus, 1.) ) +
+               xlogy( other, other / where(expected_other > 0, expected_other, 1.) ) )
+
+    return where( focus * n_other >= other * n_focus, g2, -g2 )
+
+
+##############################################################################
+def top_terms( terms, scores, n = 10 ):
+    """
+    Returns, for every row of scores (e.g. from log_odds_dirichlet or
+    keyness), the list of (word, score) of the n highest scores; pass
+    -scores to get the words used more by the second side.
+    """
+    scores = asarray(scores)
+    best = argsort( scores, axis = 1 )[:, ::-1][:, :n]
+
+    return [ [(terms[j], scores[i, j]) for j in row] for i, row in enumerate(best) ]
+
+
+##############################################################################
+def jensen_shannon_divergence( term_matrix, max_values = 2**22 ):
+    """
+    Calculates the Jensen-Shannon divergence, in bits (between 0 and 1),
+    between the word frequencies of all pairs of rows of a document x term
+    matrix.
+
+    With p and q the frequencies of two rows and m = (p + q) / 2,
+    JSD = log(2) - sum(h(p_w, q_w)) / 2 with h(p, q) = (p + q) log(p + q)
+    - p log(p) - q log(q), which is zero unless both rows use word w.  So
+    only the pairs of rows sharing a word are visited: the words are
+    grouped by their number of documents d, and the d (d - 1) / 2 pairs of
+    the words of each group are evaluated as arrays of at most max_values
+    values and added to the matrix with bincount.
+
+    inputs:
+        term_matrix -- scipy.sparse matrix of counts, e.g.
+                       encoded['character_term']
+        max_values -- int maximum number of pairs evaluated at once
+
+    returns:
+        array of float with shape (n_documents, n_documents), nan for rows
+        without words
+    """
+    term_matrix = csr_matrix( term_matrix, dtype = float )
+    n_documents = term_matrix.shape[0]
+    lengths = asarray( term_matrix.sum(axis = 1) ).ravel()
+
+    frequencies = ( diags( 1. / lengths.clip(1) ) @ term_matrix ).tocsc()
+    p_log_p = xlogy( frequencies.data, frequencies.data )
+    document_frequency = diff( frequencies.indptr )
+
+    shared = zeros( n_documents * n_documents )
+    for d in unique( document_frequency[document_frequency > 1] ):
+        # Positions in frequencies.data of the d entries of every word in the group
+        #
+        words = flatnonzero( document_frequency == d )
+        entries = frequencies.indptr[words][:, None] + arange(d)
+        first, second = triu_indices( d, 1 )
+
+        step = max( 1, max_values // len(first) )
+        for start in range(0, len(words), step):
+            i = entries[start: start + step][:, first]
+            j = entries[start: start + step][:, second]
+            p_plus_q = frequencies.data[i] + frequencies.data[j]
+            h = xlogy( p_plus_q, p_plus_q ) - p_log_p[i] - p_log_p[j]
+
+            keys = frequencies.indices[i] * n_documents + frequencies.indices[j]
+            shared += bincount( keys.ravel(), h.ravel(), minlength = len(shared) )
+
+    shared = shared.reshape( n_documents, n_documents )
+    divergence = ( log(2) - (shared + shared.T) / 2 ).clip(0) / log(2)
+    fill_diagonal( divergence, 0. )
+
+    divergence[lengths == 0, :] = nan
+    divergence[:, lengths == 0] = nan
+
+    return divergence
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from numpy import arange
+
+from synthetic import REAL_INTENTIONS
+
+
+@pytest.mark.parametrize( 'n_voters', [10**4, 10**5, 10**6] )
+def bench_create_voters( benchmark, data_lib, n_voters ):
+    voters = benchmark( data_lib.create_voters, n_voters, REAL_INTENTIONS )
+    assert len(voters) == n_voters
+
+
+@pytest.mark.parametrize( 'poll_size', [100, 1000, 10000] )
+def bench_simulate_poll( benchmark, data_lib, poll_size ):
+    voters = data_lib.create_voters( 10**6, REAL_INTENTIONS )
+    random.seed(0)
+    preferences, counter = benchmark( data_lib.simulate_poll, voters, poll_size )
+    assert sum(counter.values()) == poll_size
+
+
+def bench_poll_surface( benchmark, poll_lib, tmp_path ):
+    surface = benchmark( poll_lib.poll_surface, tmp_path / 'surface', [100, 500, 2000],
+                         [0.1, 0.3, 0.5], [10**4, 10**6], n_replicates = 10**4,
+                         n_processes = 1 )
+    assert surface['counts'].sum() == 18 * 10**4
+
+
+def bench_margin_of_error( benchmark, poll_lib, tmp_path ):
+    surface = poll_lib.poll_surface( tmp_path / 'surface', [100, 500, 2000], arange(0.05, 1, 0.05),
+                                     [10**4, 10**6], n_replicates = 10**3, n_processes = 1 )
+    margins = benchmark( poll_lib.margin_of_error, surface )
+    assert margins.shape == (3, 19, 2)
+
+
+@pytest.mark.parametrize( 'n', [10**4, 10**6] )
+def bench_fit_power_law( benchmark, power_law_lib, n ):
+    from synthetic import make_power_law_mixture
+
+    fit = benchmark( power_law_lib.fit_power_law, make_power_law_mixture(n) )
+    # True xmin = 10 and alpha = 2.5; the KS distance is flat near xmin
+    #
+    assert 9. < fit['xmin'] < 15. and abs(fit['alpha'] - 2.5) < 5 * fit['alpha_se']
+
+
+@pytest.mark.parametrize( 'n_replicates', [100, 10000] )
+def bench_fit_regression_batch( benchmark, data_lib, n_replicates ):
+    x, y = data_lib.noisy_regression_batch( n_replicates, 100, 1., 2., 0.1, 0.1, seed = 0 )
+    fit = benchmark( data_lib.fit_regression_batch, x, y )
+    assert len(fit['slope']) == n_replicates
+
+
+def bench_sampling_distribution_summaries( benchmark, data_lib ):
+    from scipy.stats import randint
+
+    summaries = benchmark( data_lib.sampling_distribution_summaries, randint(0, 101),
+                           [5, 20, 100], 10000, seed = 0 )
+    assert summaries['histograms'].shape[0] == 3
+
+
+@pytest.mark.parametrize( 'n_dice', [2, 4, 6] )
+def bench_get_product_sample_space( benchmark, my_stats, n_dice ):
+    from synthetic import make_dice_outcomes
+
+    events = benchmark( my_stats.get_product_sample_space, make_dice_outcomes(n_dice) )
+    assert len(events) == 6**n_dice
@@ -0,0 +1,41 @@
+import pytest
+
+from synthetic import make_plate
+
+
+PLATE_SIZES = [(500, 700), (2000, 2800)]
+
+
+@pytest.fixture( scope = 'module', params = PLATE_SIZES, ids = lambda size: f"{size[0]}x{size[1]}" )
+def plate( request ):
+    return make_plate( *request.param )
+
+
+def bench_infer_grid_lines_rows( benchmark, image_lib, plate ):
+    height, width = plate.shape
+    level_lines, levels = benchmark( image_lib.infer_grid_lines, 0, 0, height - 20, width,
+                                     10, plate )
+    assert len(levels) == height - 20
+
+
+def bench_infer_grid_lines_columns( benchmark, image_lib, plate ):
+    height, width = plate.shape
+    level_lines, levels = benchmark( image_lib.infer_grid_lines, 1, 41, width, height - 20,
+                                     10, plate )
+    assert len(levels) == width - 41
+
+
+@pytest.mark.parametrize( 'n_lines', [10, 1000] )
+def bench_cluster_infered_lines( benchmark, image_lib, n_lines ):
+    # Grid lines 3 pixels thick every 50 pixels
+    #
+    level_lines = [50 * i + k for i in range(n_lines) for k in range(3)]
+    block_delta, deltas, mapping = benchmark( image_lib.cluster_infered_lines, level_lines )
+    assert len(mapping) == n_lines
+
+
+def bench_read_bar_chart( benchmark, image_lib, plate ):
+    # The 12 black bars of make_plate, on a white background
+    #
+    chart = benchmark( image_lib.read_bar_chart, plate.astype(float) )
+    assert len(chart['bar_heights']) == 12
@@ -0,0 +1,64 @@
+import pytest
+
+
+@pytest.fixture( scope = 'module' )
+def complete_works( nlp_lib, corpus_folder ):
+    return nlp_lib.read_complete_works( corpus_folder )
+
+
+@pytest.fixture( scope = 'module' )
+def first_play( complete_works ):
+    lines, plays = complete_works
+    play = plays[ list(plays)[0] ]
+
+    return lines[ play['first_line']: play['last_line'] ]
+
+
+@pytest.fixture( scope = 'module' )
+def encoded( nlp_lib, vocab_lib, corpus_folder ):
+    return vocab_lib.encode_corpus( nlp_lib.load_corpus(corpus_folder) )
+
+
+def bench_read_complete_works( benchmark, nlp_lib, corpus_folder ):
+    lines, plays = benchmark( nlp_lib.read_complete_works, corpus_folder )
+    assert len(plays) > 0
+
+
+def bench_get_characters( benchmark, nlp_lib, first_play ):
+    personae = benchmark( nlp_lib.get_characters, first_play )
+    assert len(personae) > 0
+
+
+def bench_get_all_character_lines( benchmark, nlp_lib, first_play ):
+    character_lines = benchmark( nlp_lib.get_all_character_lines, first_play )
+    assert len(character_lines) > 0
+
+
+def bench_extract_words_from_lines( benchmark, nlp_lib, first_play ):
+    character = list( nlp_lib.get_characters(first_play) )[0]
+    character_lines = nlp_lib.get_character_lines( character, first_play )
+
+    words = benchmark( nlp_lib.extract_words_from_lines, character, character_lines,
+                       verbose = False )
+    assert len(words) > 0
+
+
+def bench_count_words( benchmark, nlp_lib, complete_works ):
+    lines, plays = complete_works
+    counter = benchmark( nlp_lib.count_words, lines )
+    assert counter['the'] > 0
+
+
+def bench_jensen_shannon_divergence( benchmark, vocab_lib, encoded ):
+    divergence = benchmark( vocab_lib.jensen_shannon_divergence, encoded['character_term'] )
+    assert divergence.shape == (len(encoded['characters']),) * 2
+
+
+def bench_log_odds_dirichlet( benchmark, vocab_lib, encoded ):
+    log_odds, z_scores = benchmark( vocab_lib.log_odds_dirichlet, encoded['play_term'] )
+    assert z_scores.shape == encoded['play_term'].shape
+
+
+def bench_keyness( benchmark, vocab_lib, encoded ):
+    g2 = benchmark( vocab_lib.keyness, encoded['play_term'] )
+    assert g2.shape == encoded['play_term'].shape
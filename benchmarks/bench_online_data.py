@@ -0,0 +1,42 @@
+import pytest
+
+from conftest import STATION_ROWS
+from synthetic import make_station_readings
+
+
+@pytest.mark.parametrize( 'n_rows', STATION_ROWS )
+def bench_get_station_data( benchmark, web_lib, station_server, n_rows ):
+    df = benchmark( web_lib.get_station_data, station_server, f"rows_{n_rows}", {} )
+    assert len(df) == n_rows
+
+
+@pytest.mark.parametrize( 'n_rows', STATION_ROWS )
+def bench_clean_station_data( benchmark, web_lib, station_server, n_rows ):
+    df = web_lib.get_station_data( station_server, f"rows_{n_rows}", {} )
+
+    # clean_station_data adds a column, so every round gets a fresh copy
+    #
+    cleaned = benchmark.pedantic( web_lib.clean_station_data,
+                                  setup = lambda: ((df.copy(),), {}), rounds = 10 )
+    assert cleaned['time_stamp'].is_monotonic_increasing
+
+
+@pytest.mark.parametrize( 'n_stations', [10, 500] )
+def bench_update_window_aggregates( benchmark, station_lib, n_stations ):
+    readings = make_station_readings( n_stations, 100_000 )
+
+    # Every round starts from an empty state
+    #
+    state = benchmark.pedantic( station_lib.update_window_aggregates,
+                                setup = lambda: ((station_lib.new_window_aggregates(),
+                                                  readings), {}), rounds = 10 )
+    assert state['count'].sum() == len(readings)
+
+
+def bench_get_rolling_aggregates( benchmark, station_lib ):
+    state = station_lib.new_window_aggregates()
+    station_lib.update_window_aggregates( state, make_station_readings(500, 10**6, 365) )
+
+    daily = benchmark( station_lib.get_rolling_aggregates, state, 24,
+                       start = 1_700_000_000 + 358 * 86400, end = 1_700_000_000 + 365 * 86400 )
+    assert daily['station'].nunique() == 500
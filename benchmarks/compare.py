@@ -0,0 +1,96 @@
+"""
+Reports the change of every benchmark between two runs saved by
+pytest-benchmark, as a percentage of the baseline, and exits with status 1
+if any benchmark got slower than the threshold.
+
+    python benchmarks/compare.py                        # first vs last saved run
+    python benchmarks/compare.py 0001 0003 --threshold 5 --statistic min
+"""
+import argparse
+import json
+import sys
+
+from pathlib import Path
+
+
+STORAGE = Path(__file__).parent / '.benchmarks'
+
+
+##############################################################################
+def find_runs( storage = STORAGE ):
+    """
+    Returns the saved runs, oldest first (files are named NNNN_<name>.json).
+    """
+    return sorted( storage.glob('*/*.json'), key = lambda path: path.name )
+
+
+##############################################################################
+def find_run( run_id, runs ):
+    """
+    Returns the saved run whose file name starts with run_id, e.g. '0001'.
+    """
+    matches = [path for path in runs if path.name.startswith(run_id)]
+    if not matches:
+        raise SystemExit( f"No saved benchmark run matches {run_id}" )
+
+    return matches[-1]
+
+
+##############################################################################
+def load_statistics( path, statistic ):
+    """
+    Returns a dict with benchmark name as key and the chosen statistic
+    (min, mean, median...) in seconds as value.
+    """
+    with open( path ) as f_read:
+        run = json.load( f_read )
+
+    return { bench['fullname']: bench['stats'][statistic] for bench in run['benchmarks'] }
+
+
+##############################################################################
+def compare_runs( baseline, current ):
+    """
+    Returns a list of tuples (name, baseline, current, change in percent)
+    for benchmarks present in both runs.
+    """
+    return [ (name, baseline[name], current[name],
+              100. * (current[name] - baseline[name]) / baseline[name])
+             for name in sorted(baseline) if name in current ]
+
+
+##############################################################################
+def main():
+    parser = argparse.ArgumentParser( description = __doc__.split('\n\n')[0] )
+    parser.add_argument( 'baseline', nargs = '?', help = 'id of baseline run (default: first)' )
+    parser.add_argument( 'current', nargs = '?', help = 'id of current run (default: last)' )
+    parser.add_argument( '--statistic', default = 'mean' )
+    parser.add_argument( '--threshold', type = float, default = 10.,
+                         help = 'percentage slowdown reported as a regression' )
+    args = parser.parse_args()
+
+    runs = find_runs()
+    if len(runs) < 2 and not (args.baseline and args.current):
+        raise SystemExit( "Save at least two runs with pytest --benchmark-save=<name>" )
+
+    baseline_path = find_run( args.baseline, runs ) if args.baseline else runs[0]
+    current_path = find_run( args.current, runs ) if args.current else runs[-1]
+
+    rows = compare_runs( load_statistics(baseline_path, args.statistic),
+                         load_statistics(current_path, args.statistic) )
+
+    print( f"{baseline_path.name} -> {current_path.name} ({args.statistic})\n" )
+    regressions = 0
+    for name, before, after, change in rows:
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print( f"{change:+8.1f}%  {1e3 * before:10.3f} ms -> {1e3 * after:10.3f} ms  {name}{flag}" )
+
+    print( f"\n{regressions} of {len(rows)} benchmarks slower by more than {args.threshold}%" )
+    sys.exit( 1 if regressions else 0 )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Every module keeps its libraries in a folder named module_libraries, so
+each folder is loaded here as a package with its own name (relative
+imports between libraries keep working), and the synthetic inputs are
+built once per session.
+"""
+import importlib
+import sys
+
+from importlib.machinery import ModuleSpec
+from importlib.util import module_from_spec
+from pathlib import Path
+
+import pytest
+
+sys.path.insert( 0, str(Path(__file__).parent) )
+
+from synthetic import make_complete_works, make_station_csv, start_station_server
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+LIBRARY_FOLDERS = { 'data_libraries': 'Module_Data_Analysis',
+                    'image_libraries': 'Module_Image_Processing',
+                    'web_libraries': 'Module_Interacting_w_Online_Data',
+                    'nlp_libraries': 'Module_Natural_Language_Processing' }
+
+STATION_ROWS = [1000, 10000]
+
+
+##############################################################################
+def load_library( package_name, library_name ):
+    """
+    Imports Module_*/module_libraries/<library_name>.py as
+    <package_name>.<library_name>.
+    """
+    if package_name not in sys.modules:
+        spec = ModuleSpec( package_name, None, is_package = True )
+        spec.submodule_search_locations = [ str(ROOT / LIBRARY_FOLDERS[package_name] /
+                                                'module_libraries') ]
+        sys.modules[package_name] = module_from_spec( spec )
+
+    library = importlib.import_module( f"{package_name}.{library_name}" )
+
+    # Benchmarks time the work itself, not hits of the memoization cache
+    #
+    cache_lib = sys.modules.get( f"{package_name}.cache_lib" )
+    if cache_lib is not None:
+        cache_lib.set_cache( enabled = False )
+
+    return library
+
+
+@pytest.fixture( scope = 'session' )
+def data_lib():
+    return load_library( 'data_libraries', 'data_lib' )
+
+
+@pytest.fixture( scope = 'session' )
+def power_law_lib():
+    return load_library( 'data_libraries', 'power_law_lib' )
+
+
+@pytest.fixture( scope = 'session' )
+def poll_lib():
+    return load_library( 'data_libraries', 'poll_lib' )
+
+
+@pytest.fixture( scope = 'session' )
+def my_stats():
+    return load_library( 'data_libraries', 'my_stats' )
+
+
+@pytest.fixture( scope = 'session' )
+def image_lib():
+    return load_library( 'image_libraries', 'image_lib' )
+
+
+@pytest.fixture( scope = 'session' )
+def web_lib():
+    return load_library( 'web_libraries', 'web_lib' )
+
+
+@pytest.fixture( scope = 'session' )
+def station_lib():
+    return load_library( 'web_libraries', 'station_lib' )
+
+
+@pytest.fixture( scope = 'session' )
+def nlp_lib():
+    return load_library( 'nlp_libraries', 'nlp_lib' )
+
+
+@pytest.fixture( scope = 'session' )
+def vocab_lib():
+    return load_library( 'nlp_libraries', 'vocab_lib' )
+
+
+@pytest.fixture( scope = 'session' )
+def station_server():
+    """
+    Local HTTP stub serving station 'rows_<n>' with n rows of data.
+    """
+    csv_by_station = { f"rows_{n}": make_station_csv(n, seed = n) for n in STATION_ROWS }
+    server, api_url = start_station_server( csv_by_station )
+    yield api_url
+    server.shutdown()
+
+
+@pytest.fixture( scope = 'session', params = [5, 20], ids = lambda n: f"{n}_plays" )
+def corpus_folder( request, tmp_path_factory ):
+    """
+    Folder with a generated Shakespeare.txt with 5 or 20 plays.
+    """
+    folder = tmp_path_factory.mktemp( f"corpus_{request.param}" )
+    (folder / 'Shakespeare.txt').write_text( make_complete_works(request.param) )
+
+    return folder
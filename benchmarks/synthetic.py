@@ -0,0 +1,171 @@
+"""
+Deterministic synthetic inputs for the benchmarks: everything is generated
+from fixed seeds, so no data files or network access are needed.
+"""
+import random
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from numpy import concatenate, ones
+from numpy.random import default_rng
+
+import pandas as pd
+
+
+ELECT_NOTICE = [ '<<THIS ELECTRONIC VERSION OF THE COMPLETE WORKS OF WILLIAM',
+                 'SHAKESPEARE IS COPYRIGHT 1990-1993 BY WORLD LIBRARY, INC., AND IS',
+                 'PROVIDED BY PROJECT GUTENBERG ETEXT OF ILLINOIS BENEDICTINE COLLEGE',
+                 'WITH PERMISSION.>>' ]
+
+WORDS = ( 'the and to of i you my a that in is not it me his with be your for this '
+          'have he but as thou so him will what thy all do by shall no we if are on '
+          'thee our lord now good o more she her love from at they them was then sir '
+          'or how come let well like' ).split()
+
+REAL_INTENTIONS = { 'Candidate A': 0.48, 'Candidate B': 0.45 }
+
+
+##############################################################################
+def make_plate( height, width, n_bars = 12, grid_step = 50, seed = 0 ):
+    """
+    Returns a thresholded bar-chart plate (True is white): a left axis,
+    horizontal grid lines every grid_step pixels and n_bars black bars of
+    random heights.
+    """
+    rng = default_rng(seed)
+    plate = ones( (height, width), dtype = bool )
+
+    x_axis, y_axis = height - 20, 40
+    plate[:x_axis, y_axis] = False
+    plate[x_axis, y_axis:] = False
+    for row in range(x_axis - grid_step, 0, -grid_step):
+        plate[row, y_axis: y_axis + 8] = False
+        plate[row, y_axis + 8::4] = False
+
+    bar_width = (width - y_axis) // (2 * n_bars)
+    for i, top in enumerate( rng.integers(grid_step, x_axis - 10, n_bars) ):
+        left = y_axis + bar_width // 2 + 2 * i * bar_width
+        plate[top: x_axis, left: left + bar_width] = False
+
+    return plate
+
+
+##############################################################################
+def make_power_law_mixture( n, alpha = 2.5, xmin = 10., tail_share = 0.05, seed = 0 ):
+    """
+    Returns n observations: a share 1 - tail_share uniform between 1 and
+    xmin, the rest drawn from a power law with exponent alpha above xmin.
+    """
+    rng = default_rng(seed)
+    n_tail = int(tail_share * n)
+    tail = xmin * (1. - rng.random(n_tail)) ** (-1. / (alpha - 1.))
+
+    return rng.permutation( concatenate( [rng.uniform(1., xmin, n - n_tail), tail] ) )
+
+
+##############################################################################
+def make_station_csv( n_rows, seed = 0 ):
+    """
+    Returns a CSV in the format of the PurpleAir history endpoint, with
+    rows in random time order every 10 minutes.
+    """
+    rng = default_rng(seed)
+    time_stamps = 1_700_000_000 + 600 * rng.permutation( n_rows )
+    pm25 = rng.gamma( 2., 5., n_rows )
+    humidity = rng.uniform( 20, 90, n_rows )
+
+    lines = ['time_stamp,pm2.5_atm,humidity']
+    lines += [ f"{t},{p:.2f},{h:.1f}" for t, p, h in zip(time_stamps, pm25, humidity) ]
+
+    return '\n'.join(lines) + '\n'
+
+
+##############################################################################
+def make_station_readings( n_stations, n_readings, n_days = 30, seed = 0 ):
+    """
+    Returns a long-format DataFrame (station, time_stamp, pm2.5_atm) with
+    readings of n_stations stations at random times over n_days.
+    """
+    rng = default_rng(seed)
+
+    return pd.DataFrame( { 'station': rng.integers(0, n_stations, n_readings).astype(str),
+                           'time_stamp': 1_700_000_000 + rng.integers(0, 86400 * n_days,
+                                                                      n_readings),
+                           'pm2.5_atm': rng.gamma(2., 5., n_readings) } )
+
+
+##############################################################################
+def start_station_server( csv_by_station ):
+    """
+    Serves station CSVs at http://127.0.0.1:<port>/<station id>/history/csv/
+    from a thread.  Returns the server (call shutdown() when done) and the
+    api_url to pass to web_lib.get_station_data.
+    """
+    class StationHandler( BaseHTTPRequestHandler ):
+        def do_GET( self ):
+            station_id = self.path.strip('/').split('/')[0]
+            body = csv_by_station.get( station_id )
+            if body is None:
+                self.send_response( 404 )
+                self.end_headers()
+                return
+
+            body = body.encode()
+            self.send_response( 200 )
+            self.send_header( 'Content-Type', 'text/csv' )
+            self.send_header( 'Content-Length', str(len(body)) )
+            self.end_headers()
+            self.wfile.write( body )
+
+        def log_message( self, *args ):
+            pass
+
+    server = ThreadingHTTPServer( ('127.0.0.1', 0), StationHandler )
+    threading.Thread( target = server.serve_forever, daemon = True ).start()
+
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+##############################################################################
+def make_complete_works( n_plays = 5, n_speeches = 400, seed = 1 ):
+    """
+    Returns the text of a file laid out as the Project Gutenberg edition of
+    the Complete Works: each play with year, title, Dramatis Personae and
+    speeches '  SPEAKER. text' continued on lines indented by four spaces.
+    """
+    rng = random.Random(seed)
+    lines = ['The Project Gutenberg Etext', '', '']
+
+    for p in range(n_plays):
+        title = f"THE TRAGEDY OF PLAY NUMBER {p}"
+        characters = [f"CHAR{p}X{c}" for c in range(6)] + ['FIRST SENATOR']
+
+        lines += ELECT_NOTICE + ['', '', '', str(1590 + p)] + [''] * [1, 2, 5][p % 3]
+        lines += [title, '', 'by William Shakespeare', '', '', '', 'Dramatis Personae', '']
+        lines += [f"  {c}, a person of note, friend to {characters[0].title()}"
+                  for c in characters]
+        lines += ['', 'Other Lords, Servants, etc.', '', ''] + ELECT_NOTICE
+        lines += ['', '', 'ACT I. SCENE I.', 'A street.', '', 'Enter two', '']
+
+        for s in range(n_speeches):
+            character = rng.choice(characters)
+            for k in range( rng.randint(1, 4) ):
+                text = ' '.join( rng.choice(WORDS) for _ in range(rng.randint(3, 9)) )
+                text = text.capitalize() + rng.choice([',', '.', '!', '?', ';', ''])
+                lines.append( f"  {character}. {text}" if k == 0 else f"    {text}" )
+            if rng.random() < 0.1:
+                lines += ['', ' ' * 53 + 'Exit', '']
+
+        lines += ['', 'THE END', '', '', '']
+
+    lines += ELECT_NOTICE
+
+    return '\n'.join(lines) + '\n'
+
+
+##############################################################################
+def make_dice_outcomes( n_dice, n_faces = 6 ):
+    """
+    Returns the list of sets of outcomes passed to get_product_sample_space.
+    """
+    return [ set( range(1, n_faces + 1) ) for _ in range(n_dice) ]
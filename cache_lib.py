@@ -0,0 +1,356 @@
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+
+from collections import OrderedDict
+from copy import deepcopy
+from functools import wraps
+from pathlib import Path
+
+from numpy import ascontiguousarray, generic, ndarray
+
+try:
+    from .profiling_lib import get_logger, size_in_bytes
+except ImportError:
+    from profiling_lib import get_logger, size_in_bytes
+
+
+logger = get_logger(__name__)
+
+# Results are kept in memory (least recently used are dropped first) and,
+# for functions memoized with disk = True, in pickle files under directory,
+# so they survive restarting the kernel.
+#
+_settings = { 'enabled': True,
+              'max_entries': 256,
+              'max_bytes': 2**28,
+              'disk': True,
+              'directory': Path( os.environ.get( 'MODULE_LIBRARIES_CACHE',
+                                                 Path.home() / '.cache' / 'module_libraries' ) ),
+              'max_disk_bytes': 2**30 }
+
+_memory = OrderedDict()          # key -> (value, bytes)
+_memory_bytes = [0]
+_stats = {}
+_lock = threading.RLock()
+
+
+##########################################################################################
+def set_cache( enabled = None, max_entries = None, max_bytes = None, disk = None,
+               directory = None, max_disk_bytes = None ):
+    """
+    Changes the settings of the cache; arguments left as None are unchanged.
+
+    inputs:
+        enabled -- bool, when False memoized functions are called directly
+        max_entries -- int maximum number of results kept in memory
+        max_bytes -- int maximum size of results kept in memory
+        disk -- bool, when False the disk store is neither read nor written
+        directory -- str or Path of the disk store
+        max_disk_bytes -- int maximum size of the disk store
+    """
+    for key, value in ( ('enabled', enabled), ('max_entries', max_entries),
+                        ('max_bytes', max_bytes), ('disk', disk),
+                        ('max_disk_bytes', max_disk_bytes) ):
+        if value is not None:
+            _settings[key] = value
+    if directory is not None:
+        _settings['directory'] = Path( directory )
+
+    with _lock:
+        evict_memory()
+
+
+##########################################################################################
+def hash_value( value, hasher ):
+    """
+    Feeds a value into a hashlib hasher.  Arrays are hashed from their
+    buffer without copying (unless they are not contiguous), Paths by
+    their location, modification time and size, containers item by item.
+    Raises TypeError for values that cannot be hashed reliably.
+    """
+    if isinstance(value, ndarray) and not value.dtype.hasobject:
+        hasher.update( f"ndarray{value.dtype.str}{value.shape}".encode() )
+        hasher.update( ascontiguousarray(value).data )
+
+    elif isinstance(value, ndarray):
+        hasher.update( f"ndarray{value.shape}".encode() )
+        hash_value( value.tolist(), hasher )
+
+    elif isinstance(value, Path):
+        hash_file( value, hasher )
+
+    elif isinstance(value, (str, bytes, int, float, complex, bool, type(None), generic)):
+        hasher.update( f"{type(value).__name__}:{value!r}".encode() )
+
+    elif isinstance(value, (list, tuple)):
+        hasher.update( f"{type(value).__name__}{len(value)}".encode() )
+        for item in value:
+            hash_value( item, hasher )
+
+    elif isinstance(value, dict):
+        hasher.update( f"dict{len(value)}".encode() )
+        for key in sorted( value, key = repr ):
+            hash_value( key, hasher )
+            hash_value( value[key], hasher )
+
+    elif isinstance(value, (set, frozenset)):
+        # Items are hashed separately, as sets have no order
+        #
+        hasher.update( f"set{len(value)}".encode() )
+        for digest in sorted( get_digest(item) for item in value ):
+            hasher.update( digest.encode() )
+
+    elif hasattr(value, 'index') and hasattr(value, 'to_numpy'):
+        from pandas.util import hash_pandas_object
+
+        is_frame = hasattr(value, 'columns')
+        hasher.update( f"{type(value).__name__}{value.shape}".encode() )
+        hash_value( [str(d) for d in (value.dtypes if is_frame else [value.dtype])], hasher )
+        hash_value( [str(c) for c in (value.columns if is_frame else [value.name])], hasher )
+        hash_value( hash_pandas_object(value, index = True).to_numpy(), hasher )
+
+    else:
+        raise TypeError( f"cannot memoize on a {type(value).__name__}" )
+
+
+##########################################################################################
+def hash_file( file_path, hasher ):
+    """
+    Feeds the location, modification time and size of a file (or folder)
+    into a hasher, so that results are recomputed when the file changes.
+    """
+    file_path = Path( file_path ).resolve()
+    hasher.update( str(file_path).encode() )
+    if file_path.exists():
+        status = file_path.stat()
+        hasher.update( f":{status.st_mtime_ns}:{status.st_size}".encode() )
+
+
+##########################################################################################
+def get_digest( value ):
+    """
+    Returns the hex digest of a single value (see hash_value).
+    """
+    hasher = hashlib.blake2b( digest_size = 20 )
+    hash_value( value, hasher )
+
+    return hasher.hexdigest()
+
+
+##########################################################################################
+def copy_result( value ):
+    """
+    Returns a copy of a result that can be modified without changing the
+    cached one: containers and arrays are copied, immutable items (str,
+    numbers) are shared, anything else is deep-copied.
+    """
+    if isinstance(value, (str, bytes, int, float, complex, bool, type(None), generic)):
+        return value
+    if isinstance(value, ndarray):
+        return value.copy()
+    if isinstance(value, (list, tuple)):
+        items = [ item if isinstance(item, (str, int, float)) else copy_result(item)
+                  for item in value ]
+        return items if isinstance(value, list) else type(value)( items )
+    if isinstance(value, dict) and type(value) is dict:
+        return { key: copy_result(item) for key, item in value.items() }
+
+    return deepcopy( value )
+
+
+##########################################################################################
+def evict_memory():
+    """
+    Drops the least recently used results until the memory limits are met.
+    """
+    while _memory and ( len(_memory) > _settings['max_entries'] or
+                        _memory_bytes[0] > _settings['max_bytes'] ):
+        _, (_, n_bytes) = _memory.popitem( last = False )
+        _memory_bytes[0] -= n_bytes
+
+
+##########################################################################################
+def evict_disk():
+    """
+    Deletes the least recently written results until the disk store is
+    within its size limit.
+    """
+    files = [ (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+              for folder in os.scandir( _settings['directory'] ) if folder.is_dir()
+              for entry in os.scandir( folder.path ) if entry.name.endswith('.pkl') ]
+
+    total = sum( size for _, size, _ in files )
+    for _, size, file_path in sorted( files ):
+        if total <= _settings['max_disk_bytes']:
+            break
+        os.remove( file_path )
+        total -= size
+
+
+##########################################################################################
+def read_from_disk( name, key ):
+    """
+    Returns (True, result) if the result of name for key is in the disk
+    store, (False, None) otherwise.  Unreadable files are deleted.
+    """
+    file_path = _settings['directory'] / name / f"{key}.pkl"
+    try:
+        with open( file_path, 'rb' ) as f_read:
+            return True, pickle.load( f_read )
+    except FileNotFoundError:
+        return False, None
+    except Exception:
+        logger.warning( f"Deleting unreadable cache file {file_path}" )
+        file_path.unlink( missing_ok = True )
+        return False, None
+
+
+##########################################################################################
+def write_to_disk( name, key, result ):
+    """
+    Writes a result to the disk store (through a temporary file, so that
+    readers never see a partial file), then applies the size limit.
+    """
+    folder = _settings['directory'] / name
+    folder.mkdir( parents = True, exist_ok = True )
+
+    temporary_path = folder / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open( temporary_path, 'wb' ) as f_write:
+            pickle.dump( result, f_write, protocol = pickle.HIGHEST_PROTOCOL )
+        os.replace( temporary_path, folder / f"{key}.pkl" )
+    except (pickle.PicklingError, TypeError, AttributeError) as error:
+        logger.warning( f"Result of {name} not stored on disk: {error}" )
+        temporary_path.unlink( missing_ok = True )
+        return
+
+    evict_disk()
+
+
+##########################################################################################
+def memoized( function = None, name = None, disk = True, depends_on = None,
+              copy_results = True ):
+    """
+    Decorator that remembers the results of a deterministic function, keyed
+    by a hash of its arguments and of its source code, first in memory and
+    then on disk.  Calls with arguments that cannot be hashed (e.g. axes
+    objects) are passed through.  Used as @memoized or @memoized(disk = False).
+
+    inputs:
+        function -- function to memoize
+        name -- str under which results and statistics are kept, defaults
+                to library.function
+        disk -- bool, whether results are also stored on disk
+        depends_on -- function taking the same arguments and returning a
+                      list of files read by the function, whose modification
+                      time and size become part of the key
+        copy_results -- bool, whether results are returned as copies (see
+                        copy_result), so callers can modify them
+
+    returns:
+        memoized function
+    """
+    if function is None:
+        return lambda function: memoized( function, name, disk, depends_on, copy_results )
+
+    if name is None:
+        name = f"{function.__module__.rsplit('.', 1)[-1]}.{function.__name__}"
+
+    signature = inspect.signature( function )
+    try:
+        version = hashlib.blake2b( inspect.getsource(function).encode(),
+                                   digest_size = 8 ).hexdigest()
+    except (OSError, TypeError):
+        version = hashlib.blake2b( function.__code__.co_code, digest_size = 8 ).hexdigest()
+
+    @wraps(function)
+    def memoized_function( *args, **kwargs ):
+        if not _settings['enabled']:
+            return function( *args, **kwargs )
+
+        stats = _stats.setdefault( name, { 'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+                                           'not_hashable': 0 } )
+
+        # Key from the arguments as bound to parameter names, with defaults
+        #
+        bound = signature.bind( *args, **kwargs )
+        bound.apply_defaults()
+        hasher = hashlib.blake2b( digest_size = 20 )
+        hasher.update( f"{name}:{version}".encode() )
+        try:
+            for parameter, value in bound.arguments.items():
+                hasher.update( parameter.encode() )
+                hash_value( value, hasher )
+            if depends_on is not None:
+                for file_path in depends_on( *bound.args, **bound.kwargs ):
+                    hash_file( file_path, hasher )
+        except TypeError:
+            stats['not_hashable'] += 1
+            return function( *args, **kwargs )
+        key = hasher.hexdigest()
+
+        with _lock:
+            if key in _memory:
+                _memory.move_to_end( key )
+                stats['memory_hits'] += 1
+                result = _memory[key][0]
+                return copy_result( result ) if copy_results else result
+
+        found = False
+        if disk and _settings['disk']:
+            found, result = read_from_disk( name, key )
+
+        if found:
+            stats['disk_hits'] += 1
+        else:
+            stats['misses'] += 1
+            result = function( *args, **kwargs )
+            if disk and _settings['disk']:
+                write_to_disk( name, key, result )
+
+        n_bytes = size_in_bytes( result )
+        with _lock:
+            if n_bytes <= _settings['max_bytes']:
+                _memory[key] = ( result, n_bytes )
+                _memory_bytes[0] += n_bytes
+                evict_memory()
+
+        return copy_result( result ) if copy_results else result
+
+    return memoized_function
+
+
+##########################################################################################
+def get_cache_stats():
+    """
+    Returns a dict with name as key and a dict with memory_hits, disk_hits,
+    misses and not_hashable (calls passed through) as value, plus the
+    entry 'memory' with the number of results and bytes held in memory.
+    """
+    with _lock:
+        stats = { name: dict(values) for name, values in _stats.items() }
+        stats['memory'] = { 'entries': len(_memory), 'bytes': _memory_bytes[0] }
+
+    return stats
+
+
+##########################################################################################
+def clear_cache( disk = False ):
+    """
+    Empties the memory cache and the statistics, and the disk store too if
+    disk is True.
+    """
+    with _lock:
+        _memory.clear()
+        _memory_bytes[0] = 0
+        _stats.clear()
+
+    if disk and _settings['directory'].exists():
+        for folder in os.scandir( _settings['directory'] ):
+            if folder.is_dir():
+                for entry in os.scandir( folder.path ):
+                    if entry.name.endswith('.pkl'):
+                        os.remove( entry.path )
@@ -1,10 +1,21 @@
 from copy import copy
 from matplotlib import gridspec
-from numpy import array, arange
-from scipy.stats import pearsonr
+from numpy import ( array, arange, asarray, bincount, concatenate, cumsum, searchsorted,
+                    sqrt, unique )
+from scipy.stats import beta, t as student_t
 
 import matplotlib.pyplot as plt
 
+# Relative when imported from a module_libraries folder, absolute when
+# imported from the root of the repository
+#
+try:
+    from .cache_lib import memoized
+    from .profiling_lib import profiled
+except ImportError:
+    from cache_lib import memoized
+    from profiling_lib import profiled
+
 
 ##########################################################################################
 def half_frame(sub, xaxis_label, yaxis_label, font_size = 15, padding = -0.02):
@@ -80,6 +91,68 @@ def left_frame(axes, xaxis_label, yaxis_label, font_size = 15, padding = -0.02):
     axes.set_ylabel(yaxis_label, fontsize = 1.6 * font_size)
     
     
+##########################################################################################
+def frame_style( frame = 'half', font_size = 15 ):
+    """
+    Returns a dictionary of matplotlib rcParams reproducing the tick and 
+    spine formatting of half_frame, bottom_frame or left_frame, so that 
+    many figures can be styled once, with plt.style.use or 
+    matplotlib.rcParams.update, instead of with per-axis calls.
+
+    The offset of the spines (padding) is not an rcParam and still needs
+    to be set on each axis (see offset_spines).
+
+    inputs:
+        frame -- str, one of 'half', 'bottom' or 'left'
+        font_size -- int for tick labels, axis labels are 1.6 times larger
+
+    returns:
+        style -- dict with rcParams names as keys
+    """
+    if frame not in ['half', 'bottom', 'left']:
+        raise ValueError(f"Unknown frame '{frame}', use 'half', 'bottom' or 'left'")
+
+    width = 1.5 if frame == 'half' else 2
+    style = { 'axes.labelsize': 1.6 * font_size,
+              'axes.linewidth': width,
+              'axes.spines.top': False,
+              'axes.spines.right': False,
+              'axes.spines.bottom': frame != 'left',
+              'axes.spines.left': frame != 'bottom' }
+
+    for axis, visible in [('x', frame != 'left'), ('y', frame != 'bottom')]:
+        style.update({ f"{axis}tick.direction": 'out',
+                       f"{axis}tick.major.size": 7 if visible else 0,
+                       f"{axis}tick.major.width": width,
+                       f"{axis}tick.major.pad": 10,
+                       f"{axis}tick.minor.size": 5 if visible else 0,
+                       f"{axis}tick.minor.width": width,
+                       f"{axis}tick.labelsize": font_size })
+
+    style.update({ 'xtick.top': False, 
+                   'xtick.bottom': frame != 'left',
+                   'xtick.labelbottom': frame != 'left',
+                   'ytick.right': False,
+                   'ytick.left': frame != 'bottom',
+                   'ytick.labelleft': frame != 'bottom' })
+    if frame == 'left':
+        style['ytick.minor.size'] = 0
+
+    return style
+
+
+##########################################################################################
+def offset_spines( sub, padding = -0.02 ):
+    """
+    Moves the visible bottom and left spines of an axis away from the data
+    by padding (in axes coordinates), as half_frame, bottom_frame and 
+    left_frame do.
+    """
+    for axis in ['bottom', 'left']:
+        if sub.spines[axis].get_visible():
+            sub.spines[axis].set_position(("axes", padding))
+
+
 ##########################################################################################
 def star(pvalue, thresholds = [0.0001, 0.001, 0.01]):
     """
@@ -142,6 +215,8 @@ def to_tex_scientific(numb, sig_digits = 2):
 
 
 ##########################################################################################
+@profiled
+@memoized
 def get_product_sample_space(outcomes_list):
     """
     Uses recursion to generate a list of outcomes for a complex event
@@ -181,6 +256,7 @@ def get_product_sample_space(outcomes_list):
 
 
 ##########################################################################################
+@profiled
 def playing_with_dice( L, n, die1_throws, die2_throws, my_function, fig_xsize, 
                        my_fontsize ):
     """
@@ -190,9 +266,13 @@ def playing_with_dice( L, n, die1_throws, die2_throws, my_function, fig_xsize,
     # Calculate function with dice points
     points, y, y_max, y_min = my_function(die1_throws, die2_throws)
     
-    result = pearsonr(points, die1_throws)
-    print(f"Spearman's rho is {result[0]:.3f} with an estimated "
-          f"significance level of {result[1]:.6f}\n")
+    result = correlation_results( update_correlation(new_correlation(), die1_throws, points) )
+    print(f"Pearson's r is {result['r']:.3f} with an estimated "
+          f"significance level of {result['p_value']:.6f}")
+
+    result = spearman_correlation( die1_throws, points )
+    print(f"Spearman's rho is {result['rho']:.3f} with an estimated "
+          f"significance level of {result['p_value']:.6f}\n")
     
     # Calculate histogram
     #
@@ -240,4 +320,164 @@ def playing_with_dice( L, n, die1_throws, die2_throws, my_function, fig_xsize,
 
     plt.tight_layout()
     
-    return points
\ No newline at end of file
+    return points
+
+
+##########################################################################################
+def new_correlation():
+    """
+    Returns an empty accumulator for update_correlation: the number of pairs,
+    the means of x and y, and the sums of squared deviations from the means
+    (co-moments) of x, of y and of x times y.
+    """
+    return { 'n': 0, 'mean_x': 0., 'mean_y': 0., 'm2_x': 0., 'm2_y': 0., 'c_xy': 0. }
+
+
+##########################################################################################
+def merge_correlations( a, b ):
+    """
+    Combines two accumulators, e.g. from different chunks or worker
+    processes, with the pairwise update of the co-moments (Chan et al.), so
+    the result is the same as for all pairs at once.
+    """
+    n = a['n'] + b['n']
+    if n == 0:
+        return new_correlation()
+
+    delta_x = b['mean_x'] - a['mean_x']
+    delta_y = b['mean_y'] - a['mean_y']
+    weight = a['n'] * b['n'] / n
+
+    return { 'n': n,
+             'mean_x': a['mean_x'] + delta_x * b['n'] / n,
+             'mean_y': a['mean_y'] + delta_y * b['n'] / n,
+             'm2_x': a['m2_x'] + b['m2_x'] + delta_x * delta_x * weight,
+             'm2_y': a['m2_y'] + b['m2_y'] + delta_y * delta_y * weight,
+             'c_xy': a['c_xy'] + b['c_xy'] + delta_x * delta_y * weight }
+
+
+##########################################################################################
+def update_correlation( state, x, y ):
+    """
+    Adds a chunk of pairs (x, y) to an accumulator.  The co-moments of the
+    chunk are computed around its own means and then merged, so chunks of
+    any size can be streamed without loss of precision.
+
+    input:
+        state -- dict from new_correlation
+        x, y -- arrays of the same length
+
+    output:
+        state -- dict, a new accumulator
+    """
+    x = asarray( x, dtype = float )
+    y = asarray( y, dtype = float )
+    if len(x) == 0:
+        return state
+
+    dx = x - x.mean()
+    dy = y - y.mean()
+    chunk = { 'n': len(x), 'mean_x': x.mean(), 'mean_y': y.mean(),
+              'm2_x': dx @ dx, 'm2_y': dy @ dy, 'c_xy': dx @ dy }
+
+    return merge_correlations( state, chunk )
+
+
+##########################################################################################
+def correlation_results( state ):
+    """
+    Returns Pearson's r with its two-sided p-value, and the least-squares
+    line of y on x with the standard errors, as scipy.stats.pearsonr and
+    scipy.stats.linregress would for all the pairs in the accumulator.
+
+    input:
+        state -- dict from update_correlation or merge_correlations
+
+    output:
+        dict with keys n, r, p_value, slope, intercept, slope_stderr and
+        intercept_stderr
+    """
+    n = state['n']
+    r = state['c_xy'] / sqrt( state['m2_x'] * state['m2_y'] )
+    r = max( min(r, 1.), -1. )
+
+    # Exact distribution of r for uncorrelated normal variables
+    #
+    ab = n / 2 - 1
+    p_value = 2 * beta.sf( abs(r), ab, ab, loc = -1, scale = 2 )
+
+    slope = state['c_xy'] / state['m2_x']
+    slope_stderr = sqrt( (1 - r * r) * state['m2_y'] / state['m2_x'] / (n - 2) )
+    mean_x2 = state['m2_x'] / n + state['mean_x'] ** 2
+
+    return { 'n': n,
+             'r': r,
+             'p_value': p_value,
+             'slope': slope,
+             'intercept': state['mean_y'] - slope * state['mean_x'],
+             'slope_stderr': slope_stderr,
+             'intercept_stderr': slope_stderr * sqrt( mean_x2 ) }
+
+
+##########################################################################################
+def count_values( data, chunk_size = 10**7 ):
+    """
+    Returns the distinct values of an array (e.g. a numpy.memmap of a
+    simulation too large for memory) and how often each occurs, reading
+    chunk_size values at a time.  Memory grows with the number of distinct
+    values only.
+    """
+    values, counts = unique( asarray(data[:chunk_size]), return_counts = True )
+    for i in range(chunk_size, len(data), chunk_size):
+        chunk_values, chunk_counts = unique( asarray(data[i: i + chunk_size]), 
+                                             return_counts = True )
+        values, inverse = unique( concatenate([values, chunk_values]), return_inverse = True )
+        counts = bincount( inverse, weights = concatenate([counts, chunk_counts]) ).astype( int )
+
+    return values, counts
+
+
+##########################################################################################
+def average_ranks( values, counts ):
+    """
+    Returns the rank of each distinct value in the sorted data, averaged
+    over ties (ranks start at 1), as scipy.stats.rankdata does.
+    """
+    below = cumsum( counts ) - counts
+
+    return below + (counts + 1) / 2
+
+
+##########################################################################################
+@profiled( bytes_from = 'x' )
+def spearman_correlation( x, y, chunk_size = 10**7 ):
+    """
+    Calculates Spearman's rho (Pearson's r of the ranks, ties averaged) of
+    two arrays that may be memory-mapped and larger than memory.  A first
+    pass counts the distinct values of each array, a second pass looks up
+    the ranks of each chunk and streams them into a correlation accumulator.
+
+    input:
+        x, y -- arrays (or numpy.memmap) of the same length
+        chunk_size -- int number of pairs read at a time
+
+    output:
+        dict with keys n, rho and p_value (two-sided, from the t
+        distribution as in scipy.stats.spearmanr)
+    """
+    x_values, x_counts = count_values( x, chunk_size )
+    y_values, y_counts = count_values( y, chunk_size )
+    x_ranks = average_ranks( x_values, x_counts )
+    y_ranks = average_ranks( y_values, y_counts )
+
+    state = new_correlation()
+    for i in range(0, len(x), chunk_size):
+        state = update_correlation( state,
+                                    x_ranks[ searchsorted(x_values, x[i: i + chunk_size]) ],
+                                    y_ranks[ searchsorted(y_values, y[i: i + chunk_size]) ] )
+
+    n = state['n']
+    rho = correlation_results( state )['r']
+    t = rho * sqrt( (n - 2) / ((rho + 1.) * (1. - rho)) ) if abs(rho) < 1 else float('inf')
+
+    return { 'n': n, 'rho': rho, 'p_value': 2 * student_t.sf( abs(t), n - 2 ) }
@@ -0,0 +1,252 @@
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from time import perf_counter, process_time
+
+
+# All library loggers are children of this one, which prints plain messages
+# to stdout.  Only warnings (e.g. failed requests) are shown by default,
+# progress messages (info, debug) once set_log_level is called.
+#
+LOGGER_NAME = 'module_libraries'
+LOG_OFF = logging.CRITICAL + 10
+
+_logger = logging.getLogger( LOGGER_NAME )
+if not _logger.handlers:
+    _handler = logging.StreamHandler( sys.stdout )
+    _handler.setFormatter( logging.Formatter('%(message)s') )
+    _logger.addHandler( _handler )
+    _logger.setLevel( logging.WARNING )
+    _logger.propagate = False
+
+# Metrics of every instrumented function or block, by name, and trace events
+# when tracing is on
+#
+_registry = {}
+_settings = { 'enabled': True, 'tracing': False, 'origin': perf_counter() }
+_trace_events = []
+_lock = threading.Lock()
+_running = threading.local()     # names of the instrumented functions running in a thread
+
+
+##########################################################################################
+def get_logger( name ):
+    """
+    Returns the logger of a library, e.g. get_logger(__name__).  Info and
+    debug messages are shown only after set_log_level is called.
+    """
+    return logging.getLogger( f"{LOGGER_NAME}.{name.rsplit('.', 1)[-1]}" )
+
+
+##########################################################################################
+def set_log_level( level = 'INFO' ):
+    """
+    Sets the level of the messages printed by the libraries: 'DEBUG' (all
+    messages), 'INFO', 'WARNING' (the default), or 'OFF'.
+    """
+    if isinstance(level, str):
+        level = LOG_OFF if level.upper() == 'OFF' else logging.getLevelName( level.upper() )
+
+    _logger.setLevel( level )
+
+
+##########################################################################################
+def set_profiling( enabled = True, tracing = None ):
+    """
+    Turns the recording of metrics on or off, and optionally the recording
+    of trace events (needed for export_chrome_trace).  When profiling is off,
+    instrumented functions are called directly.
+    """
+    _settings['enabled'] = enabled
+    if tracing is not None:
+        _settings['tracing'] = tracing
+
+
+##########################################################################################
+def size_in_bytes( value ):
+    """
+    Estimates the number of bytes in a value handled by a library function:
+    arrays and DataFrames by their buffers, str and bytes by their length,
+    Paths by the size of the file, lists and tuples by their items.
+    """
+    if value is None:
+        return 0
+    if hasattr(value, 'nbytes'):
+        return int( value.nbytes )
+    if hasattr(value, 'memory_usage'):
+        return int( value.memory_usage(deep = False).sum() )
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, Path):
+        return value.stat().st_size if value.is_file() else 0
+    if isinstance(value, (list, tuple)) and len(value):
+        # Extrapolated from the first 1000 items
+        #
+        sample = value[:1000]
+        return sum( size_in_bytes(item) for item in sample ) * len(value) // len(sample)
+
+    return 0
+
+
+##########################################################################################
+def record_call( name, wall_time, cpu_time, n_bytes, start ):
+    """
+    Adds one call to the metrics of name, and a trace event if tracing is on.
+    """
+    with _lock:
+        metrics = _registry.setdefault( name, { 'calls': 0, 'wall_time': 0., 'cpu_time': 0.,
+                                                'bytes': 0, 'max_wall_time': 0. } )
+        metrics['calls'] += 1
+        metrics['wall_time'] += wall_time
+        metrics['cpu_time'] += cpu_time
+        metrics['bytes'] += n_bytes
+        metrics['max_wall_time'] = max( metrics['max_wall_time'], wall_time )
+
+        if _settings['tracing']:
+            _trace_events.append( { 'name': name, 'ph': 'X',
+                                    'ts': 1e6 * (start - _settings['origin']),
+                                    'dur': 1e6 * wall_time,
+                                    'pid': os.getpid(), 'tid': threading.get_ident(),
+                                    'args': { 'bytes': n_bytes, 'cpu_time': cpu_time } } )
+
+
+##########################################################################################
+def profiled( function = None, name = None, bytes_from = None ):
+    """
+    Decorator that records the number of calls, wall and CPU time, and bytes
+    processed by a function.  Used as @profiled or @profiled(bytes_from = 'plate').
+    Calls made while the function is already running (recursion) are not
+    recorded, as their time is part of the outermost call.
+
+    inputs:
+        function -- function to instrument
+        name -- str under which metrics are recorded, defaults to
+                library.function
+        bytes_from -- where bytes are counted (see size_in_bytes): 'result',
+                      name of an argument, or None
+
+    returns:
+        instrumented function
+    """
+    if function is None:
+        return lambda function: profiled( function, name, bytes_from )
+
+    if name is None:
+        name = f"{function.__module__.rsplit('.', 1)[-1]}.{function.__name__}"
+
+    parameters = list( inspect.signature(function).parameters )
+    position = parameters.index(bytes_from) if bytes_from in parameters else None
+
+    @wraps(function)
+    def instrumented( *args, **kwargs ):
+        running = _running.__dict__.setdefault( 'names', set() )
+        if not _settings['enabled'] or name in running:
+            return function( *args, **kwargs )
+
+        running.add( name )
+        start = perf_counter()
+        cpu_start = process_time()
+        try:
+            result = function( *args, **kwargs )
+        finally:
+            running.discard( name )
+        wall_time = perf_counter() - start
+        cpu_time = process_time() - cpu_start
+
+        if bytes_from == 'result':
+            n_bytes = size_in_bytes( result )
+        elif position is not None and position < len(args):
+            n_bytes = size_in_bytes( args[position] )
+        elif bytes_from is not None:
+            n_bytes = size_in_bytes( kwargs.get(bytes_from) )
+        else:
+            n_bytes = 0
+
+        record_call( name, wall_time, cpu_time, n_bytes, start )
+
+        return result
+
+    return instrumented
+
+
+##########################################################################################
+@contextmanager
+def profile_block( name ):
+    """
+    Context manager that records a block of code under name.  It yields a
+    dict whose 'bytes' entry can be increased inside the block:
+
+        with profile_block('parse') as block:
+            block['bytes'] += len(text)
+    """
+    block = { 'bytes': 0 }
+    if not _settings['enabled']:
+        yield block
+        return
+
+    start = perf_counter()
+    cpu_start = process_time()
+    try:
+        yield block
+    finally:
+        record_call( name, perf_counter() - start, process_time() - cpu_start,
+                     block['bytes'], start )
+
+
+##########################################################################################
+def get_metrics():
+    """
+    Returns a dict with name as key and a dict with calls, wall_time,
+    cpu_time, max_wall_time, bytes, mean_wall_time and bytes_per_second
+    as value, sorted by decreasing total wall time.  Calls made inside the
+    worker processes of a Pool are recorded in those processes, not here.
+    """
+    with _lock:
+        metrics = { name: dict(values) for name, values in _registry.items() }
+
+    for values in metrics.values():
+        values['mean_wall_time'] = values['wall_time'] / values['calls']
+        values['bytes_per_second'] = values['bytes'] / max( values['wall_time'], 1e-12 )
+
+    return dict( sorted( metrics.items(), key = lambda item: -item[1]['wall_time'] ) )
+
+
+##########################################################################################
+def reset_metrics():
+    """
+    Empties the metrics registry and the trace events.
+    """
+    with _lock:
+        _registry.clear()
+        _trace_events.clear()
+        _settings['origin'] = perf_counter()
+
+
+##########################################################################################
+def export_metrics( file_path ):
+    """
+    Writes the metrics returned by get_metrics to a JSON file.
+    """
+    with open( file_path, 'w' ) as f_write:
+        json.dump( get_metrics(), f_write, indent = 2 )
+
+
+##########################################################################################
+def export_chrome_trace( file_path ):
+    """
+    Writes the trace events recorded while tracing was on (see
+    set_profiling) in the Chrome trace event format, which can be opened
+    in chrome://tracing or Perfetto.
+    """
+    with _lock:
+        events = list( _trace_events )
+
+    with open( file_path, 'w' ) as f_write:
+        json.dump( { 'traceEvents': events, 'displayTimeUnit': 'ms' }, f_write )